@@ -16,3 +16,163 @@ FIREBASE_CLIENT_EMAIL = os.getenv("FIREBASE_CLIENT_EMAIL")
 # Application Settings
 DEBUG = os.getenv("DEBUG", "True") == "True"
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+
+# Reconocimiento facial - Búsqueda 1:N
+# Desde cuántos encodings se usa el índice aproximado IVF (0 = siempre exacto)
+FACE_ANN_MIN_SIZE = int(os.getenv("FACE_ANN_MIN_SIZE", "100000"))
+# Celdas del índice IVF (0 = automático, ~sqrt(N))
+FACE_ANN_N_LISTS = int(os.getenv("FACE_ANN_N_LISTS", "0"))
+# Celdas revisadas por consulta: más = mayor recall y mayor latencia
+FACE_ANN_N_PROBE = int(os.getenv("FACE_ANN_N_PROBE", "16"))
+# Cada cuántos segundos se actualiza el índice con las capturas de otros workers o nodos (0 = solo al iniciar)
+FACIAL_GALLERY_REFRESH_SECONDS = float(os.getenv("FACIAL_GALLERY_REFRESH_SECONDS", "60"))
+
+# Reconocimiento facial - Detección (MediaPipe)
+# 0 = modelo de corto alcance (< 2 m), 1 = modelo de largo alcance
+FACE_DETECTION_MODEL_SELECTION = int(os.getenv("FACE_DETECTION_MODEL_SELECTION", "0"))
+FACE_DETECTION_MIN_CONFIDENCE = float(os.getenv("FACE_DETECTION_MIN_CONFIDENCE", "0.5"))
+
+# Reconocimiento facial - Ejecución de inferencia fuera del event loop
+# Hilos de inferencia (dlib, OpenCV, MediaPipe y torch liberan el GIL)
+FACIAL_INFERENCE_WORKERS = int(os.getenv("FACIAL_INFERENCE_WORKERS", str(os.cpu_count() or 2)))
+# Peticiones que pueden esperar turno antes de responder 503
+FACIAL_INFERENCE_QUEUE_DEPTH = int(os.getenv("FACIAL_INFERENCE_QUEUE_DEPTH", "32"))
+# Hilos para las etapas paralelas del login (Firestore, liveness y encoding por petición)
+FACIAL_LOGIN_STAGE_WORKERS = int(os.getenv("FACIAL_LOGIN_STAGE_WORKERS", str(3 * FACIAL_INFERENCE_WORKERS)))
+
+# Reconocimiento facial - Micro-batching de YOLO (liveness)
+FACIAL_LIVENESS_BATCHING = os.getenv("FACIAL_LIVENESS_BATCHING", "True") == "True"
+# Máximo de frames por llamada a YOLO
+FACIAL_LIVENESS_MAX_BATCH = int(os.getenv("FACIAL_LIVENESS_MAX_BATCH", "8"))
+# Tiempo máximo que un frame espera a que se llene el lote
+FACIAL_LIVENESS_MAX_WAIT_MS = float(os.getenv("FACIAL_LIVENESS_MAX_WAIT_MS", "10"))
+# Backend de YOLO: "torch" (ultralytics) u "onnx" (onnxruntime en CPU, sin torch)
+FACIAL_LIVENESS_BACKEND = os.getenv("FACIAL_LIVENESS_BACKEND", "torch")
+# Modelo ONNX generado con scripts/export_yolo_onnx.py (FP32 o INT8)
+FACIAL_YOLO_ONNX_PATH = os.getenv("FACIAL_YOLO_ONNX_PATH", "yolov8n.int8.onnx")
+
+# Reconocimiento facial - Preprocesamiento
+# Lado máximo (px) de la resolución de trabajo; los frames más grandes se reducen una vez (0 = sin reducir)
+FACIAL_WORKING_MAX_SIDE = int(os.getenv("FACIAL_WORKING_MAX_SIDE", "640"))
+# Margen alrededor de la caja del rostro al recortar la región para el encoding (fracción del tamaño de la caja)
+FACIAL_FACE_ROI_MARGIN = float(os.getenv("FACIAL_FACE_ROI_MARGIN", "0.5"))
+
+# Reconocimiento facial - Comparación 1:1
+# "first_match": se detiene en la primera coincidencia (templates ordenados por éxito previo)
+# "full_scan": compara contra todos los templates (auditoría)
+FACIAL_COMPARE_MODE = os.getenv("FACIAL_COMPARE_MODE", "first_match")
+
+# Reconocimiento facial - Backend de encoding
+# "dlib" (ResNet de face_recognition, 128-d) u "onnx" (modelo tipo MobileFaceNet en onnxruntime)
+FACIAL_EMBEDDING_BACKEND = os.getenv("FACIAL_EMBEDDING_BACKEND", "dlib")
+FACIAL_EMBEDDING_ONNX_PATH = os.getenv("FACIAL_EMBEDDING_ONNX_PATH", "mobilefacenet.onnx")
+# Dimensión del embedding del modelo ONNX (se valida contra el modelo al cargarlo)
+FACIAL_EMBEDDING_ONNX_DIMENSION = int(os.getenv("FACIAL_EMBEDDING_ONNX_DIMENSION", "128"))
+# Distancia coseno máxima para aceptar una coincidencia con el modelo ONNX
+FACIAL_EMBEDDING_ONNX_THRESHOLD = float(os.getenv("FACIAL_EMBEDDING_ONNX_THRESHOLD", "0.6"))
+
+# Reconocimiento facial - Retención de imágenes al registrar un rostro
+# Siempre se guarda el chip del rostro alineado (150x150). Además, opcionalmente:
+# lado máximo (px) de una copia reducida de la escena completa (0 = no guardar)
+FACIAL_CONTEXT_MAX_SIDE = int(os.getenv("FACIAL_CONTEXT_MAX_SIDE", "0"))
+# Guardar la imagen original tal como llegó (solo si la política de retención lo exige)
+FACIAL_RETAIN_ORIGINAL = os.getenv("FACIAL_RETAIN_ORIGINAL", "False") == "True"
+
+# Reconocimiento facial - Detección de reenvíos (hash perceptual) en el login
+FACIAL_REPLAY_CACHE = os.getenv("FACIAL_REPLAY_CACHE", "True") == "True"
+# "dhash" (más barato) o "phash" (más robusto a recompresión)
+FACIAL_REPLAY_HASH = os.getenv("FACIAL_REPLAY_HASH", "dhash")
+# Bits distintos (de 64) del hash de la región del rostro para considerarlo el
+# mismo que un login reciente (0 = hash idéntico; frames reales de la misma
+# persona suelen quedar a 0-3 bits, así que subirlo rechaza logins legítimos)
+FACIAL_REPLAY_MAX_DISTANCE = int(os.getenv("FACIAL_REPLAY_MAX_DISTANCE", "0"))
+FACIAL_REPLAY_TTL_SECONDS = float(os.getenv("FACIAL_REPLAY_TTL_SECONDS", "300"))
+# Segundos que se responde el mismo rechazo a un reenvío de bytes idénticos
+FACIAL_REPLAY_FAILED_TTL_SECONDS = float(os.getenv("FACIAL_REPLAY_FAILED_TTL_SECONDS", "5"))
+# Segundos tras un login en que se rechaza el mismo hash de la región del rostro
+# (0 = desactivado: solo se rechazan bytes idénticos). Una nueva captura real
+# suele dar el mismo hash, así que si se activa debe ser de pocos segundos
+FACIAL_REPLAY_FACE_TTL_SECONDS = float(os.getenv("FACIAL_REPLAY_FACE_TTL_SECONDS", "0"))
+FACIAL_REPLAY_MAX_USERS = int(os.getenv("FACIAL_REPLAY_MAX_USERS", "10000"))
+FACIAL_REPLAY_FRAMES_PER_USER = int(os.getenv("FACIAL_REPLAY_FRAMES_PER_USER", "8"))
+
+# Reconocimiento facial - Historial de coincidencias por template (match_stats.json)
+# Las coincidencias se acumulan en memoria y se persisten cada N segundos
+FACIAL_MATCH_STATS_FLUSH_SECONDS = float(os.getenv("FACIAL_MATCH_STATS_FLUSH_SECONDS", "30"))
+FACIAL_MATCH_STATS_MAX_USERS = int(os.getenv("FACIAL_MATCH_STATS_MAX_USERS", "10000"))
+
+# Reconocimiento facial - Caché en memoria de los templates de cada usuario
+FACIAL_TEMPLATE_CACHE = os.getenv("FACIAL_TEMPLATE_CACHE", "True") == "True"
+FACIAL_TEMPLATE_CACHE_MB = float(os.getenv("FACIAL_TEMPLATE_CACHE_MB", "32"))
+# Segundos que un usuario queda en caché (cambios hechos por otro proceso)
+FACIAL_TEMPLATE_CACHE_TTL_SECONDS = float(os.getenv("FACIAL_TEMPLATE_CACHE_TTL_SECONDS", "600"))
+
+# Reconocimiento facial - Filtro de calidad antes de los modelos
+FACIAL_QUALITY_GATE = os.getenv("FACIAL_QUALITY_GATE", "True") == "True"
+# Lado menor mínimo del frame (px)
+FACIAL_QUALITY_MIN_IMAGE_SIDE = int(os.getenv("FACIAL_QUALITY_MIN_IMAGE_SIDE", "160"))
+# Brillo medio en escala de grises (0-255)
+FACIAL_QUALITY_MIN_BRIGHTNESS = float(os.getenv("FACIAL_QUALITY_MIN_BRIGHTNESS", "40"))
+FACIAL_QUALITY_MAX_BRIGHTNESS = float(os.getenv("FACIAL_QUALITY_MAX_BRIGHTNESS", "220"))
+# Fracción máxima de píxeles saturados (>= 250)
+FACIAL_QUALITY_MAX_SATURATED_RATIO = float(os.getenv("FACIAL_QUALITY_MAX_SATURATED_RATIO", "0.25"))
+# Desviación estándar mínima del gris (contraste)
+FACIAL_QUALITY_MIN_CONTRAST = float(os.getenv("FACIAL_QUALITY_MIN_CONTRAST", "20"))
+# Varianza mínima del Laplaciano sobre el rostro (nitidez)
+FACIAL_QUALITY_MIN_SHARPNESS = float(os.getenv("FACIAL_QUALITY_MIN_SHARPNESS", "50"))
+# Tamaño mínimo del rostro respecto al frame (fracción del ancho o alto)
+FACIAL_QUALITY_MIN_FACE_RATIO = float(os.getenv("FACIAL_QUALITY_MIN_FACE_RATIO", "0.1"))
+
+# Reconocimiento facial - Subida de imágenes (JSON base64, multipart o image/jpeg)
+FACIAL_MAX_UPLOAD_BYTES = int(os.getenv("FACIAL_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Reconocimiento facial - Verificación por WebSocket (flujo de frames)
+# Frames procesados como máximo por conexión
+FACIAL_STREAM_MAX_FRAMES = int(os.getenv("FACIAL_STREAM_MAX_FRAMES", "30"))
+# Duración máxima de la conexión
+FACIAL_STREAM_TIMEOUT_SECONDS = float(os.getenv("FACIAL_STREAM_TIMEOUT_SECONDS", "20"))
+
+# Reconocimiento facial - Verificación con un clip de video corto (1-3 s)
+FACIAL_CLIP_MAX_UPLOAD_BYTES = int(os.getenv("FACIAL_CLIP_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Keyframes (los más nítidos de cada tramo del clip) que pasan por el pipeline
+FACIAL_CLIP_KEYFRAMES = int(os.getenv("FACIAL_CLIP_KEYFRAMES", "3"))
+# Duración aceptada: se rechazan clips más cortos y se ignora lo que pase del máximo
+FACIAL_CLIP_MIN_SECONDS = float(os.getenv("FACIAL_CLIP_MIN_SECONDS", "1.0"))
+FACIAL_CLIP_MAX_SECONDS = float(os.getenv("FACIAL_CLIP_MAX_SECONDS", "3.0"))
+# Frames decodificados a color para medir nitidez (el resto solo se avanza)
+FACIAL_CLIP_MAX_ANALYZED_FRAMES = int(os.getenv("FACIAL_CLIP_MAX_ANALYZED_FRAMES", "30"))
+# Fracción de keyframes que deben coincidir con el usuario
+FACIAL_CLIP_MIN_MATCH_RATIO = float(os.getenv("FACIAL_CLIP_MIN_MATCH_RATIO", "0.6"))
+# Liveness temporal: exigir cambio del rostro entre keyframes (foto o video congelado)
+FACIAL_CLIP_REQUIRE_MOTION = os.getenv("FACIAL_CLIP_REQUIRE_MOTION", "True") == "True"
+# Cambio mínimo del rostro entre keyframes después de alinearlos (diferencia media
+# en desviaciones); una foto sostenida frente a la cámara queda por debajo de
+# 0.035 con ruido y compresión normales (calibrar con benchmarks/bench_clip_motion.py)
+FACIAL_CLIP_MIN_MOTION = float(os.getenv("FACIAL_CLIP_MIN_MOTION", "0.05"))
+
+# Reconocimiento facial - Manifiesto de capturas por usuario (manifest.json)
+# Usuarios con el manifiesto en memoria (LRU)
+FACIAL_MANIFEST_CACHE_USERS = int(os.getenv("FACIAL_MANIFEST_CACHE_USERS", "10000"))
+
+# Reconocimiento facial - Layout de facial_data
+# Usuarios nuevos en facial_data/ab/cd/<user_id>/ (hash del user_id)
+FACIAL_DATA_SHARDED = os.getenv("FACIAL_DATA_SHARDED", "True") == "True"
+# Buscar también en facial_data/<user_id>/ hasta terminar scripts/migrate_facial_layout.py
+FACIAL_DATA_LEGACY_READS = os.getenv("FACIAL_DATA_LEGACY_READS", "True") == "True"
+
+# Reconocimiento facial - Almacenamiento de facial_data
+# local (disco o volumen compartido), gcs (bucket de Google Cloud Storage) o memory
+FACIAL_STORAGE_BACKEND = os.getenv("FACIAL_STORAGE_BACKEND", "local")
+FACIAL_GCS_BUCKET = os.getenv("FACIAL_GCS_BUCKET", "")
+FACIAL_GCS_PREFIX = os.getenv("FACIAL_GCS_PREFIX", "facial_data")
+# Caché LRU en memoria de imágenes y encodings leídos (0 = sin caché)
+FACIAL_STORAGE_CACHE_MB = float(os.getenv("FACIAL_STORAGE_CACHE_MB", "64"))
+
+# Reconocimiento facial - Escritura diferida de capturas (write-behind)
+FACIAL_WRITE_BEHIND = os.getenv("FACIAL_WRITE_BEHIND", "True") == "True"
+# Capturas en cola como máximo; con la cola llena se espera y luego se responde 503
+FACIAL_WRITE_QUEUE_MAX = int(os.getenv("FACIAL_WRITE_QUEUE_MAX", "128"))
+FACIAL_WRITE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("FACIAL_WRITE_QUEUE_TIMEOUT_SECONDS", "2"))
+# Capturas por lote de fsync y espera máxima para completar un lote
+FACIAL_WRITE_BATCH_MAX = int(os.getenv("FACIAL_WRITE_BATCH_MAX", "32"))
+FACIAL_WRITE_BATCH_WAIT_MS = float(os.getenv("FACIAL_WRITE_BATCH_WAIT_MS", "10"))
@@ -12,3 +12,16 @@ MSG_USER_ALREADY_EXISTS = "El usuario ya existe"
 MSG_TOKEN_EXPIRED = "Token expirado"
 MSG_INVALID_TOKEN = "Token inválido"
 MSG_UNAUTHORIZED = "No autorizado"
+
+# Reconocimiento facial
+# Versión del modelo con el que se generan los encodings persistidos.
+# Si cambia, los encodings guardados se consideran obsoletos y se recalculan.
+FACE_ENCODING_MODEL_VERSION = "dlib_resnet_v1"
+FACE_ENCODING_SUFFIX = ".npz"
+# Distancia máxima para considerar que un rostro ya pertenece a otro usuario
+FACE_UNIQUENESS_DISTANCE_THRESHOLD = 0.6
+# Imágenes registradas: chip del rostro alineado del tamaño de entrada de la
+# ResNet de dlib, con el mismo margen que usa dlib al alinear
+FACE_CHIP_SIZE = 150
+FACE_CHIP_PADDING = 0.25
+FACE_CHIP_JPEG_QUALITY = 95
@@ -0,0 +1,9 @@
+from fastapi import HTTPException
+
+
+class UserStateError(HTTPException):
+    """
+    Rechazo por el estado del usuario (no existe, facial recognition
+    deshabilitado, sin rostro registrado), no por la imagen: enviar otro
+    frame no cambia el resultado
+    """
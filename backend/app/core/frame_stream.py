@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import binascii
+import json
+import time
+from typing import Awaitable, Callable, Optional
+from fastapi import HTTPException, WebSocket
+from starlette.websockets import WebSocketState
+from app.config import FACIAL_MAX_UPLOAD_BYTES
+from app.core.errors import UserStateError
+
+
+def _frame_bytes(message: dict) -> Optional[bytes]:
+    """Bytes de la imagen de un mensaje: binario, o texto con base64 / {"image_base64": ...}"""
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    text = message.get("text")
+    if not text:
+        return None
+    try:
+        if text.lstrip().startswith("{"):
+            text = json.loads(text).get("image_base64") or ""
+        return base64.b64decode(text) or None
+    except (ValueError, binascii.Error, AttributeError):
+        return None
+
+
+class FrameStream:
+    """
+    Verificación sobre un flujo de frames recibidos por WebSocket
+
+    Un receptor lee todos los mensajes y guarda solo el último frame; el
+    procesamiento toma el más reciente cuando termina el anterior. Los
+    frames que llegan mientras el servidor está ocupado se descartan (se
+    reemplazan), así la cola nunca crece. El flujo termina con el primer
+    frame aceptado, con un UserStateError, al alcanzar `max_frames`
+    procesados o el tiempo límite.
+    """
+
+    def __init__(self, websocket: WebSocket, max_frames: int, timeout_seconds: float):
+        self.websocket = websocket
+        self.max_frames = max_frames
+        self.timeout_seconds = timeout_seconds
+        self._latest: Optional[bytes] = None
+        self._frame_ready = asyncio.Event()
+        self._disconnected = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = _frame_bytes(message)
+                if data is None or len(data) > FACIAL_MAX_UPLOAD_BYTES:
+                    self.dropped += 1
+                    continue
+                self.received += 1
+                if self._latest is not None:
+                    # El frame anterior no alcanzó a procesarse: se descarta
+                    self.dropped += 1
+                self._latest = data
+                self._frame_ready.set()
+        except Exception:
+            pass
+        finally:
+            self._disconnected = True
+            self._frame_ready.set()
+
+    async def _send(self, payload: dict) -> None:
+        if self.websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.send_json(payload)
+            except Exception:
+                self._disconnected = True
+
+    def _summary(self, started: float) -> dict:
+        return {
+            "frames_received": self.received,
+            "frames_processed": self.processed,
+            "frames_dropped": self.dropped,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    async def run(self, process_frame: Callable[[bytes], Awaitable[dict]]) -> dict:
+        """
+        Procesa frames hasta que uno sea aceptado
+
+        Args:
+            process_frame: Corrutina que verifica un frame; devuelve el
+                resultado si se acepta o lanza HTTPException con el motivo
+
+        Returns:
+            Resultado final (también enviado al cliente como {"type": "result"})
+        """
+        started = time.perf_counter()
+        deadline = started + self.timeout_seconds
+        receiver = asyncio.create_task(self._receive())
+        result = None
+        try:
+            while result is None:
+                if self.processed >= self.max_frames:
+                    result = {"verified": False, "message": "❌ No se pudo verificar el rostro con los frames enviados."}
+                    break
+
+                remaining = deadline - time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._frame_ready.wait(), timeout=max(0.0, remaining))
+                except asyncio.TimeoutError:
+                    result = {"verified": False, "message": "❌ Tiempo de verificación agotado."}
+                    break
+                self._frame_ready.clear()
+
+                data, self._latest = self._latest, None
+                if data is None:
+                    if self._disconnected:
+                        result = {"verified": False, "message": "Conexión cerrada por el cliente"}
+                    continue
+
+                self.processed += 1
+                try:
+                    accepted = await process_frame(data)
+                except HTTPException as e:
+                    await self._send({
+                        "type": "frame",
+                        "frame": self.processed,
+                        "verified": False,
+                        "status_code": e.status_code,
+                        "detail": e.detail
+                    })
+                    if isinstance(e, UserStateError):
+                        result = {"verified": False, "status_code": e.status_code, "message": e.detail}
+                    continue
+
+                result = {**accepted, "verified": True}
+        finally:
+            receiver.cancel()
+
+        result = {**result, **self._summary(started)}
+        await self._send({"type": "result", **result})
+        if self.websocket.client_state == WebSocketState.CONNECTED:
+            await self.websocket.close()
+        return result
@@ -0,0 +1,212 @@
+import base64
+import binascii
+from contextlib import aclosing
+from typing import AsyncIterator
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from starlette.formparsers import MultiPartException, MultiPartParser
+from app.config import FACIAL_MAX_UPLOAD_BYTES, FACIAL_CLIP_MAX_UPLOAD_BYTES
+from app.schemas.facial_schema import FacialCaptureSchema
+
+
+# Tipos de contenido binario aceptados como cuerpo de la petición
+RAW_IMAGE_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp", "application/octet-stream")
+# Campos del formulario multipart que pueden traer la imagen
+MULTIPART_IMAGE_FIELDS = ("image", "file")
+# Clips de video cortos (verificación con varios frames)
+RAW_VIDEO_CONTENT_TYPES = ("video/webm", "video/mp4", "video/quicktime", "application/octet-stream")
+MULTIPART_VIDEO_FIELDS = ("video", "file")
+# Margen del cuerpo multipart sobre el archivo (delimitadores, cabeceras, otros campos)
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# Documentación OpenAPI del cuerpo (la lectura la hace read_image_upload)
+IMAGE_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": FacialCaptureSchema.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"image": {"type": "string", "format": "binary"}},
+                    "required": ["image"]
+                }
+            },
+            "image/jpeg": {"schema": {"type": "string", "format": "binary"}},
+            "image/png": {"schema": {"type": "string", "format": "binary"}},
+        }
+    }
+}
+
+
+# Documentación OpenAPI del cuerpo de los endpoints de clip (read_video_upload)
+VIDEO_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"video": {"type": "string", "format": "binary"}},
+                    "required": ["video"]
+                }
+            },
+            "video/webm": {"schema": {"type": "string", "format": "binary"}},
+            "video/mp4": {"schema": {"type": "string", "format": "binary"}},
+        }
+    }
+}
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Archivo demasiado grande (máximo {max_bytes} bytes)"
+    )
+
+
+def _check_content_length(request: Request, max_bytes: int) -> None:
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise _too_large(max_bytes)
+
+
+def _content_type(request: Request) -> str:
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+async def _limited_stream(request: Request, max_bytes: int, limit: int) -> AsyncIterator[bytes]:
+    """
+    Partes del cuerpo de la petición, cortando en cuanto superan `limit`
+
+    Content-Length no alcanza: un envío chunked no lo trae, así que se
+    cuentan los bytes a medida que llegan.
+    """
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise _too_large(max_bytes)
+        yield chunk
+
+
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """Cuerpo de la petición con límite de tamaño"""
+    chunks = []
+    async with aclosing(_limited_stream(request, max_bytes, max_bytes)) as stream:
+        async for chunk in stream:
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _read_multipart(request: Request, fields: tuple, max_bytes: int) -> bytes:
+    """
+    Contenido del primer archivo presente en `fields`
+
+    request.form() solo limita los campos que no son archivos: los
+    archivos se vuelcan a disco sin límite. Por eso el parser recibe el
+    cuerpo ya limitado y se corta durante la recepción.
+    """
+    stream = _limited_stream(request, max_bytes, max_bytes + MULTIPART_OVERHEAD_BYTES)
+    try:
+        async with aclosing(stream):
+            form = await MultiPartParser(request.headers, stream, max_part_size=max_bytes).parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+
+    try:
+        upload = next((form[field] for field in fields if field in form), None)
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Falta el archivo en el campo '{fields[0]}'"
+            )
+        return await upload.read()
+    finally:
+        await form.close()
+
+
+def _check_size(data: bytes, max_bytes: int) -> bytes:
+    if len(data) > max_bytes:
+        raise _too_large(max_bytes)
+    if not data:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="El archivo está vacío"
+        )
+    return data
+
+
+async def read_image_upload(request: Request) -> bytes:
+    """
+    Dependencia que obtiene los bytes de la imagen según el Content-Type
+
+    - image/jpeg, image/png, ...: el cuerpo son los bytes de la imagen,
+      que llegan a cv2.imdecode sin copias intermedias
+    - multipart/form-data: archivo en el campo "image" (o "file")
+    - application/json: {"image_base64": "..."} (compatibilidad)
+
+    Returns:
+        Bytes de la imagen codificada
+
+    Raises:
+        HTTPException: 413 si excede el tamaño máximo, 415 si el tipo no se
+            admite, 422 si falta la imagen o el base64 es inválido
+    """
+    _check_content_length(request, FACIAL_MAX_UPLOAD_BYTES)
+    content_type = _content_type(request)
+
+    if content_type in RAW_IMAGE_CONTENT_TYPES:
+        image_bytes = await _read_body(request, FACIAL_MAX_UPLOAD_BYTES)
+
+    elif content_type == "multipart/form-data":
+        image_bytes = await _read_multipart(request, MULTIPART_IMAGE_FIELDS, FACIAL_MAX_UPLOAD_BYTES)
+
+    elif content_type in ("application/json", ""):
+        try:
+            json_body = await _read_body(request, FACIAL_MAX_UPLOAD_BYTES)
+            facial_data = FacialCaptureSchema.model_validate_json(json_body)
+        except ValidationError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors())
+        try:
+            image_bytes = base64.b64decode(facial_data.image_base64)
+        except (binascii.Error, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="image_base64 no es base64 válido"
+            )
+
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type no soportado: {content_type}. Use application/json, multipart/form-data o image/jpeg"
+        )
+
+    return _check_size(image_bytes, FACIAL_MAX_UPLOAD_BYTES)
+
+
+async def read_video_upload(request: Request) -> bytes:
+    """
+    Dependencia que obtiene los bytes de un clip de video corto
+
+    - video/webm, video/mp4, video/quicktime: el cuerpo son los bytes del clip
+    - multipart/form-data: archivo en el campo "video" (o "file")
+
+    Raises:
+        HTTPException: 413 si excede el tamaño máximo, 415 si el tipo no se
+            admite, 422 si falta el clip
+    """
+    _check_content_length(request, FACIAL_CLIP_MAX_UPLOAD_BYTES)
+    content_type = _content_type(request)
+
+    if content_type in RAW_VIDEO_CONTENT_TYPES:
+        video_bytes = await _read_body(request, FACIAL_CLIP_MAX_UPLOAD_BYTES)
+    elif content_type == "multipart/form-data":
+        video_bytes = await _read_multipart(request, MULTIPART_VIDEO_FIELDS, FACIAL_CLIP_MAX_UPLOAD_BYTES)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type no soportado: {content_type}. Use multipart/form-data, video/webm o video/mp4"
+        )
+
+    return _check_size(video_bytes, FACIAL_CLIP_MAX_UPLOAD_BYTES)
@@ -0,0 +1,71 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from app.config import FACIAL_INFERENCE_WORKERS, FACIAL_INFERENCE_QUEUE_DEPTH
+
+
+class InferenceExecutor:
+    """
+    Ejecuta la inferencia facial (bloqueante) fuera del event loop de asyncio
+
+    Usa un pool de hilos acotado: los modelos del registro se comparten entre
+    hilos (un pool de procesos duplicaría su memoria) y dlib, OpenCV,
+    MediaPipe y torch liberan el GIL durante el cómputo pesado. Como máximo
+    `max_workers + max_queue` tareas pueden estar en curso o esperando; por
+    encima de eso se responde 503 en lugar de acumular cola.
+    """
+
+    def __init__(self, max_workers: int = FACIAL_INFERENCE_WORKERS, max_queue: int = FACIAL_INFERENCE_QUEUE_DEPTH):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="facial-inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) en el pool y espera su resultado
+
+        Raises:
+            HTTPException: 503 si el pool y su cola están llenos
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Servicio de reconocimiento facial saturado. Intente de nuevo en unos segundos."
+                )
+            self._pending += 1
+
+        # El cupo se libera cuando termina la tarea en el hilo, aunque el
+        # cliente se desconecte y se cancele la espera
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self.max_queue,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# Executor compartido por todas las rutas de reconocimiento facial
+inference_executor = InferenceExecutor()
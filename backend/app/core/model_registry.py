@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Any, Callable, Dict
+
+import psutil
+
+
+class ModelRegistry:
+    """
+    Registro de modelos compartidos por todo el proceso
+
+    Cada modelo se carga de forma perezosa exactamente una vez, la primera
+    vez que algún servicio lo pide, y todos los servicios reciben el mismo
+    objeto. Si la carga falla se registra el error y se devuelve None sin
+    reintentar en cada petición.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """
+        Registra la función que carga un modelo (no lo carga todavía)
+
+        Args:
+            name: Nombre del modelo
+            loader: Función sin argumentos que devuelve el modelo cargado
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """
+        Devuelve el modelo, cargándolo si es la primera vez que se pide
+
+        Returns:
+            El modelo cargado o None si su carga falló
+        """
+        if name in self._stats:
+            return self._models.get(name)
+
+        if name not in self._loaders:
+            raise KeyError(f"Modelo no registrado: {name}")
+
+        with self._locks[name]:
+            # Otro hilo pudo cargarlo mientras esperábamos el lock
+            if name in self._stats:
+                return self._models.get(name)
+
+            process = psutil.Process()
+            rss_before = process.memory_info().rss
+            started = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+                error = None
+            except Exception as e:
+                print(f"[WARN] Error cargando modelo '{name}': {e}")
+                model = None
+                error = str(e)
+
+            self._models[name] = model
+            self._stats[name] = {
+                "loaded": model is not None,
+                "load_seconds": round(time.perf_counter() - started, 3),
+                "rss_bytes": max(0, process.memory_info().rss - rss_before),
+                "error": error
+            }
+            print(f"[LOG] Modelo '{name}' cargado en {self._stats[name]['load_seconds']}s")
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        return self._stats.get(name, {}).get("loaded", False)
+
+    def memory_usage(self) -> dict:
+        """
+        Memoria usada por cada modelo registrado
+
+        Returns:
+            Dict nombre -> estadísticas de carga. rss_bytes es el incremento
+            de memoria residente del proceso medido al cargar el modelo.
+        """
+        with self._lock:
+            names = list(self._loaders)
+        return {
+            name: self._stats.get(name, {"loaded": False, "load_seconds": None, "rss_bytes": 0, "error": None})
+            for name in names
+        }
+
+
+# Registro único del proceso
+model_registry = ModelRegistry()
@@ -0,0 +1,246 @@
+import queue
+import threading
+import time
+from typing import Callable, Optional
+from fastapi import HTTPException, status
+from app.config import (
+    FACIAL_WRITE_QUEUE_MAX,
+    FACIAL_WRITE_BATCH_MAX,
+    FACIAL_WRITE_BATCH_WAIT_MS,
+    FACIAL_WRITE_QUEUE_TIMEOUT_SECONDS
+)
+
+
+# Marca para detener el escritor después de vaciar la cola
+_STOP = object()
+
+
+class _WriteJob:
+    def __init__(self, storage, files: list, on_written: Optional[Callable], key: Optional[str]):
+        self.storage = storage
+        self.files = files
+        self.on_written = on_written
+        self.key = key
+        self.counted = False  # Cuenta en los pendientes de su clave
+        self.items = []       # (ruta, bytes) ya generados
+        self.sizes = {}
+
+
+class WriteBehindQueue:
+    """
+    Escritura diferida de las capturas faciales a disco
+
+    La petición solo valida el frame y encola los archivos a escribir
+    (imagen, encoding, imágenes de retención); un hilo escritor los
+    persiste por lotes con `storage.write_batch`:
+
+    - Cada archivo se escribe de forma atómica: un lector nunca ve un
+      archivo a medias (temporal + rename en disco local)
+    - fsync por lote: en disco local los temporales del lote se escriben
+      primero y luego se sincronizan juntos; cada directorio se sincroniza
+      una sola vez después de los renames
+    - `on_written` se llama solo cuando los archivos del trabajo son
+      durables (ahí se registra la captura en el manifiesto y en el índice
+      de galería); si la escritura falla no se llama
+
+    La cola está acotada: si está llena, la petición espera hasta
+    `put_timeout` segundos y después se responde 503 (backpressure).
+    `close()` vacía la cola antes de apagar la aplicación.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = FACIAL_WRITE_QUEUE_MAX,
+        batch_max: int = FACIAL_WRITE_BATCH_MAX,
+        batch_wait_ms: float = FACIAL_WRITE_BATCH_WAIT_MS,
+        put_timeout: float = FACIAL_WRITE_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.max_queue = max(1, max_queue)
+        self.batch_max = max(1, batch_max)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._cond = threading.Condition()
+        self._pending = {}  # key -> trabajos encolados aún no escritos
+        self._pending_total = 0
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._counters = {"submitted": 0, "written": 0, "failed": 0, "rejected": 0, "batches": 0, "files": 0}
+        self._commit_ms = 0.0
+
+    def _ensure_writer(self) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="facial-write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, storage, files: list, on_written: Callable = None, key: str = None) -> None:
+        """
+        Encola archivos para escribir en segundo plano
+
+        Args:
+            storage: Almacenamiento de destino (ver storage_backends)
+            files: Lista de (ruta, bytes o función que devuelve los bytes);
+                las funciones se ejecutan en el hilo escritor
+            on_written: Se llama con {ruta: tamaño} cuando los archivos son durables
+            key: Agrupa trabajos (directorio del usuario) para wait_pending
+
+        Raises:
+            HTTPException: 503 si la cola sigue llena después de put_timeout
+        """
+        job = _WriteJob(storage, files, on_written, key)
+        if self._closed:
+            # Durante el apagado se escribe en la propia petición
+            self._commit([job])
+            return
+
+        self._ensure_writer()
+        with self._cond:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._pending_total += 1
+            self._counters["submitted"] += 1
+            job.counted = True
+        try:
+            self._queue.put(job, timeout=self.put_timeout)
+        except queue.Full:
+            self._finish(job, counter="rejected")
+            print(f"[WARN] Cola de escritura llena ({self.max_queue}): captura rechazada")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Almacenamiento de rostros saturado. Intente de nuevo en unos segundos."
+            )
+
+    def write_now(self, storage, files: list, on_written: Callable = None) -> None:
+        """Escribe en el hilo actual con las mismas garantías (sin cola)"""
+        job = _WriteJob(storage, files, on_written, None)
+        if not self._commit([job]):
+            raise OSError("No se pudieron escribir los archivos de la captura")
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            job = self._queue.get()
+            if job is _STOP:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_max:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                batch.append(job)
+            self._commit(batch)
+
+    def _stage(self, job: _WriteJob) -> None:
+        for path, data in job.files:
+            content = data() if callable(data) else data
+            job.items.append((path, content))
+            job.sizes[str(path)] = len(content)
+
+    def _commit(self, batch: list) -> bool:
+        started = time.perf_counter()
+        staged_jobs = []
+        for job in batch:
+            try:
+                self._stage(job)
+                staged_jobs.append(job)
+            except Exception as e:
+                print(f"[ERROR] No se pudo preparar la escritura de la captura: {e}")
+                self._finish(job, counter="failed")
+
+        # Un write_batch por almacenamiento: cada trabajo se confirma completo o no
+        committed = []
+        by_storage = {}
+        for job in staged_jobs:
+            by_storage.setdefault(id(job.storage), []).append(job)
+        for jobs in by_storage.values():
+            try:
+                errors = jobs[0].storage.write_batch([job.items for job in jobs])
+                retry = [index for index, error in enumerate(errors) if isinstance(error, FileNotFoundError)]
+                if retry:
+                    # El directorio se movió durante la escritura (migración de
+                    # layout): al reintentar se recrea y la migración lo fusiona
+                    retry_errors = jobs[0].storage.write_batch([jobs[index].items for index in retry])
+                    for index, error in zip(retry, retry_errors):
+                        errors[index] = error
+            except Exception as e:
+                errors = [e] * len(jobs)
+            for job, error in zip(jobs, errors):
+                if error is None:
+                    committed.append(job)
+                else:
+                    print(f"[ERROR] No se pudo escribir la captura: {error}")
+                    self._finish(job, counter="failed")
+
+        for job in committed:
+            if job.on_written is not None:
+                try:
+                    job.on_written(job.sizes)
+                except Exception as e:
+                    print(f"[WARN] Error registrando la captura escrita: {e}")
+            self._finish(job, counter="written", files=len(job.items))
+
+        with self._cond:
+            self._counters["batches"] += 1
+            self._commit_ms += (time.perf_counter() - started) * 1000
+        return len(committed) == len(batch)
+
+    def _finish(self, job: _WriteJob, counter: str, files: int = 0) -> None:
+        with self._cond:
+            self._counters[counter] += 1
+            self._counters["files"] += files
+            if job.counted:
+                self._pending[job.key] -= 1
+                if self._pending[job.key] <= 0:
+                    del self._pending[job.key]
+                self._pending_total -= 1
+            self._cond.notify_all()
+
+    def wait_pending(self, key: str, timeout: float = 5.0) -> bool:
+        """
+        Espera a que se escriban los trabajos encolados con esa clave
+
+        Permite leer lo propio recién capturado (p. ej. verificar justo
+        después de registrar). Devuelve False si se agotó el tiempo.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: key not in self._pending, timeout=timeout)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Espera a que se escriba todo lo encolado"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending_total == 0, timeout=timeout)
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Vacía la cola y detiene el escritor (al apagar la aplicación)"""
+        self._closed = True
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f"[WARN] Quedaron {self._queue.qsize()} capturas sin escribir al apagar")
+        else:
+            print(f"[LOG] Cola de escritura vaciada ({self._counters['written']} capturas escritas)")
+
+    def stats(self) -> dict:
+        with self._cond:
+            batches = self._counters["batches"]
+            return {
+                **self._counters,
+                "queued": self._queue.qsize(),
+                "pending": self._pending_total,
+                "max_queue": self.max_queue,
+                "avg_batch_ms": round(self._commit_ms / batches, 3) if batches else 0.0,
+                "avg_batch_size": round((self._counters["written"] + self._counters["failed"]) / batches, 2) if batches else 0.0
+            }
+
+
+# Cola compartida para las capturas de reconocimiento facial
+facial_write_queue = WriteBehindQueue()
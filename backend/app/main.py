@@ -1,7 +1,28 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import DEBUG, ENVIRONMENT
 from app.routes import auth, users, facial
+from app.core.inference_executor import inference_executor
+from app.core.write_behind import facial_write_queue
+from app.utils.face_detector_pool import face_detector_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ciclo de vida de la aplicación: inicialización al arrancar y limpieza al apagar
+    """
+    # Construir el índice de galería facial en segundo plano y mantenerlo
+    # actualizado con las capturas de otros workers o nodos
+    facial.facial_service.start_gallery_refresh()
+    yield
+    # Esperar la inferencia en curso, escribir las capturas encoladas y
+    # liberar los grafos de MediaPipe
+    inference_executor.shutdown()
+    facial_write_queue.close()
+    facial.facial_service.shutdown_workers()
+    face_detector_pool.close()
+
 
 # Crear la aplicación FastAPI
 app = FastAPI(
@@ -9,7 +30,8 @@ app = FastAPI(
     description="API de autenticación con JWT y reconocimiento facial",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, WebSocket
 from app.schemas.user_schema import UserRegisterSchema, UserLoginSchema, UserResponseSchema, RegistrationFlowResponseSchema, LoginFlowResponseSchema
 from app.schemas.token_schema import TokenResponseSchema
-from app.schemas.facial_schema import FacialCaptureSchema
 from app.services.auth_service import AuthService
 from app.services.facial_recognition_service import FacialRecognitionService
-import base64
+from app.core.inference_executor import inference_executor
+from app.core.image_upload import IMAGE_UPLOAD_OPENAPI, VIDEO_UPLOAD_OPENAPI, read_image_upload, read_video_upload
+from app.core.frame_stream import FrameStream
+from app.config import FACIAL_STREAM_MAX_FRAMES, FACIAL_STREAM_TIMEOUT_SECONDS
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -60,9 +62,9 @@ async def login(login_data: UserLoginSchema):
     }
 
 
-@router.post("/verify-facial-for-login")
+@router.post("/verify-facial-for-login", openapi_extra=IMAGE_UPLOAD_OPENAPI)
 async def verify_facial_for_login(
-    facial_data: FacialCaptureSchema,
+    image_bytes: bytes = Depends(read_image_upload),
     user_id: str = Query(..., description="ID del usuario que intenta hacer login")
 ):
     """
@@ -76,7 +78,8 @@ async def verify_facial_for_login(
     - **user_id**: ID del usuario que intenta hacer login
     
     Body:
-    - **image_base64**: Imagen facial en formato base64
+    - Imagen como `image/jpeg`, `multipart/form-data` (campo **image**)
+      o JSON con **image_base64**
     
     Respuesta:
     - **verified**: True si el rostro coincide con el usuario
@@ -84,11 +87,8 @@ async def verify_facial_for_login(
     - **confidence**: Nivel de confianza de la verificación
     """
     try:
-        # Decodificar imagen base64
-        image_bytes = base64.b64decode(facial_data.image_base64)
-        
         # ✅ VERIFICACIÓN ESTRICTA: El rostro debe pertenecer al usuario específico
-        result = facial_service.verify_face_for_login(image_bytes, user_id)
+        result = await inference_executor.run(facial_service.verify_face_for_login, image_bytes, user_id)
         
         return result
     
@@ -101,6 +101,72 @@ async def verify_facial_for_login(
         )
 
 
+@router.post("/verify-facial-clip-for-login", openapi_extra=VIDEO_UPLOAD_OPENAPI)
+async def verify_facial_clip_for_login(
+    video_bytes: bytes = Depends(read_video_upload),
+    user_id: str = Query(..., description="ID del usuario que intenta hacer login")
+):
+    """
+    Verificación facial del login con un clip de video corto (1-3 s)
+    
+    Del clip se eligen los keyframes más nítidos y cada uno pasa por
+    detección, liveness y comparación. Además exige movimiento del rostro
+    entre keyframes (liveness temporal), que un frame fijo no puede dar.
+    
+    Parámetros query:
+    - **user_id**: ID del usuario que intenta hacer login
+    
+    Body:
+    - Clip como `video/webm`, `video/mp4` o `multipart/form-data` (campo **video**)
+    
+    Respuesta:
+    - **verified**, **message**, **confidence**: como /verify-facial-for-login
+    - **keyframes**: resultado por keyframe
+    - **temporal_liveness**: cambio del rostro entre keyframes
+    """
+    try:
+        return await inference_executor.run(facial_service.verify_clip_for_login, video_bytes, user_id)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error en verificación facial: {str(e)}"
+        )
+
+
+@router.websocket("/ws/verify-facial-for-login")
+async def verify_facial_for_login_stream(
+    websocket: WebSocket,
+    user_id: str = Query(..., description="ID del usuario que intenta hacer login")
+):
+    """
+    Verificación facial del login sobre un flujo de frames (WebSocket)
+
+    El cliente envía frames continuamente (mensajes binarios JPEG, o texto
+    con base64 / {"image_base64": ...}). El servidor verifica un frame a la
+    vez con las mismas reglas que /verify-facial-for-login, descarta los
+    que llegan mientras está ocupado y termina con el primer frame que pasa
+    liveness y coincidencia.
+
+    Mensajes del servidor:
+    - {"type": "frame", "frame", "verified": false, "status_code", "detail"}: frame rechazado
+    - {"type": "result", "verified", "message", "confidence", ...}: resultado final (luego se cierra)
+    """
+    await websocket.accept()
+
+    async def verify(image_bytes: bytes) -> dict:
+        # Mismo caché de reenvíos que el login por imagen: un frame que ya
+        # inició sesión no puede reenviarse por el flujo
+        return await inference_executor.run(facial_service.verify_face_for_login, image_bytes, user_id)
+
+    stream = FrameStream(websocket, FACIAL_STREAM_MAX_FRAMES, FACIAL_STREAM_TIMEOUT_SECONDS)
+    result = await stream.run(verify)
+    print(f"[LOG] Verificación por flujo de {user_id}: verified={result['verified']}, "
+          f"procesados={result['frames_processed']}, descartados={result['frames_dropped']}")
+
+
 @router.get("/health")
 async def health_check():
     """
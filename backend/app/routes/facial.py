@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from app.schemas.facial_schema import (
-    FacialCaptureSchema,
-    FacialVerificationSchema,
     FacialDetectionResponseSchema,
     FacialVerificationResponseSchema
 )
 from app.services.facial_recognition_service import FacialRecognitionService
 from app.core.security import get_current_user
-import base64
+from app.core.inference_executor import inference_executor
+from app.core.image_upload import IMAGE_UPLOAD_OPENAPI, read_image_upload
 
 router = APIRouter(prefix="/api/facial", tags=["Facial Recognition"])
 
@@ -15,17 +14,17 @@ router = APIRouter(prefix="/api/facial", tags=["Facial Recognition"])
 facial_service = FacialRecognitionService()
 
 
-@router.post("/capture", response_model=dict)
+@router.post("/capture", response_model=dict, openapi_extra=IMAGE_UPLOAD_OPENAPI)
 async def capture_facial_image(
-    facial_data: FacialCaptureSchema,
+    image_bytes: bytes = Depends(read_image_upload),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Captura y guarda una imagen facial para el usuario autenticado
     
     Requiere:
-    - **image_base64**: Imagen en formato base64
-    - **description**: Descripción opcional de la captura
+    - Imagen como `image/jpeg`, `multipart/form-data` (campo **image**)
+      o JSON con **image_base64** (y **description** opcional)
     
     Respuesta:
     - **success**: Indicador de éxito
@@ -33,11 +32,9 @@ async def capture_facial_image(
     - **filepath**: Ruta del archivo guardado
     """
     try:
-        # Decodificar imagen base64
-        image_bytes = base64.b64decode(facial_data.image_base64)
-        
         # Guardar imagen
-        filepath = facial_service.save_facial_image(
+        filepath = await inference_executor.run(
+            facial_service.save_facial_image,
             image_bytes,
             current_user["user_id"]
         )
@@ -48,6 +45,8 @@ async def capture_facial_image(
             "filepath": filepath
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -55,9 +54,9 @@ async def capture_facial_image(
         )
 
 
-@router.post("/capture-registration", response_model=dict)
+@router.post("/capture-registration", response_model=dict, openapi_extra=IMAGE_UPLOAD_OPENAPI)
 async def capture_facial_registration(
-    facial_data: FacialCaptureSchema,
+    image_bytes: bytes = Depends(read_image_upload),
     user_id: str = Query(..., description="ID del usuario recién registrado"),
 ):
     """
@@ -67,8 +66,8 @@ async def capture_facial_registration(
     - **user_id**: ID del usuario recién registrado
     
     Body:
-    - **image_base64**: Imagen en formato base64
-    - **description**: Descripción opcional de la captura
+    - Imagen como `image/jpeg`, `multipart/form-data` (campo **image**)
+      o JSON con **image_base64** (y **description** opcional)
     
     Respuesta:
     - **success**: Indicador de éxito
@@ -76,11 +75,15 @@ async def capture_facial_registration(
     - **filepath**: Ruta del archivo guardado
     """
     try:
-        # Decodificar imagen base64
-        image_bytes = base64.b64decode(facial_data.image_base64)
+        # Decodificar una sola vez para ambas etapas (fuera del event loop)
+        frame = await inference_executor.run(facial_service.decode_frame, image_bytes)
         
         # ✅ NUEVA VERIFICACIÓN: Comprobar que el rostro sea único en el sistema
-        facial_uniqueness = facial_service.check_facial_uniqueness(image_bytes, exclude_user_id=user_id)
+        facial_uniqueness = await inference_executor.run(
+            facial_service.check_facial_uniqueness,
+            frame,
+            exclude_user_id=user_id
+        )
         
         if not facial_uniqueness["is_unique"]:
             raise HTTPException(
@@ -90,10 +93,12 @@ async def capture_facial_registration(
                        f"(Confianza: {facial_uniqueness['confidence']}%)"
             )
         
-        # Guardar imagen
-        filepath = facial_service.save_facial_image(
-            image_bytes,
-            user_id
+        # Guardar imagen (enrolamiento: escrita en disco antes de responder)
+        filepath = await inference_executor.run(
+            facial_service.save_facial_image,
+            frame,
+            user_id,
+            durable=True
         )
         
         return {
@@ -111,13 +116,14 @@ async def capture_facial_registration(
         )
 
 
-@router.post("/detect", response_model=FacialDetectionResponseSchema)
-async def detect_face(facial_data: FacialCaptureSchema):
+@router.post("/detect", response_model=FacialDetectionResponseSchema, openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def detect_face(image_bytes: bytes = Depends(read_image_upload)):
     """
     Detecta si hay un rostro en la imagen proporcionada
     
     Requiere:
-    - **image_base64**: Imagen en formato base64
+    - Imagen como `image/jpeg`, `multipart/form-data` (campo **image**)
+      o JSON con **image_base64**
     
     Respuesta:
     - **face_detected**: Si se detectó un rostro
@@ -126,11 +132,8 @@ async def detect_face(facial_data: FacialCaptureSchema):
     - **confidence**: Confianza de la detección
     """
     try:
-        # Decodificar imagen base64
-        image_bytes = base64.b64decode(facial_data.image_base64)
-        
         # Detectar rostro
-        result = facial_service.detect_face_in_image(image_bytes)
+        result = await inference_executor.run(facial_service.detect_face_in_image, image_bytes)
         
         return {
             "face_detected": result["face_detected"],
@@ -148,9 +151,9 @@ async def detect_face(facial_data: FacialCaptureSchema):
         )
 
 
-@router.post("/verify", response_model=FacialVerificationResponseSchema)
+@router.post("/verify", response_model=FacialVerificationResponseSchema, openapi_extra=IMAGE_UPLOAD_OPENAPI)
 async def verify_face(
-    facial_data: FacialVerificationSchema,
+    image_bytes: bytes = Depends(read_image_upload),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -159,7 +162,8 @@ async def verify_face(
     Requiere autenticación JWT
     
     Requiere:
-    - **image_base64**: Imagen en formato base64
+    - Imagen como `image/jpeg`, `multipart/form-data` (campo **image**)
+      o JSON con **image_base64**
     
     Respuesta:
     - **verified**: Si la verificación fue exitosa
@@ -167,11 +171,9 @@ async def verify_face(
     - **confidence**: Nivel de confianza de la verificación
     """
     try:
-        # Decodificar imagen base64
-        image_bytes = base64.b64decode(facial_data.image_base64)
-        
         # Verificar rostro
-        result = facial_service.verify_face(
+        result = await inference_executor.run(
+            facial_service.verify_face,
             image_bytes,
             current_user["user_id"]
         )
@@ -192,15 +194,16 @@ async def verify_face(
             detail=f"Error en la verificación facial: {str(e)}"
         )
 
-@router.post("/check-uniqueness")
-async def check_facial_uniqueness(facial_data: FacialCaptureSchema):
+@router.post("/check-uniqueness", openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def check_facial_uniqueness(image_bytes: bytes = Depends(read_image_upload)):
     """
     Verifica si un rostro es único en el sistema (no pertenece a otro usuario)
     
     Se usa durante el registro para validar que el rostro no esté duplicado
     
     Requiere:
-    - **image_base64**: Imagen en formato base64
+    - Imagen como `image/jpeg`, `multipart/form-data` (campo **image**)
+      o JSON con **image_base64**
     
     Respuesta:
     - **is_unique**: Si el rostro es único
@@ -209,14 +212,13 @@ async def check_facial_uniqueness(facial_data: FacialCaptureSchema):
     - **confidence**: Confianza de la coincidencia si existe
     """
     try:
-        # Decodificar imagen base64
-        image_bytes = base64.b64decode(facial_data.image_base64)
-        
         # Verificar unicidad del rostro
-        result = facial_service.check_facial_uniqueness(image_bytes)
+        result = await inference_executor.run(facial_service.check_facial_uniqueness, image_bytes)
         
         return result
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -225,22 +227,31 @@ async def check_facial_uniqueness(facial_data: FacialCaptureSchema):
 
 
 @router.get("/my-images")
-async def get_my_facial_images(current_user: dict = Depends(get_current_user)):
+async def get_my_facial_images(
+    current_user: dict = Depends(get_current_user),
+    offset: int = Query(0, ge=0, description="Capturas a saltar (más recientes primero)"),
+    limit: int = Query(20, ge=1, le=100, description="Capturas por página")
+):
     """
-    Obtiene todas las imágenes faciales guardadas del usuario autenticado
+    Obtiene las imágenes faciales guardadas del usuario autenticado (paginado)
     
     Requiere autenticación JWT
     
     Respuesta:
-    - **images**: Lista de rutas de imágenes
-    - **count**: Número de imágenes
+    - **images**: Rutas de las imágenes de la página
+    - **items**: Metadatos de cada captura (fecha, tamaño, calidad, estado del encoding)
+    - **count**: Número de imágenes en la página
+    - **total**: Número total de imágenes del usuario
     """
-    images = facial_service.get_user_facial_images(current_user["user_id"])
+    # Puede esperar escrituras pendientes y leer el manifiesto: fuera del event loop
+    page = await inference_executor.run(
+        facial_service.get_user_facial_images_page,
+        current_user["user_id"],
+        offset,
+        limit
+    )
     
-    return {
-        "images": images,
-        "count": len(images)
-    }
+    return {**page, "count": len(page["images"])}
 
 
 @router.get("/health")
@@ -250,5 +261,15 @@ async def health_check():
     """
     return {
         "status": "healthy",
-        "service": "facial_recognition"
+        "service": "facial_recognition",
+        "models": facial_service.models_memory_usage(),
+        "inference": inference_executor.stats(),
+        "gallery": facial_service.gallery_stats(),
+        "liveness_batching": facial_service.liveness_batching_stats(),
+        "replay_cache": facial_service.replay_cache_stats(),
+        "template_cache": facial_service.template_cache_stats(),
+        "quality_gate": facial_service.quality_gate_stats(),
+        "enrollment_manifest": facial_service.enrollment_manifest_stats(),
+        "write_queue": facial_service.write_queue_stats(),
+        "storage": facial_service.storage_stats()
     }
@@ -4,11 +4,16 @@ from app.core.security import hash_password, verify_password, create_access_toke
 from app.schemas.user_schema import UserRegisterSchema, UserLoginSchema
 from app.utils.validators import validate_email, validate_password_strength, validate_username
 from app.services.facial_recognition_service import FacialRecognitionService
+from app.core.inference_executor import inference_executor
 from datetime import timedelta, datetime, timezone
 import uuid
 import base64
 
 
+# Servicio facial compartido (los modelos viven en el registro de modelos del proceso)
+facial_service = FacialRecognitionService()
+
+
 class AuthService:
     """
     Servicio de autenticación que maneja toda la lógica de negocio relacionada
@@ -58,13 +63,20 @@ class AuthService:
             )
         
         # ✅ VERIFICACIÓN TEMPRANA: Si se proporciona imagen facial, verificar unicidad ANTES de crear el usuario
+        facial_frame = None
         if user_data.facial_image_base64:
             try:
                 image_data = base64.b64decode(user_data.facial_image_base64)
-                facial_service = FacialRecognitionService()
                 
-                # Verificar que el rostro sea único
-                facial_uniqueness = facial_service.check_facial_uniqueness(image_data)
+                # Decodificar una sola vez (fuera del event loop): el mismo frame
+                # se guarda más abajo
+                facial_frame = await inference_executor.run(facial_service.decode_frame, image_data)
+                
+                # Verificar que el rostro sea único (fuera del event loop)
+                facial_uniqueness = await inference_executor.run(
+                    facial_service.check_facial_uniqueness,
+                    facial_frame
+                )
                 
                 if not facial_uniqueness["is_unique"]:
                     raise HTTPException(
@@ -105,14 +117,12 @@ class AuthService:
         db.collection("users").document(user_id).set(user_dict)
         
         # Si se proporciona imagen facial, guardarla (ya fue verificada arriba)
-        if user_data.facial_image_base64:
+        if facial_frame is not None:
             try:
-                # Decodificar imagen base64
-                image_data = base64.b64decode(user_data.facial_image_base64)
-                
-                # Guardar imagen usando el servicio de reconocimiento facial
-                facial_service = FacialRecognitionService()
-                facial_service.save_facial_image(image_data, user_id)
+                # Guardar imagen usando el servicio de reconocimiento facial; se
+                # escribe antes de seguir (sin write-behind) para no habilitar
+                # el login facial con un template que no llegó a disco
+                await inference_executor.run(facial_service.save_facial_image, facial_frame, user_id, durable=True)
                 
                 # Marcar que el usuario tiene reconocimiento facial habilitado
                 db.collection("users").document(user_id).update({
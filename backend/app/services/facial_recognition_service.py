@@ -1,15 +1,252 @@
 import cv2
+import functools
+import math
 import numpy as np
 import os
+import tempfile
+import threading
+import time
 import uuid
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
+from typing import Union
 from fastapi import HTTPException, status
 import mediapipe as mp
-import face_recognition
 from PIL import Image
 import io
-from ultralytics import YOLO
+from app.core.constants import (
+    FACE_ENCODING_MODEL_VERSION,
+    FACE_ENCODING_SUFFIX,
+    FACE_CHIP_JPEG_QUALITY
+)
+from app.config import (
+    FACE_ANN_MIN_SIZE,
+    FACE_ANN_N_LISTS,
+    FACE_ANN_N_PROBE,
+    FACIAL_GALLERY_REFRESH_SECONDS,
+    FACIAL_LIVENESS_BATCHING,
+    FACIAL_LIVENESS_MAX_BATCH,
+    FACIAL_LIVENESS_MAX_WAIT_MS,
+    FACIAL_LIVENESS_BACKEND,
+    FACIAL_YOLO_ONNX_PATH,
+    FACIAL_WORKING_MAX_SIDE,
+    FACIAL_FACE_ROI_MARGIN,
+    FACIAL_LOGIN_STAGE_WORKERS,
+    FACIAL_COMPARE_MODE,
+    FACIAL_EMBEDDING_BACKEND,
+    FACIAL_EMBEDDING_ONNX_PATH,
+    FACIAL_EMBEDDING_ONNX_DIMENSION,
+    FACIAL_EMBEDDING_ONNX_THRESHOLD,
+    FACIAL_CONTEXT_MAX_SIDE,
+    FACIAL_RETAIN_ORIGINAL,
+    FACIAL_REPLAY_CACHE,
+    FACIAL_REPLAY_HASH,
+    FACIAL_REPLAY_MAX_DISTANCE,
+    FACIAL_REPLAY_TTL_SECONDS,
+    FACIAL_REPLAY_MAX_USERS,
+    FACIAL_REPLAY_FRAMES_PER_USER,
+    FACIAL_REPLAY_FAILED_TTL_SECONDS,
+    FACIAL_REPLAY_FACE_TTL_SECONDS,
+    FACIAL_MATCH_STATS_FLUSH_SECONDS,
+    FACIAL_MATCH_STATS_MAX_USERS,
+    FACIAL_TEMPLATE_CACHE,
+    FACIAL_TEMPLATE_CACHE_MB,
+    FACIAL_TEMPLATE_CACHE_TTL_SECONDS,
+    FACIAL_QUALITY_GATE,
+    FACIAL_QUALITY_MIN_IMAGE_SIDE,
+    FACIAL_QUALITY_MIN_BRIGHTNESS,
+    FACIAL_QUALITY_MAX_BRIGHTNESS,
+    FACIAL_QUALITY_MAX_SATURATED_RATIO,
+    FACIAL_QUALITY_MIN_CONTRAST,
+    FACIAL_QUALITY_MIN_SHARPNESS,
+    FACIAL_QUALITY_MIN_FACE_RATIO,
+    FACIAL_CLIP_KEYFRAMES,
+    FACIAL_CLIP_MIN_SECONDS,
+    FACIAL_CLIP_MAX_SECONDS,
+    FACIAL_CLIP_MAX_ANALYZED_FRAMES,
+    FACIAL_CLIP_MIN_MATCH_RATIO,
+    FACIAL_CLIP_REQUIRE_MOTION,
+    FACIAL_CLIP_MIN_MOTION,
+    FACIAL_MANIFEST_CACHE_USERS,
+    FACIAL_DATA_SHARDED,
+    FACIAL_DATA_LEGACY_READS,
+    FACIAL_STORAGE_BACKEND,
+    FACIAL_GCS_BUCKET,
+    FACIAL_GCS_PREFIX,
+    FACIAL_STORAGE_CACHE_MB,
+    FACIAL_WRITE_BEHIND
+)
+from app.core.errors import UserStateError
+from app.core.model_registry import model_registry
+from app.core.write_behind import facial_write_queue
+from app.utils.face_gallery import FaceGalleryIndex
+from app.utils.face_frame import FaceFrame
+from app.utils.face_detector_pool import face_detector_pool
+from app.utils.micro_batcher import MicroBatcher
+from app.utils.liveness_backends import OnnxYoloBackend, TorchYoloBackend
+from app.utils.embedding_backends import DlibEmbeddingBackend, OnnxEmbeddingBackend
+from app.utils.face_chip import encoded_image_suffix, extract_face_chip, is_face_chip
+from app.utils.replay_cache import REPLAY_FAILED, REPLAY_PENDING, FrameReplayCache
+from app.utils.frame_quality import FrameQualityError, FrameQualityGate
+from app.utils.template_match_stats import TemplateMatchStats
+from app.utils.clip_sampler import face_motion, sample_keyframes
+from app.utils.enrollment_manifest import ENCODING_FAILED, ENCODING_PENDING, ENCODING_READY, EnrollmentManifest
+from app.utils.facial_data_layout import FacialDataLayout
+from app.utils.storage_backends import CachedStorage, create_storage
+from app.utils.template_cache import UserTemplateCache
+
+
+# Modos de comparación contra los templates del usuario
+COMPARE_MODE_FIRST_MATCH = "first_match"  # Se detiene en la primera coincidencia confiable
+COMPARE_MODE_FULL_SCAN = "full_scan"      # Compara contra todos (auditoría)
+
+# Almacenamiento de facial_data (disco local o bucket) con caché LRU de lectura
+_facial_storage = create_storage(
+    FACIAL_STORAGE_BACKEND,
+    Path(__file__).parent.parent / "facial_data",
+    gcs_bucket=FACIAL_GCS_BUCKET,
+    gcs_prefix=FACIAL_GCS_PREFIX,
+    cache_bytes=int(FACIAL_STORAGE_CACHE_MB * 1024 * 1024)
+)
+
+# Historial de qué template coincide en cada login, compartido por el proceso
+_template_stats = TemplateMatchStats(
+    _facial_storage,
+    flush_seconds=FACIAL_MATCH_STATS_FLUSH_SECONDS,
+    max_users=FACIAL_MATCH_STATS_MAX_USERS
+)
+
+# Capturas registradas por usuario (evita recorrer los directorios)
+_enrollment_manifest = EnrollmentManifest(_facial_storage, max_users=FACIAL_MANIFEST_CACHE_USERS)
+
+# Encodings de los templates de cada usuario (logins y verificaciones repetidas)
+_template_cache = UserTemplateCache(
+    max_bytes=int(FACIAL_TEMPLATE_CACHE_MB * 1024 * 1024),
+    ttl_seconds=FACIAL_TEMPLATE_CACHE_TTL_SECONDS
+)
+
+# Frames de login vistos recientemente por usuario (reenvíos idénticos o casi idénticos)
+_replay_cache = FrameReplayCache(
+    max_users=FACIAL_REPLAY_MAX_USERS,
+    max_frames_per_user=FACIAL_REPLAY_FRAMES_PER_USER,
+    ttl_seconds=FACIAL_REPLAY_TTL_SECONDS,
+    max_distance=FACIAL_REPLAY_MAX_DISTANCE,
+    hash_method=FACIAL_REPLAY_HASH,
+    failed_ttl_seconds=FACIAL_REPLAY_FAILED_TTL_SECONDS,
+    face_ttl_seconds=FACIAL_REPLAY_FACE_TTL_SECONDS
+)
+
+# Filtro de calidad (brillo, contraste, nitidez, tamaño del rostro) antes de los modelos
+_quality_gate = FrameQualityGate(
+    min_image_side=FACIAL_QUALITY_MIN_IMAGE_SIDE,
+    min_brightness=FACIAL_QUALITY_MIN_BRIGHTNESS,
+    max_brightness=FACIAL_QUALITY_MAX_BRIGHTNESS,
+    max_saturated_ratio=FACIAL_QUALITY_MAX_SATURATED_RATIO,
+    min_contrast=FACIAL_QUALITY_MIN_CONTRAST,
+    min_sharpness=FACIAL_QUALITY_MIN_SHARPNESS,
+    min_face_ratio=FACIAL_QUALITY_MIN_FACE_RATIO
+)
+
+# Índice compartido por todas las instancias del servicio
+_gallery_index = FaceGalleryIndex(
+    dimension=(
+        FACIAL_EMBEDDING_ONNX_DIMENSION if FACIAL_EMBEDDING_BACKEND == "onnx"
+        else DlibEmbeddingBackend.dimension
+    ),
+    ann_min_size=FACE_ANN_MIN_SIZE,
+    ann_n_lists=FACE_ANN_N_LISTS,
+    ann_n_probe=FACE_ANN_N_PROBE
+)
+# Una sola construcción/actualización del índice a la vez
+_gallery_lock = threading.Lock()
+_gallery_refresh_stop = threading.Event()
+_gallery_refresh_stats = {"refreshes": 0, "added": 0, "removed_users": 0, "last_refresh_ms": 0.0}
+
+
+def _load_yolo():
+    """Modelo YOLO para detección de dispositivos y accesorios (liveness)"""
+    from ultralytics import YOLO
+    return YOLO('yolov8n.pt')  # Modelo nano para detección rápida
+
+
+def _load_yolo_onnx():
+    """YOLO exportado a ONNX (opcionalmente INT8) ejecutado con onnxruntime"""
+    return OnnxYoloBackend(FACIAL_YOLO_ONNX_PATH)
+
+
+def _load_face_recognition():
+    """face_recognition carga los modelos de dlib (HOG, landmarks, ResNet) al importarse"""
+    import face_recognition
+    return face_recognition
+
+
+def _load_embedding_onnx():
+    """Modelo de encoding facial ONNX ejecutado con onnxruntime"""
+    return OnnxEmbeddingBackend(
+        FACIAL_EMBEDDING_ONNX_PATH,
+        threshold=FACIAL_EMBEDDING_ONNX_THRESHOLD,
+        dimension=FACIAL_EMBEDDING_ONNX_DIMENSION
+    )
+
+
+model_registry.register("yolo", _load_yolo)
+model_registry.register("yolo_onnx", _load_yolo_onnx)
+model_registry.register("dlib", _load_face_recognition)
+model_registry.register("embedding_onnx", _load_embedding_onnx)
+
+
+# Una sola instancia por modelo: YOLO de ultralytics y dlib no son
+# thread-safe y cada backend serializa sus llamadas con su propio lock
+# (las sesiones de onnxruntime sí admiten llamadas concurrentes)
+@functools.lru_cache(maxsize=None)
+def _torch_liveness_backend(model) -> TorchYoloBackend:
+    return TorchYoloBackend(model)
+
+
+@functools.lru_cache(maxsize=None)
+def _dlib_embedding_backend(face_recognition) -> DlibEmbeddingBackend:
+    return DlibEmbeddingBackend(face_recognition, FACE_ENCODING_MODEL_VERSION)
+
+
+def _get_liveness_backend():
+    """Backend de YOLO configurado (None si su modelo no se pudo cargar)"""
+    if FACIAL_LIVENESS_BACKEND == "onnx":
+        return model_registry.get("yolo_onnx")
+    model = model_registry.get("yolo")
+    return _torch_liveness_backend(model) if model is not None else None
+
+
+def _get_embedding_backend():
+    """Backend de encoding configurado (None si su modelo no se pudo cargar)"""
+    if FACIAL_EMBEDDING_BACKEND == "onnx":
+        return model_registry.get("embedding_onnx")
+    face_recognition = model_registry.get("dlib")
+    if face_recognition is None:
+        return None
+    return _dlib_embedding_backend(face_recognition)
+
+
+def _predict_yolo_batch(images: list) -> list:
+    """Una sola llamada a YOLO para varios frames; detecciones (N, 6) por frame"""
+    return _get_liveness_backend().predict_batch(images)
+
+
+# Etapas paralelas del login (Firestore, liveness, encoding). Es un pool
+# distinto del de inferencia para que una etapa nunca espere a su propio llamador
+_login_stage_executor = ThreadPoolExecutor(
+    max_workers=FACIAL_LOGIN_STAGE_WORKERS,
+    thread_name_prefix="facial-login-stage"
+)
+
+
+# Agrupa las peticiones de liveness concurrentes en lotes de YOLO
+_liveness_batcher = MicroBatcher(
+    _predict_yolo_batch,
+    max_batch_size=FACIAL_LIVENESS_MAX_BATCH,
+    max_wait_ms=FACIAL_LIVENESS_MAX_WAIT_MS,
+    name="yolo-liveness-batcher"
+)
 
 
 class FacialRecognitionService:
@@ -20,130 +257,623 @@ class FacialRecognitionService:
     def __init__(self):
         # Directorio base para guardar rostros - debe estar en app/facial_data
         self.FACIAL_DATA_DIR = Path(__file__).parent.parent / "facial_data"
+        # Lecturas y escrituras de facial_data pasan por el almacenamiento configurado
+        self.storage = _facial_storage
+        # Directorios de usuario: sharded (ab/cd/<user_id>) y legacy durante la migración
+        self.layout = FacialDataLayout(
+            self.storage, FACIAL_DATA_SHARDED, FACIAL_DATA_LEGACY_READS, write_queue=facial_write_queue
+        )
         
         self.mp_face_detection = mp.solutions.face_detection
         self.mp_drawing = mp.solutions.drawing_utils
         
-        # Cargar modelo YOLO para detección de accesorios (liveness)
-        try:
-            self.yolo_model = YOLO('yolov8n.pt')  # Modelo nano para detección rápida
-            print("[LOG] Modelo YOLO cargado exitosamente")
-        except Exception as e:
-            print(f"[WARN] Error cargando YOLO: {e}. Liveness detection deshabilitada")
-            self.yolo_model = None
+        # Los modelos (YOLO, dlib) se cargan una sola vez por proceso en el
+        # registro de modelos, la primera vez que se usan
         
         # Crear directorio si no existe
         self.FACIAL_DATA_DIR.mkdir(parents=True, exist_ok=True)
         print(f"[LOG] Directorio facial_data creado en: {self.FACIAL_DATA_DIR}")
     
+    @property
+    def liveness_backend(self):
+        """Backend de liveness según FACIAL_LIVENESS_BACKEND (torch u onnx)"""
+        return _get_liveness_backend()
+    
+    @property
+    def embedding_backend(self):
+        """Backend de encoding según FACIAL_EMBEDDING_BACKEND (dlib u onnx)"""
+        backend = _get_embedding_backend()
+        if backend is None:
+            raise RuntimeError(f"Backend de encoding '{FACIAL_EMBEDDING_BACKEND}' no disponible")
+        return backend
+    
+    @property
+    def face_recognition(self):
+        """Módulo face_recognition con los modelos de dlib ya cargados"""
+        return model_registry.get("dlib")
+    
+    @staticmethod
+    def liveness_batching_stats() -> dict:
+        """Métricas de los lotes de YOLO ejecutados (tamaños alcanzados)"""
+        return {
+            "enabled": FACIAL_LIVENESS_BATCHING,
+            "backend": FACIAL_LIVENESS_BACKEND,
+            **_liveness_batcher.stats()
+        }
+    
+    @staticmethod
+    def replay_cache_stats() -> dict:
+        """Aciertos/fallos de la detección de reenvíos en el login"""
+        return {"enabled": FACIAL_REPLAY_CACHE, **_replay_cache.stats()}
+    
+    @staticmethod
+    def template_cache_stats() -> dict:
+        """Aciertos y memoria de la caché de templates por usuario"""
+        return {"enabled": FACIAL_TEMPLATE_CACHE, **_template_cache.stats()}
+    
+    @staticmethod
+    def invalidate_user_templates(user_id: str) -> None:
+        """Descarta los templates en caché del usuario (al registrar o borrar capturas)"""
+        _template_cache.invalidate(user_id)
+    
+    @staticmethod
+    def enrollment_manifest_stats() -> dict:
+        """Lecturas servidas desde memoria, recargas y usuarios migrados del manifiesto"""
+        return _enrollment_manifest.stats()
+    
+    @staticmethod
+    def write_queue_stats() -> dict:
+        """Capturas encoladas, escritas, fallidas y rechazadas por cola llena"""
+        return facial_write_queue.stats()
+    
+    @staticmethod
+    def storage_stats() -> dict:
+        """Backend de almacenamiento y aciertos/memoria de su caché LRU"""
+        cache = _facial_storage.stats() if isinstance(_facial_storage, CachedStorage) else None
+        return {"backend": _facial_storage.name, "cache": cache}
+    
+    @staticmethod
+    def quality_gate_stats() -> dict:
+        """Frames revisados por el filtro de calidad y rechazos por motivo"""
+        return {"enabled": FACIAL_QUALITY_GATE, **_quality_gate.stats()}
+    
+    @staticmethod
+    def shutdown_workers() -> None:
+        """Detiene los hilos de fondo del servicio y persiste el historial de coincidencias"""
+        _gallery_refresh_stop.set()
+        _login_stage_executor.shutdown(wait=True)
+        _liveness_batcher.close()
+        _template_stats.close()
+    
+    @staticmethod
+    def models_memory_usage() -> dict:
+        """Estado y memoria de cada modelo del registro"""
+        return model_registry.memory_usage()
+    
     @staticmethod
     def ensure_facial_data_dir():
         """Asegura que el directorio de datos faciales existe"""
         facial_data_dir = Path(__file__).parent.parent / "facial_data"
         facial_data_dir.mkdir(parents=True, exist_ok=True)
     
-    def save_facial_image(self, image_data: bytes, user_id: str) -> str:
+    @staticmethod
+    def decode_frame(image_data: Union[bytes, FaceFrame]) -> FaceFrame:
+        """
+        Decodifica la imagen de una petición una sola vez
+        
+        Los frames más grandes que FACIAL_WORKING_MAX_SIDE se reducen aquí,
+        una sola vez, antes de llegar a los modelos.
+        
+        Args:
+            image_data: Bytes de la imagen o un FaceFrame ya decodificado
+            
+        Returns:
+            FaceFrame compartido por todas las etapas del pipeline
+            
+        Raises:
+            HTTPException: Si la imagen es inválida
+        """
+        if isinstance(image_data, FaceFrame):
+            return image_data
+        
+        frame = FaceFrame.from_bytes(image_data, max_side=FACIAL_WORKING_MAX_SIDE)
+        if frame is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Imagen inválida"
+            )
+        return frame
+    
+    @property
+    def gallery_index(self) -> FaceGalleryIndex:
+        """Índice en memoria con los encodings de todos los usuarios"""
+        return _gallery_index
+    
+    def build_gallery_index(self) -> None:
+        """
+        Construye el índice de galería o lo actualiza de forma incremental
+        
+        Por cada usuario se comparan las capturas de su manifiesto con las
+        ya indexadas: se agregan las nuevas (también las registradas por
+        otros workers o nodos) y se reindexa el usuario si se borró alguna.
+        Solo se ejecuta una construcción a la vez.
+        """
+        with _gallery_lock:
+            self._refresh_gallery_unlocked()
+    
+    def _refresh_gallery_unlocked(self) -> None:
+        gallery = self.gallery_index
+        started = time.perf_counter()
+        pending = []
+        removed_users = 0
+        seen_users = set()
+        for user_id, user_dir in self.layout.iter_user_dirs():
+            seen_users.add(user_id)
+            # Primero lo indexado: una captura que llegue mientras tanto aparece
+            # en el manifiesto y no se confunde con una borrada
+            indexed = gallery.user_keys(user_id)
+            try:
+                names = {
+                    entry["filename"] for entry in _enrollment_manifest.images(user_dir)
+                    if entry["encoding"] != ENCODING_FAILED
+                }
+            except Exception as e:
+                print(f"[WARN] No se pudo leer el manifiesto de {user_dir}: {e}")
+                continue
+            if indexed - names:
+                gallery.remove_user(user_id)
+                indexed = frozenset()
+                removed_users += 1
+            for filename in sorted(names - indexed):
+                image_path = user_dir / filename
+                try:
+                    encoding = self._get_registered_encoding(image_path)
+                except Exception as e:
+                    print(f"[WARN] Error cargando encoding de {image_path}: {e}")
+                    continue
+                if encoding is not None:
+                    pending.append((user_id, encoding, filename))
+        
+        for user_id in gallery.users() - seen_users:
+            gallery.remove_user(user_id)
+            removed_users += 1
+        
+        first_build = not gallery.is_ready
+        gallery.add_many(pending)
+        gallery.mark_ready()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _gallery_refresh_stats["refreshes"] += 1
+        _gallery_refresh_stats["added"] += len(pending)
+        _gallery_refresh_stats["removed_users"] += removed_users
+        _gallery_refresh_stats["last_refresh_ms"] = round(elapsed_ms, 1)
+        if first_build:
+            print(f"[LOG] Índice de galería construido con {gallery.size} encodings ({elapsed_ms:.0f} ms)")
+        elif pending or removed_users:
+            print(f"[LOG] Índice de galería actualizado: {len(pending)} encodings nuevos, "
+                  f"{removed_users} usuarios reindexados")
+    
+    def start_gallery_refresh(self) -> threading.Thread:
+        """
+        Construye el índice en segundo plano y lo actualiza cada
+        FACIAL_GALLERY_REFRESH_SECONDS (la API atiende mientras tanto)
+        """
+        def run():
+            while True:
+                try:
+                    self.build_gallery_index()
+                except Exception as e:
+                    print(f"[WARN] No se pudo actualizar el índice de galería: {e}")
+                if FACIAL_GALLERY_REFRESH_SECONDS <= 0 or _gallery_refresh_stop.wait(FACIAL_GALLERY_REFRESH_SECONDS):
+                    return
+        
+        thread = threading.Thread(target=run, name="facial-gallery-refresh", daemon=True)
+        thread.start()
+        return thread
+    
+    def gallery_stats(self) -> dict:
+        """Tamaño del índice 1:N y actualizaciones incrementales"""
+        return {
+            "ready": self.gallery_index.is_ready,
+            "size": self.gallery_index.size,
+            "users": len(self.gallery_index.users()),
+            "refresh_seconds": FACIAL_GALLERY_REFRESH_SECONDS,
+            **_gallery_refresh_stats
+        }
+    
+    def _ensure_gallery_index(self) -> FaceGalleryIndex:
+        """
+        Devuelve el índice de galería, construyéndolo si aún no existe
+        
+        Si la construcción inicial sigue en segundo plano se espera a que
+        termine (no se construye dos veces).
+        """
+        if not self.gallery_index.is_ready:
+            with _gallery_lock:
+                if not self.gallery_index.is_ready:
+                    self._refresh_gallery_unlocked()
+        return self.gallery_index
+    
+    def save_facial_image(self, image_data: Union[bytes, FaceFrame], user_id: str, durable: bool = False) -> str:
         """
         Guarda una imagen facial para un usuario
         
+        Se guarda el chip del rostro alineado (150x150) en lugar del frame
+        de la cámara. La escena reducida y el original solo se guardan si
+        la política de retención lo pide (FACIAL_CONTEXT_MAX_SIDE,
+        FACIAL_RETAIN_ORIGINAL).
+        
+        Con FACIAL_WRITE_BEHIND la petición termina al validar el frame y
+        calcular el encoding: la imagen y el encoding se escriben en segundo
+        plano (ver WriteBehindQueue). La captura entra al manifiesto, al
+        índice de galería y a las cachés solo cuando ya es durable: si la
+        escritura falla no queda un encoding fantasma.
+        
+        El enrolamiento usa durable=True: el usuario se marca con facial
+        recognition habilitado solo si su template ya está escrito, y un
+        error de escritura llega al llamador para deshacer el registro.
+        
         Args:
-            image_data: Datos de imagen en bytes
+            image_data: Datos de imagen en bytes o FaceFrame ya decodificado
             user_id: ID del usuario
+            durable: Escribir antes de responder aunque FACIAL_WRITE_BEHIND
+                esté activo
             
         Returns:
             Ruta del archivo guardado
             
         Raises:
-            HTTPException: Si hay error al guardar
+            HTTPException: Si hay error al guardar, o 503 si la cola de
+                escritura está llena
         """
+        frame = self.decode_frame(image_data)
+        
         try:
-            # Crear directorio del usuario si no existe
-            user_facial_dir = self.FACIAL_DATA_DIR / user_id
-            user_facial_dir.mkdir(exist_ok=True)
-            
-            # Convertir bytes a imagen numpy
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Imagen inválida"
-                )
+            user_facial_dir = self._user_facial_dir(user_id)
             
             # Generar nombre único para la imagen
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"face_{timestamp}.jpg"
             filepath = user_facial_dir / filename
             
-            # Guardar imagen
-            cv2.imwrite(str(filepath), image)
+            chip = self._extract_face_chip(frame)
+            if chip is not None:
+                # Guardar solo el rostro alineado y calcular su encoding una sola vez
+                # (el JPEG del chip se codifica en el hilo escritor)
+                image_content = functools.partial(
+                    self._encode_jpeg, cv2.cvtColor(chip, cv2.COLOR_RGB2BGR), FACE_CHIP_JPEG_QUALITY
+                )
+                with frame.timed("encoding"):
+                    encoding = self.embedding_backend.encode_chip(chip)
+            else:
+                # Sin rostro localizado no hay chip: se guarda el frame como antes
+                print(f"[WARN] No se localizó el rostro; se guarda el frame completo en {filepath}")
+                image_content = self._encode_jpeg(frame.bgr)
+                encoding = self._compute_encoding(frame)
+            
+            files = [(filepath, image_content)]
+            if encoding is not None:
+                # El encoding se guarda junto a la imagen
+                files.append((self._encoding_path(filepath), self._encoding_bytes(encoding)))
+            else:
+                print(f"[WARN] No se pudo extraer encoding de {filepath}. Se calculará al verificar")
+            
+            quality = self._capture_quality(frame)
+            encoding_status = ENCODING_READY if encoding is not None else ENCODING_PENDING
+            
+            def register_capture(sizes: dict) -> None:
+                _enrollment_manifest.add(
+                    user_facial_dir,
+                    filename,
+                    size_bytes=sizes[str(filepath)],
+                    quality=quality,
+                    encoding=encoding_status
+                )
+                if encoding is not None:
+                    # Clave = nombre de la captura: la actualización periódica no la duplica
+                    self.gallery_index.add(user_id, encoding, key=filename)
+                self.invalidate_user_templates(user_id)
+            
+            retained_files = self._retained_files(frame, user_facial_dir, timestamp)
+            if FACIAL_WRITE_BEHIND and not durable:
+                facial_write_queue.submit(self.storage, files, register_capture, key=str(user_facial_dir))
+                if retained_files:
+                    # Aparte: si fallan no afectan a la captura
+                    facial_write_queue.submit(self.storage, retained_files)
+            else:
+                facial_write_queue.write_now(self.storage, files, register_capture)
+                if retained_files:
+                    try:
+                        facial_write_queue.write_now(self.storage, retained_files)
+                    except OSError as e:
+                        print(f"[WARN] No se pudieron guardar las imágenes de retención de {user_facial_dir}: {e}")
             
             return str(filepath)
         
+        except HTTPException:
+            # Incluye FrameQualityError y el 503 de la cola de escritura
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error guardando imagen: {str(e)}"
             )
     
-    def detect_face_in_image(self, image_data: bytes) -> dict:
+    @staticmethod
+    def _capture_quality(frame: FaceFrame):
+        """Métricas de calidad de la captura para el manifiesto (None si no hay rostro)"""
+        face_location = frame.face_location
+        if face_location is None:
+            return None
+        try:
+            metrics = {**_quality_gate.measure_frame(frame.bgr), **_quality_gate.measure_face(frame.bgr, face_location)}
+        except Exception as e:
+            print(f"[WARN] No se pudo medir la calidad de la captura: {e}")
+            return None
+        return {name: round(value, 4) for name, value in metrics.items()}
+    
+    def _extract_face_chip(self, frame: FaceFrame):
+        """
+        Chip alineado del rostro más grande del frame
+        
+        Returns:
+            Chip RGB de 150x150 o None si no se localizó un rostro
+        """
+        face_location = self._locate_face(frame)
+        if face_location is None:
+            return None
+        # Alinear con los landmarks de 5 puntos de dlib (como face_recognition)
+        face_recognition = self.face_recognition
+        pose_predictor = face_recognition.api.pose_predictor_5_point if face_recognition else None
+        return extract_face_chip(frame.rgb, face_location, pose_predictor)
+    
+    @staticmethod
+    def _encode_jpeg(bgr: np.ndarray, quality: int = 95) -> bytes:
+        ok, encoded = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("No se pudo codificar la imagen como JPEG")
+        return encoded.tobytes()
+    
+    def _encoding_bytes(self, encoding: np.ndarray) -> bytes:
+        """Contenido del .npz del encoding con la versión del modelo"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            encoding=np.asarray(encoding, dtype=np.float64),
+            model_version=np.array(self.embedding_backend.model_version)
+        )
+        return buffer.getvalue()
+    
+    def _retained_files(self, frame: FaceFrame, user_facial_dir: Path, timestamp: str) -> list:
+        """
+        Escena reducida y/o original según la política de retención
+        
+        Se codifican aquí para no mantener el frame completo en la cola de escritura.
+        
+        Returns:
+            Lista de (ruta, bytes) a escribir
+        """
+        files = []
+        try:
+            if FACIAL_CONTEXT_MAX_SIDE:
+                context = FaceFrame.from_image(frame.bgr, FACIAL_CONTEXT_MAX_SIDE)
+                files.append((user_facial_dir / f"context_{timestamp}.jpg", self._encode_jpeg(context.bgr, 80)))
+            
+            if FACIAL_RETAIN_ORIGINAL:
+                suffix = encoded_image_suffix(frame.source) if frame.source else None
+                if suffix:
+                    # Los bytes tal como llegaron, sin recodificar
+                    files.append((user_facial_dir / f"original_{timestamp}{suffix}", frame.source))
+                else:
+                    files.append((user_facial_dir / f"original_{timestamp}.jpg", self._encode_jpeg(frame.bgr)))
+        except Exception as e:
+            print(f"[WARN] No se pudieron preparar las imágenes de retención de {user_facial_dir}: {e}")
+        return files
+    
+    def _user_facial_dir(self, user_id: str) -> Path:
+        """Directorio del usuario en el layout vigente (sharded, o legacy si aún no se migró)"""
+        return self.layout.user_dir(user_id)
+    
+    @staticmethod
+    def _encoding_path(image_path) -> Path:
+        """Ruta del encoding persistido asociado a una imagen registrada"""
+        return Path(image_path).with_suffix(FACE_ENCODING_SUFFIX)
+    
+    def _locate_face(self, frame: FaceFrame):
+        """
+        Ubicación del rostro más grande en formato dlib (top, right, bottom, left)
+        
+        Reutiliza la detección de MediaPipe ya hecha sobre el frame (o la
+        ejecuta una vez) para que face_recognition no tenga que correr su
+        propio detector HOG sobre toda la imagen.
+        
+        Returns:
+            Ubicación del rostro o None si MediaPipe no encontró ninguno
+        """
+        if not frame.face_detection_done:
+            try:
+                self.detect_face_in_image(frame)
+            except FrameQualityError:
+                raise
+            except HTTPException:
+                pass
+        return frame.face_location
+    
+    def _compute_encoding(self, frame: FaceFrame):
+        """
+        Calcula el encoding del rostro más grande de la imagen con el backend configurado
+        
+        Args:
+            frame: Imagen ya decodificada
+            
+        Returns:
+            Encoding del rostro o None si no se encontró rostro
+        """
+        backend = self.embedding_backend
+        face_roi = frame.face_roi(FACIAL_FACE_ROI_MARGIN) if self._locate_face(frame) else None
+        with frame.timed("encoding"):
+            if face_roi is not None:
+                # Solo la región ampliada del rostro llega al modelo
+                roi_rgb, face_location = face_roi
+                return backend.encode(roi_rgb, face_location)
+            # Sin caja de MediaPipe: dejar que el backend busque el rostro (si puede)
+            return backend.encode(frame.rgb)
+    
+    def _save_encoding(self, image_path, encoding: np.ndarray) -> None:
+        """Persiste el encoding junto a la imagen con la versión del modelo"""
+        try:
+            self.storage.write(self._encoding_path(image_path), self._encoding_bytes(encoding))
+        except Exception as e:
+            print(f"[WARN] No se pudo guardar encoding de {image_path}: {e}")
+    
+    def _load_encoding(self, image_path):
+        """
+        Carga el encoding persistido de una imagen registrada
+        
+        Returns:
+            Encoding guardado o None si no existe o fue generado con otro modelo
+        """
+        encoding_path = self._encoding_path(image_path)
+        try:
+            content = self.storage.read(encoding_path)
+        except FileNotFoundError:
+            return None
+        
+        backend = self.embedding_backend
+
+        try:
+            with np.load(io.BytesIO(content), allow_pickle=False) as data:
+                if str(data["model_version"]) != backend.model_version:
+                    return None
+                encoding = data["encoding"]
+        except Exception as e:
+            print(f"[WARN] Encoding corrupto en {encoding_path}: {e}")
+            return None
+        
+        if encoding.shape != (backend.dimension,):
+            return None
+        return encoding
+    
+    def _get_registered_encoding(self, image_path):
+        """
+        Obtiene el encoding de una imagen registrada
+        
+        Usa el encoding persistido y solo recalcula (y vuelve a guardar)
+        cuando falta o es de una versión de modelo distinta.
+        
+        Returns:
+            Encoding del rostro o None si la imagen no tiene rostro
+        """
+        encoding = self._load_encoding(image_path)
+        if encoding is not None:
+            return encoding
+        
+        print(f"[LOG] Recalculando encoding de {image_path}")
+        try:
+            content = self.storage.read(image_path)
+        except FileNotFoundError:
+            return None
+        registered_image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        if registered_image is None:
+            return None
+        if is_face_chip(registered_image):
+            # Chip ya alineado: va directo al modelo, sin detección
+            encoding = self.embedding_backend.encode_chip(cv2.cvtColor(registered_image, cv2.COLOR_BGR2RGB))
+        else:
+            # Imagen registrada antes de guardar chips: frame completo
+            registered_frame = FaceFrame.from_image(registered_image, FACIAL_WORKING_MAX_SIDE)
+            registered_frame.quality_gate = False
+            encoding = self._compute_encoding(registered_frame)
+        if encoding is not None:
+            self._save_encoding(image_path, encoding)
+        _enrollment_manifest.set_encoding_status(image_path, ENCODING_READY if encoding is not None else ENCODING_FAILED)
+        return encoding
+    
+    def _get_user_template(self, user_id: str, image_path):
+        """
+        Encoding de un template del usuario, desde la caché en memoria si está
+        
+        Sin user_id (o con la caché desactivada) se lee como siempre.
+        """
+        if user_id is None or not FACIAL_TEMPLATE_CACHE:
+            return self._get_registered_encoding(image_path)
+        encoding = _template_cache.get(user_id, image_path)
+        if encoding is not None:
+            return encoding
+        encoding = self._get_registered_encoding(image_path)
+        if encoding is not None:
+            _template_cache.put(user_id, image_path, encoding)
+        return encoding
+    
+    def detect_face_in_image(self, image_data: Union[bytes, FaceFrame]) -> dict:
         """
         Detecta si hay un rostro en la imagen
         
+        La caja del rostro detectado queda guardada en el FaceFrame.
+        Antes de MediaPipe el filtro de calidad descarta frames oscuros,
+        sobreexpuestos o sin contraste, y después de detectar descarta
+        rostros borrosos o demasiado pequeños, antes de YOLO y dlib.
+        
         Args:
-            image_data: Datos de imagen en bytes
+            image_data: Datos de imagen en bytes o FaceFrame ya decodificado
             
         Returns:
             Diccionario con información del rostro detectado
             
         Raises:
             HTTPException: Si no se detecta un rostro
+            FrameQualityError: Si el frame no sirve para reconocimiento (motivo para reintentar)
         """
         try:
-            # Convertir bytes a imagen numpy
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            frame = self.decode_frame(image_data)
+            
+            quality_gate = FACIAL_QUALITY_GATE and frame.quality_gate
+            if quality_gate:
+                _quality_gate.check_frame(frame.bgr)
+            
+            # Detectar rostro con el detector reutilizable del hilo actual
+            with frame.timed("detection"):
+                results = face_detector_pool.process(frame.rgb)
             
-            if image is None:
+            frame.face_detection_done = True
+            
+            if not results.detections:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Imagen inválida"
+                    detail="No se detectó rostro en la imagen"
                 )
             
-            # Detectar rostro
-            with self.mp_face_detection.FaceDetection(
-                model_selection=0,
-                min_detection_confidence=0.5
-            ) as face_detection:
-                
-                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                results = face_detection.process(rgb_image)
-                
-                if not results.detections:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="No se detectó rostro en la imagen"
-                    )
-                
-                # Obtener información del primer rostro detectado
-                detection = results.detections[0]
-                h, w, _ = image.shape
-                
-                bboxC = detection.location_data.relative_bounding_box
-                bbox = {
-                    "x": int(bboxC.xmin * w),
-                    "y": int(bboxC.ymin * h),
-                    "width": int(bboxC.width * w),
-                    "height": int(bboxC.height * h),
-                    "confidence": float(detection.score[0])
-                }
-                
-                return {
-                    "face_detected": True,
-                    "bbox": bbox,
-                    "message": "Rostro detectado correctamente"
-                }
+            # Quedarse con el rostro más grande (el más cercano a la cámara)
+            detection = max(
+                results.detections,
+                key=lambda d: d.location_data.relative_bounding_box.width * d.location_data.relative_bounding_box.height
+            )
+            h, w = frame.height, frame.width
+            
+            bboxC = detection.location_data.relative_bounding_box
+            bbox = {
+                "x": int(bboxC.xmin * w),
+                "y": int(bboxC.ymin * h),
+                "width": int(bboxC.width * w),
+                "height": int(bboxC.height * h),
+                "confidence": float(detection.score[0])
+            }
+            frame.face_box = bbox
+            
+            if quality_gate and frame.face_location is not None:
+                _quality_gate.check_face(frame.bgr, frame.face_location)
+            
+            return {
+                "face_detected": True,
+                # Coordenadas en la resolución original de la imagen enviada
+                "bbox": {
+                    "x": frame.to_original(bbox["x"]),
+                    "y": frame.to_original(bbox["y"]),
+                    "width": frame.to_original(bbox["width"]),
+                    "height": frame.to_original(bbox["height"]),
+                    "confidence": bbox["confidence"]
+                },
+                "message": "Rostro detectado correctamente"
+            }
         
         except HTTPException:
             raise
@@ -157,24 +887,39 @@ class FacialRecognitionService:
         """
         Obtiene todas las imágenes faciales de un usuario
         
+        Se leen del manifiesto del usuario (en memoria), sin recorrer el directorio.
+        
         Args:
             user_id: ID del usuario
             
         Returns:
-            Lista de rutas de imágenes
+            Lista de rutas de imágenes, más recientes primero
         """
-        user_facial_dir = self.FACIAL_DATA_DIR / user_id
-        
-        if not user_facial_dir.exists():
-            return []
-        
-        images = []
-        for file in user_facial_dir.glob("face_*.jpg"):
-            images.append(str(file))
+        user_facial_dir = self._user_facial_dir(user_id)
+        # Incluir las capturas del usuario que aún están en la cola de escritura
+        facial_write_queue.wait_pending(str(user_facial_dir))
+        return _enrollment_manifest.paths(user_facial_dir)
+    
+    def get_user_facial_images_page(self, user_id: str, offset: int = 0, limit: int = 20) -> dict:
+        """
+        Página de las capturas de un usuario con sus metadatos
         
-        return sorted(images, reverse=True)  # Más recientes primero
+        Returns:
+            Dict con images (rutas), items (filename, captured_at, size_bytes,
+            quality, encoding), total, offset y limit
+        """
+        user_facial_dir = self._user_facial_dir(user_id)
+        facial_write_queue.wait_pending(str(user_facial_dir))
+        items, total = _enrollment_manifest.page(user_facial_dir, offset, limit)
+        return {
+            "images": [str(user_facial_dir / item["filename"]) for item in items],
+            "items": items,
+            "total": total,
+            "offset": offset,
+            "limit": limit
+        }
     
-    def verify_face(self, image_data: bytes, user_id: str) -> dict:
+    def verify_face(self, image_data: Union[bytes, FaceFrame], user_id: str) -> dict:
         """
         Verifica si el rostro en la imagen coincide con el registrado para un usuario específico
         
@@ -197,8 +942,11 @@ class FacialRecognitionService:
                     detail="No tiene rostro registrado. Por favor, registre su rostro primero en el perfil."
                 )
             
+            # Decodificar una sola vez y compartir el frame entre etapas
+            frame = self.decode_frame(image_data)
+            
             # Detectar rostro en la imagen actual
-            detection_result = self.detect_face_in_image(image_data)
+            detection_result = self.detect_face_in_image(frame)
             
             if not detection_result["face_detected"]:
                 raise HTTPException(
@@ -207,7 +955,7 @@ class FacialRecognitionService:
                 )
             
             # Verificar liveness (evitar fotos/pantallas/dispositivos)
-            liveness_check = self._check_liveness(image_data)
+            liveness_check = self._check_liveness(frame)
             if not liveness_check["is_alive"]:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -215,7 +963,7 @@ class FacialRecognitionService:
                 )
             
             # Comparar con imágenes registradas usando face_recognition
-            verification_result = self._compare_faces(image_data, user_images)
+            verification_result = self._compare_faces(frame, user_images, user_id=user_id)
             
             # ✅ VERIFICACIÓN IMPORTANTE: El rostro debe coincidir con el del usuario
             if verification_result["match"]:
@@ -240,7 +988,7 @@ class FacialRecognitionService:
                 detail=f"Error verificando rostro: {str(e)}"
             )
     
-    def verify_face_for_login(self, image_data: bytes, user_id: str) -> dict:
+    def verify_face_for_login(self, image_data: Union[bytes, FaceFrame], user_id: str) -> dict:
         """
         Verifica el rostro durante el login - Versión estricta
         
@@ -249,6 +997,13 @@ class FacialRecognitionService:
         - Falla si el rostro no pertenece a ese usuario
         - Falla si el usuario no tiene rostro registrado
         
+        La lectura del usuario en Firestore, la liveness (YOLO) y el encoding
+        (dlib) se ejecutan en paralelo; si cualquiera falla se responde de
+        inmediato sin esperar a las demás.
+        
+        Antes de ejecutar cualquier modelo se descartan los reenvíos de un
+        frame idéntico a uno reciente del mismo usuario.
+        
         Args:
             image_data: Datos de imagen a verificar
             user_id: ID del usuario que intenta hacer login
@@ -259,39 +1014,26 @@ class FacialRecognitionService:
             - message: Mensaje descriptivo
             - confidence: Confianza de la verificación
         """
+        # La lectura de Firestore arranca antes de tocar la imagen
+        user_future = _login_stage_executor.submit(self._load_login_user_images, user_id)
+        stage_futures = [user_future]
+        # Frame registrado en el caché de reenvíos y su resultado (None = se olvida)
+        replay_entry = None
+        replay_verified = None
+        replay_detail = None
+        
         try:
-            # Verificar que el usuario tenga facial recognition habilitado
-            from app.database import db
-            user_doc = db.collection("users").document(user_id).get()
-            
-            if not user_doc.exists:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="❌ Usuario no encontrado"
-                )
+            # Decodificar una sola vez y compartir el frame entre etapas
+            frame = self.decode_frame(image_data)
             
-            user_data = user_doc.to_dict()
-            facial_enabled = user_data.get("facial_recognition_enabled", False)
+            if FACIAL_REPLAY_CACHE:
+                # Antes de cualquier modelo: también detecta duplicados concurrentes
+                replay, replay_entry = _replay_cache.begin(user_id, _replay_cache.digest(frame.source))
+                self._reject_replay(user_id, replay)
             
-            # Si el usuario tiene facial recognition habilitado, es OBLIGATORIO verificarlo
-            if not facial_enabled:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="❌ Facial recognition no habilitado para este usuario"
-                )
-            
-            # Obtener imágenes del usuario
-            user_images = self.get_user_facial_images(user_id)
-            
-            if not user_images:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="❌ No hay rostro registrado para este usuario. No se puede completar el login."
-                )
-            
-            # Detectar rostro en la imagen actual
+            # Detectar rostro en la imagen actual (liveness y encoding dependen de la caja)
             try:
-                detection_result = self.detect_face_in_image(image_data)
+                detection_result = self.detect_face_in_image(frame)
                 
                 if not detection_result["face_detected"]:
                     raise HTTPException(
@@ -306,19 +1048,36 @@ class FacialRecognitionService:
                     detail=f"❌ Error detectando rostro: {str(e)}"
                 )
             
-            # Verificar liveness (detección de dispositivos, accesorios, etc.)
-            liveness_check = self._check_liveness(image_data)
-            if not liveness_check["is_alive"]:
-                # ⚠️ SEGURIDAD CRÍTICA: Rechazar si no pasa validación de liveness
-                security_level = liveness_check.get("security_level", "DESCONOCIDO")
-                print(f"[🚫 SEGURIDAD {security_level}] Liveness check fallido: {liveness_check['reason']}")
+            if replay_entry is not None and _replay_cache.matches_faces and frame.face_location is not None:
+                # Mismo rostro (hash de la región del rostro) que un login reciente
+                face_hash = _replay_cache.face_hash(frame.bgr, frame.face_location)
+                self._reject_replay(user_id, _replay_cache.match_face(replay_entry, face_hash))
+            
+            # Liveness y encoding son independientes entre sí y de Firestore
+            liveness_future = _login_stage_executor.submit(self._check_login_liveness, frame)
+            encoding_future = _login_stage_executor.submit(self._compute_encoding, frame)
+            stage_futures += [liveness_future, encoding_future]
+            
+            # Esperar hasta que terminen todas o falle la primera
+            done, _ = wait(stage_futures, return_when=FIRST_EXCEPTION)
+            for future in stage_futures:
+                if future in done and future.exception() is not None:
+                    raise future.exception()
+            
+            user_images = user_future.result()
+            current_encoding = encoding_future.result()
+            
+            if current_encoding is None:
+                print("[ERROR] No se pudo extraer encoding del rostro capturado")
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail=liveness_check['reason']
+                    detail="❌ El rostro no pertenece a este usuario. Acceso denegado."
                 )
             
             # ✅ VERIFICACIÓN CRÍTICA: Comparar rostro SOLO con el usuario específico
-            verification_result = self._compare_faces(image_data, user_images)
+            verification_result = self._compare_faces(
+                frame, user_images, current_encoding=current_encoding, user_id=user_id
+            )
             
             if not verification_result["match"]:
                 # ⚠️ SEGURIDAD: El rostro no coincide - RECHAZAR login
@@ -327,6 +1086,11 @@ class FacialRecognitionService:
                     detail="❌ El rostro no pertenece a este usuario. Acceso denegado."
                 )
             
+            timings = ", ".join(f"{stage}={ms:.1f}" for stage, ms in frame.timings.items())
+            print(f"[LOG] Tiempos por etapa (ms): {timings}")
+            
+            replay_verified = True
+            
             # ✅ ÉXITO: Todo verificado correctamente
             return {
                 "verified": True,
@@ -335,7 +1099,12 @@ class FacialRecognitionService:
                 "user_id": user_id
             }
         
-        except HTTPException:
+        except HTTPException as e:
+            # Recordar por unos segundos los rechazos debidos a la imagen (no los
+            # de Firestore): un reenvío de los mismos bytes recibe la misma respuesta
+            failed_in_firestore = user_future.done() and not user_future.cancelled() and user_future.exception() is e
+            if e.status_code == status.HTTP_401_UNAUTHORIZED and not failed_in_firestore:
+                replay_verified, replay_detail = False, e.detail
             raise
         except Exception as e:
             print(f"[ERROR] verify_face_for_login: {str(e)}")
@@ -343,8 +1112,332 @@ class FacialRecognitionService:
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=f"❌ Error en verificación facial: {str(e)}"
             )
+        finally:
+            if replay_entry is not None:
+                _replay_cache.finish(replay_entry, replay_verified, replay_detail)
+            # Si una etapa falló, las que aún no empezaron no se ejecutan
+            for future in stage_futures:
+                future.cancel()
     
-    def _compare_faces(self, image_data: bytes, registered_images: list) -> dict:
+    def verify_clip_for_login(self, video_data: bytes, user_id: str) -> dict:
+        """
+        Verifica el rostro del login a partir de un clip corto (1-3 s)
+        
+        Del clip solo se procesan FACIAL_CLIP_KEYFRAMES keyframes (el más
+        nítido de cada tramo), así el costo queda acotado sin importar la
+        duración o los FPS. Cada keyframe pasa por detección y filtro de
+        calidad; los útiles se evalúan con YOLO en un solo lote y con el
+        encoding en paralelo, y se comparan con los templates del usuario.
+        
+        Agregación:
+        - Liveness: todos los keyframes útiles deben pasar
+        - Coincidencia: al menos FACIAL_CLIP_MIN_MATCH_RATIO de los keyframes;
+          la confianza sale de la mediana de las distancias
+        - Liveness temporal: el rostro debe cambiar entre keyframes (un frame
+          fijo no puede mostrar movimiento)
+        
+        Args:
+            video_data: Bytes del clip (WebM, MP4, ...)
+            user_id: ID del usuario que intenta hacer login
+            
+        Returns:
+            Dict con verified, message, confidence, user_id, keyframes
+            (resultado por keyframe), temporal_liveness y clip
+        """
+        user_future = _login_stage_executor.submit(self._load_login_user_images, user_id)
+        stage_futures = [user_future]
+        replay_entry = None
+        replay_verified = None
+        replay_detail = None
+        
+        try:
+            if FACIAL_REPLAY_CACHE:
+                # Bytes del clip completo, antes de decodificarlo
+                replay, replay_entry = _replay_cache.begin(user_id, _replay_cache.digest(video_data))
+                self._reject_replay(user_id, replay)
+            
+            sampled = self._sample_clip(video_data)
+            keyframes = sampled["keyframes"]
+            
+            # Detección y filtro de calidad por keyframe: los que fallan se descartan
+            frames = []
+            results = []
+            for keyframe in keyframes:
+                frame = FaceFrame.from_image(keyframe.pop("bgr"), FACIAL_WORKING_MAX_SIDE)
+                result = {
+                    "index": keyframe["index"],
+                    "timestamp_ms": keyframe["timestamp_ms"],
+                    "sharpness": round(keyframe["sharpness"], 1)
+                }
+                results.append(result)
+                try:
+                    self.detect_face_in_image(frame)
+                except HTTPException as e:
+                    result["rejected"] = e.detail
+                    continue
+                if frame.face_location is None:
+                    result["rejected"] = "No se detectó rostro en la imagen"
+                    continue
+                frames.append((frame, result))
+            
+            if not frames:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="❌ No se detectó un rostro válido en el clip."
+                )
+            
+            if replay_entry is not None and _replay_cache.matches_faces:
+                # Rostro del primer keyframe útil contra los logins recientes
+                first_frame = frames[0][0]
+                face_hash = _replay_cache.face_hash(first_frame.bgr, first_frame.face_location)
+                self._reject_replay(user_id, _replay_cache.match_face(replay_entry, face_hash))
+            
+            # Un lote de YOLO para todos los keyframes y encodings en paralelo
+            liveness_future = _login_stage_executor.submit(
+                self._check_clip_liveness, [frame for frame, _ in frames]
+            )
+            encoding_futures = [
+                _login_stage_executor.submit(self._compute_encoding, frame) for frame, _ in frames
+            ]
+            stage_futures += [liveness_future, *encoding_futures]
+            
+            done, _ = wait(stage_futures, return_when=FIRST_EXCEPTION)
+            for future in stage_futures:
+                if future in done and future.exception() is not None:
+                    raise future.exception()
+            
+            user_images = user_future.result()
+            
+            distances = []
+            matched = 0
+            for (frame, result), encoding_future in zip(frames, encoding_futures):
+                encoding = encoding_future.result()
+                if encoding is None:
+                    result["rejected"] = "No se pudo extraer encoding del rostro"
+                    continue
+                comparison = self._compare_faces(frame, user_images, current_encoding=encoding, user_id=user_id)
+                result["match"] = comparison["match"]
+                result["distance"] = round(comparison["distance"], 4)
+                distances.append(comparison["distance"])
+                matched += int(comparison["match"])
+            
+            temporal = face_motion([(frame.bgr, frame.face_location) for frame, _ in frames])
+            temporal["is_static"] = temporal["pairs"] == 0 or temporal["appearance_change"] < FACIAL_CLIP_MIN_MOTION
+            
+            required = max(1, math.ceil(len(keyframes) * FACIAL_CLIP_MIN_MATCH_RATIO))
+            print(f"[LOG] Clip de {user_id}: {len(frames)}/{len(keyframes)} keyframes útiles, "
+                  f"{matched} coincidencias (mínimo {required}), cambio={temporal['appearance_change']}")
+            
+            if matched < required:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="❌ El rostro no pertenece a este usuario. Acceso denegado."
+                )
+            
+            if FACIAL_CLIP_REQUIRE_MOTION and temporal["is_static"]:
+                print(f"[🚫 SEGURIDAD ALTO] Clip sin movimiento para {user_id}: {temporal}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="❌ No se detectó movimiento en el clip (posible foto o video congelado). Grabe de nuevo."
+                )
+            
+            replay_verified = True
+            
+            median_distance = float(np.median(distances))
+            return {
+                "verified": True,
+                "message": "✅ Identidad verificada. Login exitoso.",
+                "confidence": float(max(0, (1 - median_distance) * 100)),
+                "user_id": user_id,
+                "keyframes": results,
+                "temporal_liveness": temporal,
+                "clip": {key: sampled[key] for key in
+                         ("fps", "frames_decoded", "frames_analyzed", "duration_seconds", "sampling_ms")}
+            }
+        
+        except HTTPException as e:
+            failed_in_firestore = user_future.done() and not user_future.cancelled() and user_future.exception() is e
+            if e.status_code == status.HTTP_401_UNAUTHORIZED and not failed_in_firestore:
+                replay_verified, replay_detail = False, e.detail
+            raise
+        except Exception as e:
+            print(f"[ERROR] verify_clip_for_login: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"❌ Error en verificación facial: {str(e)}"
+            )
+        finally:
+            if replay_entry is not None:
+                _replay_cache.finish(replay_entry, replay_verified, replay_detail)
+            for future in stage_futures:
+                future.cancel()
+    
+    @staticmethod
+    def _sample_clip(video_data: bytes) -> dict:
+        """
+        Escribe el clip en un archivo temporal y elige sus keyframes
+        
+        Raises:
+            HTTPException 422: Si el clip no se puede decodificar o es muy corto
+        """
+        # cv2.VideoCapture solo abre rutas: el clip pasa por un archivo temporal
+        fd, video_path = tempfile.mkstemp(suffix=".clip")
+        try:
+            with os.fdopen(fd, "wb") as video_file:
+                video_file.write(video_data)
+            sampled = sample_keyframes(
+                video_path,
+                keyframes=max(1, FACIAL_CLIP_KEYFRAMES),
+                max_seconds=FACIAL_CLIP_MAX_SECONDS,
+                max_analyzed_frames=FACIAL_CLIP_MAX_ANALYZED_FRAMES
+            )
+        finally:
+            os.unlink(video_path)
+        
+        if not sampled["keyframes"]:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="No se pudo decodificar el clip de video"
+            )
+        if sampled["duration_seconds"] < FACIAL_CLIP_MIN_SECONDS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Clip demasiado corto ({sampled['duration_seconds']} s). Grabe al menos {FACIAL_CLIP_MIN_SECONDS} s."
+            )
+        print(f"[LOG] Clip muestreado: {sampled['frames_decoded']} frames, {sampled['frames_analyzed']} medidos, "
+              f"{len(sampled['keyframes'])} keyframes en {sampled['sampling_ms']}ms")
+        return sampled
+    
+    def _check_clip_liveness(self, frames: list) -> None:
+        """
+        Etapa del clip: liveness de todos los keyframes en un solo lote de YOLO
+        
+        Raises:
+            HTTPException 401: Si algún keyframe no pasa la validación
+        """
+        backend = self.liveness_backend
+        if not backend:
+            return
+        
+        try:
+            started = time.perf_counter()
+            detections = backend.predict_batch([frame.bgr for frame in frames])
+            print(f"[LOG] Liveness del clip: {len(frames)} keyframes en {(time.perf_counter() - started) * 1000:.1f}ms")
+            checks = [self._evaluate_liveness(d, frame.width, frame.height) for d, frame in zip(detections, frames)]
+        except Exception as e:
+            print(f"[ERROR] Error en _check_clip_liveness: {e}")
+            checks = [{"is_alive": False, "reason": f"❌ Error en verificación de liveness: {str(e)}",
+                       "security_level": "ERROR"}]
+        
+        for liveness_check in checks:
+            if not liveness_check["is_alive"]:
+                security_level = liveness_check.get("security_level", "DESCONOCIDO")
+                print(f"[🚫 SEGURIDAD {security_level}] Liveness check fallido en el clip: {liveness_check['reason']}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=liveness_check['reason']
+                )
+    
+    @staticmethod
+    def _reject_replay(user_id: str, replay) -> None:
+        """
+        Rechaza un frame ya visto recientemente para el usuario
+        
+        - Bytes idénticos a un frame que inició sesión o que se está
+          verificando: repetición (una cámara real nunca produce dos iguales)
+        - Si FACIAL_REPLAY_FACE_TTL_SECONDS > 0, también el mismo rostro
+          (hash de la región) que un login de hace unos segundos
+        - Bytes idénticos a un frame rechazado hace unos segundos: se
+          responde el mismo rechazo sin ejecutar MediaPipe, YOLO ni dlib
+        
+        Args:
+            replay: Resultado de _replay_cache.begin / match_face (None = no visto)
+        
+        Raises:
+            HTTPException 401: Si el frame es un reenvío
+        """
+        if replay is None:
+            return
+        
+        if replay["state"] == REPLAY_FAILED:
+            print(f"[LOG] Reenvío de un frame rechazado para {user_id}: sin ejecutar modelos")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=replay["detail"]
+            )
+        
+        print(f"[⚠️ REPLAY] Frame repetido para {user_id} (exacto={replay['exact']}, "
+              f"en_verificacion={replay['state'] == REPLAY_PENDING}, distancia={replay['distance']})")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="❌ Imagen repetida. Capture una nueva imagen de su rostro."
+        )
+    
+    def _load_login_user_images(self, user_id: str) -> list:
+        """
+        Etapa de login: valida al usuario en Firestore y obtiene sus imágenes
+        
+        Raises:
+            UserStateError: Si el usuario no existe, no tiene facial
+                recognition habilitado o no tiene rostro registrado (no
+                depende del frame: un flujo de frames termina)
+        """
+        # Verificar que el usuario tenga facial recognition habilitado
+        from app.database import db
+        user_doc = db.collection("users").document(user_id).get()
+        
+        if not user_doc.exists:
+            raise UserStateError(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="❌ Usuario no encontrado"
+            )
+        
+        user_data = user_doc.to_dict()
+        facial_enabled = user_data.get("facial_recognition_enabled", False)
+        
+        # Si el usuario tiene facial recognition habilitado, es OBLIGATORIO verificarlo
+        if not facial_enabled:
+            raise UserStateError(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="❌ Facial recognition no habilitado para este usuario"
+            )
+        
+        # Obtener imágenes del usuario
+        user_images = self.get_user_facial_images(user_id)
+        
+        if not user_images:
+            raise UserStateError(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="❌ No hay rostro registrado para este usuario. No se puede completar el login."
+            )
+        return user_images
+    
+    def _check_login_liveness(self, frame: FaceFrame) -> dict:
+        """
+        Etapa de login: verificación de liveness (dispositivos, accesorios, etc.)
+        
+        Raises:
+            HTTPException: Si el frame no pasa la validación de liveness
+        """
+        liveness_check = self._check_liveness(frame)
+        if not liveness_check["is_alive"]:
+            # ⚠️ SEGURIDAD CRÍTICA: Rechazar si no pasa validación de liveness
+            security_level = liveness_check.get("security_level", "DESCONOCIDO")
+            print(f"[🚫 SEGURIDAD {security_level}] Liveness check fallido: {liveness_check['reason']}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=liveness_check['reason']
+            )
+        return liveness_check
+    
+    def _compare_faces(
+        self,
+        frame: FaceFrame,
+        registered_images: list,
+        current_encoding=None,
+        mode: str = None,
+        user_id: str = None
+    ) -> dict:
         """
         Compara el rostro actual con los rostros registrados del usuario
         
@@ -354,8 +1447,14 @@ class FacialRecognitionService:
         3. El usuario TIENE al menos un rostro registrado (no_images > 0)
         
         Args:
-            image_data: Imagen a verificar en bytes
+            frame: Imagen a verificar ya decodificada
             registered_images: Lista de rutas de imágenes registradas del usuario
+            current_encoding: Encoding del rostro actual si ya fue calculado
+            mode: "first_match" (se detiene en la primera coincidencia, probando
+                primero los templates que más coinciden) o "full_scan" (compara
+                contra todos, para auditoría). Por defecto FACIAL_COMPARE_MODE
+            user_id: Dueño de los templates; con él los encodings se leen de
+                la caché en memoria
             
         Returns:
             Dict con resultado de comparación y confianza
@@ -363,7 +1462,10 @@ class FacialRecognitionService:
             - confidence: Porcentaje de similitud
             - distance: Valor numérico (menor = más similar)
             - matched_images: Cuántas imágenes registradas coincidieron
+            - matched_image: Template con la mejor coincidencia
+            - compared_images: Cuántos templates se compararon
         """
+        mode = mode or FACIAL_COMPARE_MODE
         try:
             # VALIDACIÓN CRÍTICA: Verificar que hay imágenes registradas
             if not registered_images or len(registered_images) == 0:
@@ -376,27 +1478,10 @@ class FacialRecognitionService:
                     "reason": "No hay imágenes registradas para comparar"
                 }
             
-            # Convertir bytes a imagen
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                print("[ERROR] Imagen capturada es inválida")
-                return {
-                    "match": False,
-                    "confidence": 0,
-                    "distance": 1.0,
-                    "matched_images": 0,
-                    "reason": "Imagen inválida"
-                }
-            
-            # Convertir BGR a RGB para face_recognition
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Obtener encoding del rostro actual
+            # Obtener encoding del rostro actual (con la caja de MediaPipe)
             try:
-                current_face_encodings = face_recognition.face_encodings(image_rgb)
-                if not current_face_encodings:
+                current_face_encoding = current_encoding if current_encoding is not None else self._compute_encoding(frame)
+                if current_face_encoding is None:
                     print("[ERROR] No se pudo extraer encoding del rostro capturado")
                     return {
                         "match": False,
@@ -405,8 +1490,7 @@ class FacialRecognitionService:
                         "matched_images": 0,
                         "reason": "No se pudo extraer características del rostro"
                     }
-                
-                current_face_encoding = current_face_encodings[0]
+
             except Exception as e:
                 print(f"[ERROR] Error obteniendo encoding del rostro actual: {e}")
                 return {
@@ -417,35 +1501,44 @@ class FacialRecognitionService:
                     "reason": f"Error procesando rostro: {str(e)}"
                 }
             
-            # COMPARACIÓN ESTRICTA: Comparar con CADA imagen registrada
+            # COMPARACIÓN ESTRICTA: Comparar con las imágenes registradas
+            # (todas en full_scan; hasta la primera coincidencia en first_match)
             best_match = False
             best_distance = 1.0
             matched_count = 0
             match_details = []
             
-            # Threshold para considerar un match: 0.55 (más estricto que 0.6)
-            DISTANCE_THRESHOLD = 0.55
+            # Threshold para considerar un match: lo declara el backend de encoding
+            # (0.55 con dlib, más estricto que el 0.6 habitual)
+            backend = self.embedding_backend
+            DISTANCE_THRESHOLD = backend.threshold
             CONFIDENCE_MIN = 35  # Confianza mínima requerida (%)
             
-            print(f"[LOG] Comparando rostro capturado con {len(registered_images)} imágenes registradas")
+            best_image = None
+            compared_count = 0
+            
+            if mode == COMPARE_MODE_FIRST_MATCH:
+                # Probar primero los templates que más han coincidido
+                registered_images = _template_stats.order(registered_images)
+            
+            print(f"[LOG] Comparando rostro capturado con {len(registered_images)} imágenes registradas (modo {mode})")
             
             for idx, registered_image_path in enumerate(registered_images):
                 try:
-                    # Cargar imagen registrada
-                    registered_image = face_recognition.load_image_file(registered_image_path)
-                    registered_face_encodings = face_recognition.face_encodings(registered_image)
+                    # Encoding en caché o persistido (solo se recalcula si falta)
+                    registered_face_encoding = self._get_user_template(user_id, registered_image_path)
                     
-                    if not registered_face_encodings:
+                    if registered_face_encoding is None:
                         print(f"[WARN] No se pudo extraer encoding de imagen registrada #{idx + 1}")
                         continue
                     
-                    registered_face_encoding = registered_face_encodings[0]
+                    compared_count += 1
                     
-                    # Comparar faces usando distancia euclidiana
-                    distance = face_recognition.face_distance(
-                        [registered_face_encoding],
+                    # Comparar faces con la métrica del backend (euclidiana con dlib)
+                    distance = float(backend.distance(
+                        np.asarray([registered_face_encoding]),
                         current_face_encoding
-                    )[0]
+                    )[0])
                     
                     # Calcular confianza
                     confidence = max(0, (1 - distance) * 100)
@@ -463,8 +1556,13 @@ class FacialRecognitionService:
                     if distance < DISTANCE_THRESHOLD and confidence >= CONFIDENCE_MIN:
                         best_match = True
                         matched_count += 1
+                        if distance < best_distance or best_image is None:
+                            best_image = registered_image_path
                         best_distance = min(best_distance, distance)
                         print(f"[✓] COINCIDENCIA ENCONTRADA en imagen #{idx + 1} con confidence {confidence:.1f}%")
+                        
+                        if mode == COMPARE_MODE_FIRST_MATCH:
+                            break
                     
                 except Exception as e:
                     print(f"[ERROR] Error procesando imagen registrada #{idx + 1}: {e}")
@@ -474,11 +1572,15 @@ class FacialRecognitionService:
             if best_match and matched_count > 0:
                 confidence = max(0, (1 - best_distance) * 100)
                 print(f"[✓✓✓] VERIFICACIÓN EXITOSA: {matched_count}/{len(registered_images)} imágenes coincidieron")
+                # Recordar el template para probarlo primero en el próximo login
+                _template_stats.record_match(best_image)
                 return {
                     "match": True,
                     "confidence": float(confidence),
                     "distance": float(best_distance),
                     "matched_images": matched_count,
+                    "matched_image": str(best_image),
+                    "compared_images": compared_count,
                     "total_images": len(registered_images),
                     "reason": f"Rostro coincide con {matched_count}/{len(registered_images)} imágenes registradas"
                 }
@@ -489,6 +1591,7 @@ class FacialRecognitionService:
                     "confidence": 0,
                     "distance": float(best_distance),
                     "matched_images": 0,
+                    "compared_images": compared_count,
                     "total_images": len(registered_images),
                     "reason": f"El rostro no coincide con ninguna de las {len(registered_images)} imágenes registradas",
                     "details": match_details  # Para debugging
@@ -504,7 +1607,7 @@ class FacialRecognitionService:
                 "reason": f"Error crítico en comparación: {str(e)}"
             }
     
-    def _check_liveness(self, image_data: bytes) -> dict:
+    def _check_liveness(self, frame: FaceFrame) -> dict:
         """
         Verifica que sea una persona viva (no una foto/pantalla/dispositivo)
         
@@ -515,7 +1618,7 @@ class FacialRecognitionService:
         4. Rechaza si hay objetos adicionales cerca del rostro
         
         Args:
-            image_data: Imagen a verificar en bytes
+            frame: Imagen a verificar ya decodificada
             
         Returns:
             Dict con resultado de verificación
@@ -524,7 +1627,8 @@ class FacialRecognitionService:
             - devices_detected: Dispositivos encontrados (si los hay)
         """
         try:
-            if not self.yolo_model:
+            backend = self.liveness_backend
+            if not backend:
                 # Si YOLO no está disponible, permitir de todos modos
                 return {
                     "is_alive": True,
@@ -532,216 +1636,218 @@ class FacialRecognitionService:
                     "devices_detected": []
                 }
             
-            # Convertir bytes a imagen
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                return {
-                    "is_alive": False, 
-                    "reason": "❌ Imagen inválida",
-                    "devices_detected": []
-                }
-            
-            # Ejecutar YOLO para detección de objetos
-            results = self.yolo_model(image, verbose=False)
+            # Ejecutar YOLO para detección de objetos (agrupado con otras
+            # peticiones concurrentes si el micro-batching está activo)
+            # La liveness es la única etapa que necesita la escena completa
+            with frame.timed("liveness"):
+                if FACIAL_LIVENESS_BATCHING:
+                    detections = _liveness_batcher.submit(frame.bgr)
+                else:
+                    detections = backend.predict_batch([frame.bgr])[0]
             
-            if not results or len(results) == 0:
-                return {
-                    "is_alive": True, 
-                    "reason": "✅ Sin objetos sospechosos detectados",
-                    "devices_detected": []
-                }
-            
-            # ============================================
-            # CLASES COCO - Mapeo de dispositivos peligrosos
-            # ============================================
-            # Dispositivos donde se podría mostrar un rostro (MÁS PELIGROSO)
-            device_classes = {
-                62: "laptop",        # Pantalla de laptop
-                63: "tv",            # Televisor
-                65: "remote",        # Control remoto (indica pantalla cercana)
-                73: "book",          # Podría ser un libro/papel con foto
-                74: "cell phone",    # Celular/teléfono
-            }
-            
-            # Accesorios que ocultan/alteran el rostro
-            accessory_classes = {
-                0: "person",         # Persona - puede usarse para bloquear vista
-                27: "tie",           # Corbata cerca del rostro
-                28: "cake",          # Objeto frente al rostro
-                29: "couch",         # Indicativo de ambiente controlado
-                30: "potted plant",  # Objeto grande que podría ocluir
-            }
-            
-            # Accesorios PERMITIDOS (lentes, gafas no son problema)
-            allowed_accessories = {
-                37: "glasses",       # ✅ PERMITIDO - Lentes/gafas normales
-                38: "sunglasses",    # ✅ PERMITIDO - Gafas de sol (levemente sospechosas)
-                39: "goggles",       # ✅ PERMITIDO - Gafas de protección
+            return self._evaluate_liveness(detections, frame.width, frame.height)
+        
+        except Exception as e:
+            print(f"[ERROR] Error en _check_liveness: {e}")
+            # En caso de error, RECHAZAR por seguridad
+            return {
+                "is_alive": False,
+                "reason": f"❌ Error en verificación de liveness: {str(e)}",
+                "devices_detected": [],
+                "security_level": "ERROR"
             }
+    
+    @staticmethod
+    def _evaluate_liveness(detections, img_width: int, img_height: int) -> dict:
+        """
+        Lógica de decisión de liveness sobre las detecciones de YOLO
+        
+        Es la misma para cualquier backend (torch u ONNX).
+        
+        Args:
+            detections: Arreglo (N, 6) con [x1, y1, x2, y2, confianza, clase]
+                en coordenadas de la imagen
+            img_width: Ancho de la imagen analizada
+            img_height: Alto de la imagen analizada
             
-            # Objetos sospechosos adicionales
-            suspicious_classes = {
-                34: "bottle",        # Botellas para ocultar rostro
-                35: "wine glass",    # Cristalería
-                36: "cup",           # Taza/vaso
-                42: "spoon",         # Utensilio
-                43: "bowl",          # Recipiente
-                44: "banana",        # Objeto para ocluir
-                45: "apple",         # Objeto para ocluir
-                47: "sandwich",      # Objeto frente rostro
-                48: "orange",        # Objeto para ocluir
-                50: "pizza",         # Objeto grande
-                51: "donut",         # Objeto frente rostro
-                52: "cake",          # Objeto grande
+        Returns:
+            Dict con resultado de verificación (ver _check_liveness)
+        """
+        # ============================================
+        # CLASES COCO - Mapeo de dispositivos peligrosos
+        # ============================================
+        # Dispositivos donde se podría mostrar un rostro (MÁS PELIGROSO)
+        device_classes = {
+            62: "laptop",        # Pantalla de laptop
+            63: "tv",            # Televisor
+            65: "remote",        # Control remoto (indica pantalla cercana)
+            73: "book",          # Podría ser un libro/papel con foto
+            74: "cell phone",    # Celular/teléfono
+        }
+        
+        # Accesorios que ocultan/alteran el rostro
+        accessory_classes = {
+            0: "person",         # Persona - puede usarse para bloquear vista
+            27: "tie",           # Corbata cerca del rostro
+            28: "cake",          # Objeto frente al rostro
+            29: "couch",         # Indicativo de ambiente controlado
+            30: "potted plant",  # Objeto grande que podría ocluir
+        }
+        
+        # Accesorios PERMITIDOS (lentes, gafas no son problema)
+        allowed_accessories = {
+            37: "glasses",       # ✅ PERMITIDO - Lentes/gafas normales
+            38: "sunglasses",    # ✅ PERMITIDO - Gafas de sol (levemente sospechosas)
+            39: "goggles",       # ✅ PERMITIDO - Gafas de protección
+        }
+        
+        # Objetos sospechosos adicionales
+        suspicious_classes = {
+            34: "bottle",        # Botellas para ocultar rostro
+            35: "wine glass",    # Cristalería
+            36: "cup",           # Taza/vaso
+            42: "spoon",         # Utensilio
+            43: "bowl",          # Recipiente
+            44: "banana",        # Objeto para ocluir
+            45: "apple",         # Objeto para ocluir
+            47: "sandwich",      # Objeto frente rostro
+            48: "orange",        # Objeto para ocluir
+            50: "pizza",         # Objeto grande
+            51: "donut",         # Objeto frente rostro
+            52: "cake",          # Objeto grande
+        }
+        
+        # Máscara facial explícita (muy peligrosa)
+        mask_classes = {
+            0: "mask",           # Máscara (si el modelo la detecta)
+        }
+        
+        detected_devices = []
+        detected_accessories = []
+        detected_suspicious = []
+        detected_allowed_accessories = []  # Lentes, gafas (permitidas)
+        device_detections = []  # Para guardar detalles de dispositivos
+        
+        print("[LOG] ========== ANÁLISIS YOLO ==========")
+        
+        for x1, y1, x2, y2, confidence, class_id in detections:
+            class_id = int(class_id)
+            confidence = float(confidence)
+            
+            # Obtener coordenadas del bounding box
+            box_width = float(x2 - x1)
+            box_height = float(y2 - y1)
+            box_area = box_width * box_height
+            
+            # Imagen total
+            img_area = img_height * img_width
+            box_percentage = (box_area / img_area) * 100
+            
+            # Verificar si son LENTES PERMITIDOS
+            if class_id in allowed_accessories:
+                accessory_name = allowed_accessories[class_id]
+                detected_allowed_accessories.append(accessory_name)
+                print(f"[✅ PERMITIDO] {accessory_name.upper()} detectado - Aceptado")
+            
+            # Verificar si es un DISPOSITIVO (critial)
+            elif class_id in device_classes:
+                device_name = device_classes[class_id]
+                detected_devices.append(device_name)
+                device_detections.append({
+                    "type": device_name,
+                    "confidence": float(confidence),
+                    "size_percentage": round(box_percentage, 2),
+                    "position": {
+                        "x1": float(x1), "y1": float(y1),
+                        "x2": float(x2), "y2": float(y2)
+                    }
+                })
+                print(f"[⚠️ DEVICE] {device_name.upper()} detectado con {confidence:.2%} confianza (ocupa {box_percentage:.1f}% de la imagen)")
+            
+            # Verificar accesorios
+            elif class_id in accessory_classes:
+                accessory_name = accessory_classes[class_id]
+                detected_accessories.append(accessory_name)
+                print(f"[⚠️ ACCESORIO] {accessory_name} detectado")
+            
+            # Verificar objetos sospechosos
+            elif class_id in suspicious_classes:
+                suspicious_name = suspicious_classes[class_id]
+                detected_suspicious.append(suspicious_name)
+                print(f"[⚠️ SOSPECHOSO] {suspicious_name} detectado")
+
+        print("[LOG] ====================================")
+        
+        # ============================================
+        # LÓGICA DE DECISIÓN - RECHAZO ESTRICTO
+        # ============================================
+        
+        # 🚫 RECHAZAR SI: Se detecta dispositivo (pantalla, TV, teléfono, tablet)
+        if detected_devices:
+            devices_str = ", ".join(detected_devices)
+            print(f"[❌ RECHAZO] Se detectó dispositivo de video: {devices_str}")
+            return {
+                "is_alive": False,
+                "reason": f"❌ VERIFICACIÓN FALLIDA: Se detectó un dispositivo de pantalla ({devices_str}). El rostro debe presentarse directamente, no a través de una pantalla, teléfono, tablet o monitor.",
+                "devices_detected": device_detections,
+                "security_level": "CRÍTICO"
             }
-            
-            # Máscara facial explícita (muy peligrosa)
-            mask_classes = {
-                0: "mask",           # Máscara (si el modelo la detecta)
+        
+        # 🚫 RECHAZAR SI: Hay múltiples accesorios sospechosos (NO incluye lentes)
+        if len(detected_accessories) >= 2:
+            accessories_str = ", ".join(detected_accessories)
+            print(f"[❌ RECHAZO] Múltiples accesorios detectados: {accessories_str}")
+            return {
+                "is_alive": False,
+                "reason": f"❌ VERIFICACIÓN FALLIDA: Demasiados accesorios/objetos detectados ({accessories_str}). Presente su rostro sin accesorios adicionales.",
+                "devices_detected": [],
+                "security_level": "ALTO"
             }
-            
-            detected_devices = []
-            detected_accessories = []
-            detected_suspicious = []
-            detected_allowed_accessories = []  # Lentes, gafas (permitidas)
-            device_detections = []  # Para guardar detalles de dispositivos
-            
-            print("[LOG] ========== ANÁLISIS YOLO ==========")
-            
-            for result in results:
-                if result.boxes:
-                    for box in result.boxes:
-                        class_id = int(box.cls[0])
-                        confidence = float(box.conf[0])
-                        
-                        # Obtener coordenadas del bounding box
-                        x1, y1, x2, y2 = box.xyxy[0]
-                        box_width = float(x2 - x1)
-                        box_height = float(y2 - y1)
-                        box_area = box_width * box_height
-                        
-                        # Imagen total
-                        img_height, img_width = image.shape[:2]
-                        img_area = img_height * img_width
-                        box_percentage = (box_area / img_area) * 100
-                        
-                        # Verificar si son LENTES PERMITIDOS
-                        if class_id in allowed_accessories:
-                            accessory_name = allowed_accessories[class_id]
-                            detected_allowed_accessories.append(accessory_name)
-                            print(f"[✅ PERMITIDO] {accessory_name.upper()} detectado - Aceptado")
-                        
-                        # Verificar si es un DISPOSITIVO (critial)
-                        elif class_id in device_classes:
-                            device_name = device_classes[class_id]
-                            detected_devices.append(device_name)
-                            device_detections.append({
-                                "type": device_name,
-                                "confidence": float(confidence),
-                                "size_percentage": round(box_percentage, 2),
-                                "position": {
-                                    "x1": float(x1), "y1": float(y1),
-                                    "x2": float(x2), "y2": float(y2)
-                                }
-                            })
-                            print(f"[⚠️ DEVICE] {device_name.upper()} detectado con {confidence:.2%} confianza (ocupa {box_percentage:.1f}% de la imagen)")
-                        
-                        # Verificar accesorios
-                        elif class_id in accessory_classes:
-                            accessory_name = accessory_classes[class_id]
-                            detected_accessories.append(accessory_name)
-                            print(f"[⚠️ ACCESORIO] {accessory_name} detectado")
-                        
-                        # Verificar objetos sospechosos
-                        elif class_id in suspicious_classes:
-                            suspicious_name = suspicious_classes[class_id]
-                            detected_suspicious.append(suspicious_name)
-                            print(f"[⚠️ SOSPECHOSO] {suspicious_name} detectado")
-            
-            print("[LOG] ====================================")
-            
-            # ============================================
-            # LÓGICA DE DECISIÓN - RECHAZO ESTRICTO
-            # ============================================
-            
-            # 🚫 RECHAZAR SI: Se detecta dispositivo (pantalla, TV, teléfono, tablet)
-            if detected_devices:
-                devices_str = ", ".join(detected_devices)
-                print(f"[❌ RECHAZO] Se detectó dispositivo de video: {devices_str}")
-                return {
-                    "is_alive": False,
-                    "reason": f"❌ VERIFICACIÓN FALLIDA: Se detectó un dispositivo de pantalla ({devices_str}). El rostro debe presentarse directamente, no a través de una pantalla, teléfono, tablet o monitor.",
-                    "devices_detected": device_detections,
-                    "security_level": "CRÍTICO"
-                }
-            
-            # 🚫 RECHAZAR SI: Hay múltiples accesorios sospechosos (NO incluye lentes)
-            if len(detected_accessories) >= 2:
-                accessories_str = ", ".join(detected_accessories)
-                print(f"[❌ RECHAZO] Múltiples accesorios detectados: {accessories_str}")
-                return {
-                    "is_alive": False,
-                    "reason": f"❌ VERIFICACIÓN FALLIDA: Demasiados accesorios/objetos detectados ({accessories_str}). Presente su rostro sin accesorios adicionales.",
-                    "devices_detected": [],
-                    "security_level": "ALTO"
-                }
-            
-            # ✅ PERMITIR SI: Solo hay lentes/gafas (sin otros accesorios)
-            if detected_allowed_accessories and not detected_accessories and not detected_suspicious:
-                glasses_str = ", ".join(detected_allowed_accessories)
-                print(f"[✅ PERMITIDO] Rostro con lentes/gafas: {glasses_str}")
-                return {
-                    "is_alive": True,
-                    "reason": f"✅ Verificación de liveness exitosa. Rostro con {glasses_str} aceptado.",
-                    "devices_detected": [],
-                    "security_level": "BAJO",
-                    "note": f"Usuario lleva {glasses_str}"
-                }
-            
-            # ⚠️ ADVERTENCIA SI: Hay objetos sospechosos O lentes + otros objetos
-            if detected_suspicious or detected_accessories:
-                warnings = detected_suspicious + detected_accessories
-                # Si hay lentes pero también otros objetos
-                if detected_allowed_accessories:
-                    warnings.extend(detected_allowed_accessories)
-                warnings_str = ", ".join(warnings)
-                print(f"[⚠️ ADVERTENCIA] Objetos detectados: {warnings_str}")
-                return {
-                    "is_alive": True,  # Permitir, pero registrar
-                    "reason": f"⚠️ ADVERTENCIA: Se detectaron objetos ({warnings_str}). Imagen aceptada pero verificada con objetos presentes.",
-                    "devices_detected": [],
-                    "security_level": "MEDIO",
-                    "warnings": warnings
-                }
-            
-            # ✅ ACEPTAR: Todo está bien
+        
+        # ✅ PERMITIR SI: Solo hay lentes/gafas (sin otros accesorios)
+        if detected_allowed_accessories and not detected_accessories and not detected_suspicious:
+            glasses_str = ", ".join(detected_allowed_accessories)
+            print(f"[✅ PERMITIDO] Rostro con lentes/gafas: {glasses_str}")
             return {
                 "is_alive": True,
-                "reason": "✅ Verificación de liveness exitosa. Rostro válido detectado.",
+                "reason": f"✅ Verificación de liveness exitosa. Rostro con {glasses_str} aceptado.",
                 "devices_detected": [],
-                "security_level": "BAJO"
+                "security_level": "BAJO",
+                "note": f"Usuario lleva {glasses_str}"
             }
         
-        except Exception as e:
-            print(f"[ERROR] Error en _check_liveness: {e}")
-            # En caso de error, RECHAZAR por seguridad
+        # ⚠️ ADVERTENCIA SI: Hay objetos sospechosos O lentes + otros objetos
+        if detected_suspicious or detected_accessories:
+            warnings = detected_suspicious + detected_accessories
+            # Si hay lentes pero también otros objetos
+            if detected_allowed_accessories:
+                warnings.extend(detected_allowed_accessories)
+            warnings_str = ", ".join(warnings)
+            print(f"[⚠️ ADVERTENCIA] Objetos detectados: {warnings_str}")
             return {
-                "is_alive": False,
-                "reason": f"❌ Error en verificación de liveness: {str(e)}",
+                "is_alive": True,  # Permitir, pero registrar
+                "reason": f"⚠️ ADVERTENCIA: Se detectaron objetos ({warnings_str}). Imagen aceptada pero verificada con objetos presentes.",
                 "devices_detected": [],
-                "security_level": "ERROR"
+                "security_level": "MEDIO",
+                "warnings": warnings
             }
+        
+        # ✅ ACEPTAR: Todo está bien
+        return {
+            "is_alive": True,
+            "reason": "✅ Verificación de liveness exitosa. Rostro válido detectado.",
+            "devices_detected": [],
+            "security_level": "BAJO"
+        }
     
-    def check_facial_uniqueness(self, image_data: bytes, exclude_user_id: str = None) -> dict:
+    def check_facial_uniqueness(self, image_data: Union[bytes, FaceFrame], exclude_user_id: str = None) -> dict:
         """
         Verifica si un rostro ya existe en el sistema (en otros usuarios)
         
         Se usa durante el registro para asegurar que cada rostro sea único.
         
         Args:
-            image_data: Imagen a verificar en bytes
+            image_data: Imagen a verificar en bytes o FaceFrame ya decodificado
             exclude_user_id: ID del usuario a excluir (para no compararse a sí mismo)
             
         Returns:
@@ -761,25 +1867,16 @@ class FacialRecognitionService:
                     "confidence": 0
                 }
             
-            # Convertir bytes a imagen para obtener encoding
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Imagen inválida"
-                )
-            
-            # Convertir BGR a RGB para face_recognition
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            # Decodificar imagen para obtener encoding
+            frame = self.decode_frame(image_data)
             
             # Obtener encoding del rostro actual
             try:
-                current_face_encodings = face_recognition.face_encodings(image_rgb)
-                if not current_face_encodings:
+                current_encoding = self._compute_encoding(frame)
+                if current_encoding is None:
                     raise Exception("No se detectó un rostro válido en la imagen")
-                current_encoding = current_face_encodings[0]
+            except FrameQualityError:
+                raise
             except Exception as e:
                 return {
                     "is_unique": False,
@@ -788,53 +1885,23 @@ class FacialRecognitionService:
                     "confidence": 0
                 }
             
-            # Recorrer todos los usuarios registrados
-            for user_dir in self.FACIAL_DATA_DIR.iterdir():
-                if not user_dir.is_dir():
-                    continue
-                
-                user_id = user_dir.name
-                
-                # Excluir el usuario actual si se especifica
-                if exclude_user_id and user_id == exclude_user_id:
-                    continue
-                
-                # Obtener imágenes del usuario
-                user_images = list(user_dir.glob("face_*.jpg"))
-                
-                if not user_images:
-                    continue
-                
-                # Comparar con la primera imagen del usuario
-                # (o todas si quieres ser más exhaustivo)
-                registered_image_path = user_images[0]
-                
-                try:
-                    registered_image = face_recognition.load_image_file(str(registered_image_path))
-                    registered_encodings = face_recognition.face_encodings(registered_image)
-                    
-                    if not registered_encodings:
-                        continue
-                    
-                    registered_encoding = registered_encodings[0]
-                    
-                    # Comparar distancia euclidiana
-                    distance = np.linalg.norm(current_encoding - registered_encoding)
-                    
-                    # Si la distancia es muy pequeña (< 0.6), es una coincidencia
-                    DISTANCE_THRESHOLD = 0.6
-                    if distance < DISTANCE_THRESHOLD:
-                        confidence = max(0, (1 - distance) * 100)
-                        return {
-                            "is_unique": False,
-                            "message": f"El rostro ya está registrado por otro usuario",
-                            "matched_user_id": user_id,
-                            "confidence": round(confidence, 2)
-                        }
-                
-                except Exception as e:
-                    print(f"[WARN] Error comparando con usuario {user_id}: {str(e)}")
-                    continue
+            # Búsqueda vectorizada contra todos los encodings registrados
+            matched_user_id, distance = self._ensure_gallery_index().search(
+                current_encoding,
+                exclude_user_id=exclude_user_id
+            )
+            backend = self.embedding_backend
+            distance = backend.from_euclidean(distance)
+            
+            # Si la distancia es muy pequeña (< 0.6 con dlib), es una coincidencia
+            if matched_user_id is not None and distance < backend.uniqueness_threshold:
+                confidence = max(0, (1 - distance) * 100)
+                return {
+                    "is_unique": False,
+                    "message": f"El rostro ya está registrado por otro usuario",
+                    "matched_user_id": matched_user_id,
+                    "confidence": round(confidence, 2)
+                }
             
             # Si llegamos aquí, el rostro es único
             return {
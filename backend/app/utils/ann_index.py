@@ -0,0 +1,118 @@
+import numpy as np
+from typing import Optional
+
+
+class IVFIndex:
+    """
+    Índice aproximado IVF (inverted file) sobre encodings faciales
+
+    Agrupa los encodings en `n_lists` celdas con k-means y, en cada consulta,
+    solo revisa las `n_probe` celdas con centroide más cercano. Más celdas
+    revisadas = más recall y más latencia.
+
+    El índice solo devuelve filas candidatas; las distancias finales se
+    calculan de forma exacta sobre la matriz original (re-rank), por lo que
+    los umbrales de distancia conservan su significado.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 128,
+        n_lists: int = 0,
+        n_probe: int = 16,
+        kmeans_iterations: int = 10,
+        train_sample_size: int = 65536,
+        seed: int = 0
+    ):
+        self.dimension = dimension
+        self.n_lists = n_lists  # 0 = automático (~sqrt(N))
+        self.n_probe = n_probe
+        self.kmeans_iterations = kmeans_iterations
+        self.train_sample_size = train_sample_size
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._centroid_sq_norms: Optional[np.ndarray] = None
+        self._lists = []
+        self.trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _nearest_centroids(self, vectors: np.ndarray, k: int = 1) -> np.ndarray:
+        """Índices de los k centroides más cercanos a cada vector"""
+        scores = self._centroid_sq_norms[None, :] - 2.0 * (vectors @ self.centroids.T)
+        if k == 1:
+            return np.argmin(scores, axis=1)[:, None]
+        k = min(k, scores.shape[1])
+        nearest = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        return nearest
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 16384) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            assignments[start:start + batch_size] = self._nearest_centroids(batch)[:, 0]
+        return assignments
+
+    def _train(self, vectors: np.ndarray) -> None:
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+
+        if len(vectors) > self.train_sample_size:
+            sample = vectors[rng.choice(len(vectors), self.train_sample_size, replace=False)]
+        else:
+            sample = vectors
+
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            self._centroid_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            non_empty = counts > 0
+            self.centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+            # Las celdas vacías se reinician con puntos aleatorios
+            empty = np.flatnonzero(~non_empty)
+            if len(empty):
+                self.centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+
+        self._centroid_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+
+    def build(self, vectors: np.ndarray) -> None:
+        """
+        Entrena los centroides y asigna todas las filas a su celda
+
+        Args:
+            vectors: Matriz (N x dimension); la fila i queda indexada como i
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._train(vectors)
+        assignments = self._assign(vectors)
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        self.trained_size = len(vectors)
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """Agrega una fila nueva a la celda de su centroide más cercano"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, self.dimension)
+        cell = int(self._nearest_centroids(vector)[0, 0])
+        self._lists[cell] = np.append(self._lists[cell], np.int64(row))
+
+    def candidates(self, probe: np.ndarray, n_probe: Optional[int] = None) -> np.ndarray:
+        """
+        Filas de las celdas más cercanas al vector de consulta
+
+        Args:
+            probe: Encoding de consulta
+            n_probe: Celdas a revisar (por defecto self.n_probe)
+
+        Returns:
+            Arreglo de índices de fila candidatas
+        """
+        probe = np.asarray(probe, dtype=np.float32).reshape(1, self.dimension)
+        cells = self._nearest_centroids(probe, n_probe or self.n_probe)[0]
+        return np.concatenate([self._lists[cell] for cell in cells])
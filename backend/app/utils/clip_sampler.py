@@ -0,0 +1,194 @@
+import math
+import time
+
+import cv2
+import numpy as np
+
+
+# Lado de la miniatura en gris sobre la que se mide la nitidez de cada frame
+SHARPNESS_THUMBNAIL_SIDE = 160
+# Lado del recorte normalizado del rostro para medir el cambio entre keyframes
+MOTION_FACE_SIDE = 64
+# Margen alrededor de la caja al recortar: la alineación necesita contexto
+MOTION_CROP_MARGIN = 0.25
+# Suavizado del recorte: elimina ruido del sensor y bloques de compresión
+MOTION_BLUR_SIGMA = 1.5
+# Píxeles del borde del recorte alineado que no se comparan (relleno del warp)
+MOTION_BORDER = 8
+# Iteraciones y tolerancia de la alineación ECC entre keyframes
+MOTION_ECC_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 100, 1e-5)
+# FPS supuestos si el contenedor no los informa (típico en WebM del navegador)
+DEFAULT_FPS = 30.0
+
+
+def frame_sharpness(bgr: np.ndarray) -> float:
+    """Varianza del Laplaciano sobre una miniatura en gris (misma métrica que el filtro de calidad)"""
+    height, width = bgr.shape[:2]
+    scale = SHARPNESS_THUMBNAIL_SIDE / max(height, width)
+    if scale < 1:
+        bgr = cv2.resize(bgr, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def sample_keyframes(
+    video_path: str,
+    keyframes: int = 3,
+    max_seconds: float = 3.0,
+    max_analyzed_frames: int = 30
+) -> dict:
+    """
+    Decodifica un clip y elige los keyframes más nítidos
+
+    El clip se divide en `keyframes` tramos de igual duración y de cada uno
+    se conserva el frame más nítido, así los keyframes quedan repartidos en
+    el tiempo (necesario para medir movimiento). Solo se convierten a color
+    y se miden `max_analyzed_frames` frames repartidos uniformemente; del
+    resto solo se avanza con `grab()`. En memoria nunca hay más de
+    `keyframes` frames.
+
+    Args:
+        video_path: Ruta del clip (cv2.VideoCapture no lee desde memoria)
+        keyframes: Cantidad de keyframes a devolver como máximo
+        max_seconds: Se ignora lo que pase de esta duración
+        max_analyzed_frames: Frames medidos como máximo
+
+    Returns:
+        Dict con "keyframes" (lista ordenada en el tiempo de dicts con
+        index, timestamp_ms, sharpness y bgr), "fps", "frames_decoded",
+        "frames_analyzed", "duration_seconds" y "sampling_ms"
+    """
+    started = time.perf_counter()
+    capture = cv2.VideoCapture(video_path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not fps or fps <= 0 or fps > 240:
+            fps = DEFAULT_FPS
+        max_frames = max(1, int(max_seconds * fps))
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        total = min(frame_count, max_frames) if frame_count > 0 else max_frames
+        stride = max(1, math.ceil(total / max(1, max_analyzed_frames)))
+
+        best = {}
+        decoded = 0
+        analyzed = 0
+        while decoded < max_frames and capture.isOpened():
+            index = decoded
+            if index % stride == 0:
+                ok, image = capture.read()
+            else:
+                ok, image = capture.grab(), None
+            if not ok:
+                break
+            decoded += 1
+            if image is None:
+                continue
+
+            analyzed += 1
+            sharpness = frame_sharpness(image)
+            segment = min(keyframes - 1, index * keyframes // total)
+            if segment not in best or sharpness > best[segment]["sharpness"]:
+                best[segment] = {
+                    "index": index,
+                    "timestamp_ms": round(index * 1000 / fps, 1),
+                    "sharpness": sharpness,
+                    "bgr": image
+                }
+    finally:
+        capture.release()
+
+    return {
+        "keyframes": [best[segment] for segment in sorted(best)],
+        "fps": fps,
+        "frames_decoded": decoded,
+        "frames_analyzed": analyzed,
+        "duration_seconds": round(decoded / fps, 3),
+        "sampling_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def _standardize(image: np.ndarray) -> np.ndarray:
+    # Normalizar brillo y contraste: solo cuenta el cambio de forma del rostro
+    return (image - image.mean()) / (image.std() + 1e-6)
+
+
+def _normalized_face(bgr: np.ndarray, face_location: tuple) -> np.ndarray:
+    top, right, bottom, left = face_location
+    height, width = bgr.shape[:2]
+    margin = MOTION_CROP_MARGIN * max(bottom - top, right - left)
+    y1, y2 = max(0, int(top - margin)), min(height, int(bottom + margin))
+    x1, x2 = max(0, int(left - margin)), min(width, int(right + margin))
+    face = cv2.cvtColor(bgr[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    face = cv2.resize(face, (MOTION_FACE_SIDE, MOTION_FACE_SIDE), interpolation=cv2.INTER_AREA)
+    face = cv2.GaussianBlur(face.astype(np.float32), (0, 0), MOTION_BLUR_SIGMA)
+    return _standardize(face)
+
+
+def _aligned_change(reference: np.ndarray, face: np.ndarray) -> tuple:
+    """
+    Diferencia entre dos rostros normalizados después de alinearlos
+
+    Returns:
+        (diferencia media en desviaciones, True si la alineación convergió)
+    """
+    warp = np.eye(2, 3, dtype=np.float32)
+    try:
+        _, warp = cv2.findTransformECC(reference, face, warp, cv2.MOTION_AFFINE, MOTION_ECC_CRITERIA, None, 1)
+        face = cv2.warpAffine(face, warp, (MOTION_FACE_SIDE, MOTION_FACE_SIDE),
+                              flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+        aligned = True
+    except cv2.error:
+        # Sin convergencia (rostros muy distintos): se comparan sin alinear
+        aligned = False
+    inner = slice(MOTION_BORDER, MOTION_FACE_SIDE - MOTION_BORDER)
+    change = np.abs(_standardize(reference[inner, inner]) - _standardize(face[inner, inner])).mean()
+    return float(change), aligned
+
+
+def face_motion(faces: list) -> dict:
+    """
+    Señal de liveness temporal a partir de los rostros de los keyframes
+
+    Un frame fijo no muestra movimiento; entre keyframes de una persona real
+    cambian la expresión, los ojos y la pose. Una foto sostenida frente a
+    la cámara también cambia entre keyframes, pero solo por una
+    transformación del plano completo (se desplaza, rota o inclina) más el
+    ruido de la cámara y de la compresión, y la caja del detector tiembla
+    unos píxeles en cada keyframe.
+
+    Por eso cada rostro (con margen, 64x64, suavizado y normalizado) se
+    alinea con el del keyframe anterior con una transformación afín (ECC)
+    y se mide solo lo que queda: la parte del cambio que no es un
+    movimiento rígido del plano. Un video congelado o una foto, quieta o
+    en movimiento, da un cambio cercano a 0. El umbral se calibra con
+    benchmarks/bench_clip_motion.py.
+
+    Args:
+        faces: Lista de tuplas (bgr, face_location) en orden temporal
+
+    Returns:
+        Dict con "appearance_change" (diferencia media entre rostros
+        alineados), "box_shift" (desplazamiento medio de la caja), "pairs"
+        comparados y "aligned_pairs" (pares en que la alineación convergió)
+    """
+    if len(faces) < 2:
+        return {"appearance_change": 0.0, "box_shift": 0.0, "pairs": 0, "aligned_pairs": 0}
+
+    normalized = [_normalized_face(bgr, location) for bgr, location in faces]
+    changes = [_aligned_change(a, b) for a, b in zip(normalized, normalized[1:])]
+    appearance = [change for change, _ in changes]
+
+    shifts = []
+    for (_, (top_a, right_a, bottom_a, left_a)), (_, (top_b, right_b, bottom_b, left_b)) in zip(faces, faces[1:]):
+        size = max(1, right_a - left_a, bottom_a - top_a)
+        center_a = ((left_a + right_a) / 2, (top_a + bottom_a) / 2)
+        center_b = ((left_b + right_b) / 2, (top_b + bottom_b) / 2)
+        shifts.append(math.hypot(center_b[0] - center_a[0], center_b[1] - center_a[1]) / size)
+
+    return {
+        "appearance_change": round(float(np.mean(appearance)), 4),
+        "box_shift": round(float(np.mean(shifts)), 4),
+        "pairs": len(appearance),
+        "aligned_pairs": sum(aligned for _, aligned in changes)
+    }
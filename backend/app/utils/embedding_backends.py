@@ -0,0 +1,173 @@
+import threading
+
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple
+from app.core.constants import FACE_UNIQUENESS_DISTANCE_THRESHOLD
+from app.utils.face_chip import chip_face_location
+
+
+METRIC_EUCLIDEAN = "euclidean"
+METRIC_COSINE = "cosine"
+
+
+class DlibEmbeddingBackend:
+    """
+    Encoding facial con la ResNet de dlib (face_recognition), 128 dimensiones
+
+    Es el backend por defecto. Cada backend declara su dimensión, métrica,
+    umbral de coincidencia y versión de modelo; la versión se guarda junto
+    a cada encoding persistido, así cambiar de backend invalida los
+    encodings anteriores y se recalculan.
+
+    El detector HOG y la ResNet de dlib no son thread-safe: las llamadas se
+    serializan con un lock, así que debe existir una sola instancia por
+    módulo face_recognition cargado.
+    """
+
+    name = "dlib"
+    dimension = 128
+    metric = METRIC_EUCLIDEAN
+    # Distancia máxima para aceptar un login (más estricto que el 0.6 de dlib)
+    threshold = 0.55
+    # Distancia máxima para considerar que el rostro ya pertenece a otro usuario
+    uniqueness_threshold = FACE_UNIQUENESS_DISTANCE_THRESHOLD
+
+    def __init__(self, face_recognition, model_version: str):
+        self.face_recognition = face_recognition
+        self.model_version = model_version
+        self._lock = threading.Lock()
+
+    def encode(self, rgb: np.ndarray, face_location: Optional[Tuple[int, int, int, int]] = None) -> Optional[np.ndarray]:
+        """
+        Encoding del rostro de la imagen
+
+        Args:
+            rgb: Imagen (o recorte) RGB
+            face_location: Rostro en formato dlib (top, right, bottom, left);
+                si es None dlib busca el rostro con su detector HOG
+
+        Returns:
+            Encoding o None si no hay rostro
+        """
+        known_locations = [face_location] if face_location is not None else None
+        with self._lock:
+            encodings = self.face_recognition.face_encodings(rgb, known_face_locations=known_locations)
+        if not encodings:
+            return None
+        return encodings[0]
+
+    def encode_chip(self, chip: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Encoding de un chip ya alineado de 150x150 (ver utils/face_chip.py)
+
+        La ResNet recibe el chip directamente: no hay detección ni landmarks.
+        """
+        chip = np.ascontiguousarray(chip)
+        with self._lock:
+            descriptor = self.face_recognition.api.face_encoder.compute_face_descriptor(chip)
+        return np.array(descriptor)
+
+    def distance(self, registered: np.ndarray, probe: np.ndarray) -> np.ndarray:
+        """Distancia euclidiana entre cada encoding registrado (N, D) y el de consulta"""
+        return np.linalg.norm(np.asarray(registered) - np.asarray(probe), axis=1)
+
+    def from_euclidean(self, distance: float) -> float:
+        """Convierte la distancia euclidiana del índice de galería a la métrica del backend"""
+        return distance
+
+
+class OnnxEmbeddingBackend:
+    """
+    Encoding facial con un modelo ONNX tipo MobileFaceNet/ArcFace en CPU
+
+    Recorta el rostro con la caja de MediaPipe, lo lleva a la entrada del
+    modelo (112x112 por defecto, normalización (x - 127.5) / 127.5) y
+    devuelve el embedding normalizado a norma 1. La métrica es distancia
+    coseno (1 - similitud).
+    """
+
+    name = "onnx"
+    metric = METRIC_COSINE
+
+    def __init__(
+        self,
+        model_path: str,
+        threshold: float = 0.6,
+        uniqueness_threshold: Optional[float] = None,
+        dimension: int = 0,
+        input_size: int = 112,
+        crop_margin: float = 0.1
+    ):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # NCHW (la mayoría de exportaciones desde PyTorch) o NHWC (desde TensorFlow)
+        self.channels_first = model_input.shape[1] == 3
+        output_dimension = self.session.get_outputs()[0].shape[-1]
+        if isinstance(output_dimension, int):
+            if dimension and dimension != output_dimension:
+                raise ValueError(f"El modelo produce embeddings de {output_dimension} dimensiones, no {dimension}")
+            dimension = output_dimension
+        if not dimension:
+            raise ValueError("No se pudo determinar la dimensión del embedding del modelo ONNX")
+
+        self.dimension = dimension
+        self.threshold = threshold
+        self.uniqueness_threshold = uniqueness_threshold if uniqueness_threshold is not None else threshold
+        self.input_size = input_size
+        self.crop_margin = crop_margin
+        self.model_version = f"onnx_{Path(model_path).stem}_{dimension}"
+
+    def _crop(self, rgb: np.ndarray, face_location: Tuple[int, int, int, int]) -> np.ndarray:
+        """Recorte cuadrado del rostro con margen, a la resolución de entrada del modelo"""
+        top, right, bottom, left = face_location
+        side = max(bottom - top, right - left) * (1 + 2 * self.crop_margin)
+        center_y, center_x = (top + bottom) / 2, (left + right) / 2
+        height, width = rgb.shape[:2]
+        y1, x1 = max(0, int(center_y - side / 2)), max(0, int(center_x - side / 2))
+        y2, x2 = min(height, int(center_y + side / 2)), min(width, int(center_x + side / 2))
+        return cv2.resize(rgb[y1:y2, x1:x2], (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)
+
+    def encode(self, rgb: np.ndarray, face_location: Optional[Tuple[int, int, int, int]] = None) -> Optional[np.ndarray]:
+        """
+        Embedding del rostro de la imagen
+
+        Args:
+            rgb: Imagen (o recorte) RGB
+            face_location: Rostro en formato dlib (top, right, bottom, left).
+                Este backend no tiene detector propio: sin caja devuelve None
+
+        Returns:
+            Embedding de norma 1 o None si no hay rostro
+        """
+        if face_location is None:
+            return None
+
+        blob = (self._crop(rgb, face_location).astype(np.float32) - 127.5) / 127.5
+        if self.channels_first:
+            blob = blob.transpose(2, 0, 1)
+        blob = np.ascontiguousarray(blob[None])
+        embedding = self.session.run(None, {self.input_name: blob})[0][0].astype(np.float64)
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            return None
+        return embedding / norm
+
+    def encode_chip(self, chip: np.ndarray) -> Optional[np.ndarray]:
+        """Embedding de un chip alineado (el rostro ocupa el centro del chip)"""
+        return self.encode(chip, chip_face_location(chip.shape[0]))
+
+    def distance(self, registered: np.ndarray, probe: np.ndarray) -> np.ndarray:
+        """Distancia coseno entre cada embedding registrado (N, D) y el de consulta"""
+        return 1.0 - np.asarray(registered) @ np.asarray(probe)
+
+    def from_euclidean(self, distance: float) -> float:
+        """Con vectores de norma 1: ||a - b||^2 = 2 (1 - cos)"""
+        return distance * distance / 2.0
@@ -0,0 +1,239 @@
+import fnmatch
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from app.core.constants import FACE_ENCODING_SUFFIX
+
+
+ENCODING_READY = "ready"      # Encoding persistido junto a la imagen
+ENCODING_PENDING = "pending"  # Se calculará en la primera verificación
+ENCODING_FAILED = "failed"    # La imagen no tiene un rostro utilizable
+
+
+class EnrollmentManifest:
+    """
+    Registro por usuario de las capturas faciales
+
+    Reemplaza recorrer el directorio del usuario (glob + orden por nombre)
+    en cada listado y verificación: cada captura queda registrada con su
+    nombre, fecha, tamaño, métricas de calidad y estado del encoding en un
+    JSON del directorio del usuario, que se mantiene en memoria.
+
+    - El archivo se escribe de forma atómica a través del almacenamiento
+      (temporal + fsync + rename en disco local)
+    - La copia en memoria se valida con la versión del manifiesto (un stat
+      en disco local, la generación en GCS), así se ven las capturas que
+      agregue otro proceso sin recorrer el directorio. Se guardan como
+      máximo `max_users` usuarios (LRU)
+    - Cada usuario tiene su propio lock: la E/S de un manifiesto no frena
+      a los demás usuarios
+    - Las modificaciones son read-modify-write con escritura condicional a
+      la versión leída (lock de archivo en disco local, generación en GCS):
+      si otro proceso escribió en el medio, se relee y se vuelve a aplicar
+      (hasta MAX_WRITE_ATTEMPTS veces); no se pierden actualizaciones
+    - Los usuarios registrados antes del manifiesto se migran la primera
+      vez que se leen (único glob por usuario)
+    """
+
+    FILENAME = "manifest.json"
+    IMAGE_PATTERN = "face_*.jpg"
+    LOCK_STRIPES = 64
+    MAX_WRITE_ATTEMPTS = 8
+
+    def __init__(self, storage, max_users: int = 10000):
+        self.storage = storage
+        self.max_users = max(1, max_users)
+        self._cache_lock = threading.Lock()
+        # user_dir -> {"version": tuple | None, "entries": {filename: entry}}
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._user_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._counters = {"hits": 0, "reloads": 0, "migrated_users": 0, "writes": 0, "write_conflicts": 0}
+
+    def _user_lock(self, user_dir: Path) -> threading.Lock:
+        return self._user_locks[hash(str(user_dir)) % self.LOCK_STRIPES]
+
+    def _count(self, counter: str) -> None:
+        with self._cache_lock:
+            self._counters[counter] += 1
+
+    def _cached(self, key: str) -> Optional[dict]:
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+            return cached
+
+    def _remember(self, key: str, version: Optional[tuple], entries: dict) -> None:
+        with self._cache_lock:
+            self._cache[key] = {"version": version, "entries": entries}
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+
+    def _version(self, user_dir: Path) -> Optional[tuple]:
+        """Identifica el contenido actual del manifiesto (None si no existe)"""
+        return self.storage.version(user_dir / self.FILENAME)
+
+    def _scan(self, user_dir: Path) -> dict:
+        """Manifiesto inicial a partir de las imágenes ya guardadas (migración)"""
+        entries = {}
+        files = self.storage.list_files(user_dir)
+        for filename in fnmatch.filter(files, self.IMAGE_PATTERN):
+            stem = Path(filename).stem
+            has_encoding = f"{stem}{FACE_ENCODING_SUFFIX}" in files
+            try:
+                # El nombre lleva la fecha de captura (face_YYYYmmdd_HHMMSS.jpg)
+                captured_at = datetime.strptime(stem, "face_%Y%m%d_%H%M%S")
+            except ValueError:
+                captured_at = datetime.fromtimestamp(files[filename]["mtime"])
+            entries[filename] = {
+                "filename": filename,
+                "captured_at": captured_at.isoformat(),
+                "size_bytes": files[filename]["size"],
+                "quality": None,
+                "encoding": ENCODING_READY if has_encoding else ENCODING_PENDING
+            }
+        return entries
+
+    def _write_locked(self, user_dir: Path, entries: dict, expected_version: Optional[tuple]) -> Optional[tuple]:
+        """Escribe si nadie cambió el manifiesto desde `expected_version` (None si hubo conflicto)"""
+        content = json.dumps({"version": 1, "images": list(entries.values())})
+        version = self.storage.write_if_version(user_dir / self.FILENAME, content.encode("utf-8"), expected_version)
+        if version is None:
+            self._count("write_conflicts")
+            return None
+        self._count("writes")
+        self._remember(str(user_dir), version, entries)
+        return version
+
+    def _load_locked(self, user_dir: Path) -> tuple:
+        """(versión, entradas) actuales del manifiesto, con el lock del usuario tomado"""
+        key = str(user_dir)
+        for _ in range(self.MAX_WRITE_ATTEMPTS):
+            version = self._version(user_dir)
+            cached = self._cached(key)
+            if cached is not None and cached["version"] == version:
+                self._count("hits")
+                return version, cached["entries"]
+
+            if version is None:
+                if not self.storage.is_dir(user_dir):
+                    # Usuario sin capturas: no hay nada que migrar
+                    self._remember(key, None, {})
+                    return None, {}
+                entries = self._scan(user_dir)
+                new_version = self._write_locked(user_dir, entries, None)
+                if new_version is None:
+                    continue  # Otro proceso lo creó primero: se lee el suyo
+                self._count("migrated_users")
+                print(f"[LOG] Manifiesto creado para {user_dir.name} con {len(entries)} imágenes")
+                return new_version, entries
+
+            try:
+                data = json.loads(self.storage.read(user_dir / self.FILENAME))
+                entries = {entry["filename"]: entry for entry in data["images"]}
+            except Exception as e:
+                print(f"[WARN] Manifiesto corrupto en {user_dir}: {e}. Se reconstruye")
+                entries = self._scan(user_dir)
+                new_version = self._write_locked(user_dir, entries, version)
+                if new_version is None:
+                    continue
+                return new_version, entries
+
+            # Si cambió entre el stat y la lectura, la próxima lectura recarga
+            # y una escritura condicional con esta versión falla y se reintenta
+            self._count("reloads")
+            self._remember(key, version, entries)
+            return version, entries
+        raise OSError(f"El manifiesto de {user_dir} cambió en cada intento de lectura")
+
+    def _update(self, user_dir: Path, apply) -> None:
+        """
+        Aplica `apply(entries) -> bool` (True si cambió algo) y lo persiste
+
+        La escritura es condicional a la versión leída: si otro proceso
+        escribió en el medio, se relee y el cambio se aplica sobre su versión.
+        """
+        with self._user_lock(user_dir):
+            for attempt in range(self.MAX_WRITE_ATTEMPTS):
+                if attempt:
+                    # Espera aleatoria creciente: los procesos en conflicto se desfasan
+                    time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+                version, entries = self._load_locked(user_dir)
+                entries = dict(entries)
+                if not apply(entries):
+                    return
+                if self._write_locked(user_dir, entries, version) is not None:
+                    return
+        raise OSError(f"El manifiesto de {user_dir} cambió en cada intento de escritura")
+
+    def images(self, user_dir: Path) -> list:
+        """Capturas del usuario, más recientes primero"""
+        with self._user_lock(user_dir):
+            entries = list(self._load_locked(user_dir)[1].values())
+        return sorted(entries, key=lambda entry: (entry["captured_at"], entry["filename"]), reverse=True)
+
+    def paths(self, user_dir: Path) -> list:
+        """Rutas de las capturas del usuario, más recientes primero"""
+        return [str(user_dir / entry["filename"]) for entry in self.images(user_dir)]
+
+    def page(self, user_dir: Path, offset: int = 0, limit: int = 20) -> tuple:
+        """(capturas de la página, total de capturas), más recientes primero"""
+        entries = self.images(user_dir)
+        return entries[offset:offset + limit], len(entries)
+
+    def add(
+        self,
+        user_dir: Path,
+        filename: str,
+        size_bytes: int,
+        quality: Optional[dict] = None,
+        encoding: str = ENCODING_PENDING
+    ) -> dict:
+        """Registra una captura nueva (o reemplaza la del mismo nombre)"""
+        entry = {
+            "filename": filename,
+            "captured_at": datetime.now().isoformat(),
+            "size_bytes": size_bytes,
+            "quality": quality,
+            "encoding": encoding
+        }
+
+        def apply(entries: dict) -> bool:
+            if entries.get(filename) == entry:
+                return False
+            entries[filename] = entry
+            return True
+
+        self._update(user_dir, apply)
+        return entry
+
+    def set_encoding_status(self, image_path, encoding: str) -> None:
+        """Actualiza el estado del encoding de una captura"""
+        image_path = Path(image_path)
+
+        def apply(entries: dict) -> bool:
+            entry = entries.get(image_path.name)
+            if entry is None or entry["encoding"] == encoding:
+                return False
+            entries[image_path.name] = {**entry, "encoding": encoding}
+            return True
+
+        try:
+            self._update(image_path.parent, apply)
+        except Exception as e:
+            print(f"[WARN] No se pudo actualizar el manifiesto de {image_path.parent}: {e}")
+
+    def forget_user(self, user_dir: Path) -> None:
+        with self._cache_lock:
+            self._cache.pop(str(user_dir), None)
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            return {**self._counters, "cached_users": len(self._cache), "max_users": self.max_users}
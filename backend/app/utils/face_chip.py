@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+from app.core.constants import FACE_CHIP_PADDING, FACE_CHIP_SIZE
+
+
+def is_face_chip(image: np.ndarray) -> bool:
+    """True si la imagen registrada es un chip alineado (las antiguas son frames completos)"""
+    return image.shape[:2] == (FACE_CHIP_SIZE, FACE_CHIP_SIZE)
+
+
+def chip_face_location(size: int = FACE_CHIP_SIZE, padding: float = FACE_CHIP_PADDING) -> Tuple[int, int, int, int]:
+    """
+    Ubicación del rostro dentro de un chip, en formato dlib (top, right, bottom, left)
+
+    dlib reserva `padding` veces el tamaño del rostro a cada lado.
+    """
+    margin = int(round(size * padding / (1 + 2 * padding)))
+    return margin, size - margin, size - margin, margin
+
+
+def extract_face_chip(
+    rgb: np.ndarray,
+    face_location: Tuple[int, int, int, int],
+    pose_predictor=None,
+    size: int = FACE_CHIP_SIZE,
+    padding: float = FACE_CHIP_PADDING
+) -> np.ndarray:
+    """
+    Recorte normalizado del rostro, del tamaño que espera la ResNet de dlib
+
+    Con el predictor de landmarks de 5 puntos de dlib el chip queda
+    alineado (ojos horizontales y a la misma altura) exactamente como lo
+    alinea face_recognition antes de calcular el encoding, así el encoding
+    del chip guardado es el mismo que el del frame original.
+
+    Args:
+        rgb: Imagen RGB
+        face_location: Rostro en formato dlib (top, right, bottom, left)
+        pose_predictor: dlib.shape_predictor de 5 puntos; sin él se hace un
+            recorte cuadrado sin alinear
+        size: Lado del chip en píxeles
+        padding: Margen alrededor del rostro (fracción de su tamaño)
+
+    Returns:
+        Chip RGB de size x size
+    """
+    top, right, bottom, left = face_location
+    if pose_predictor is not None:
+        import dlib
+        shape = pose_predictor(rgb, dlib.rectangle(left, top, right, bottom))
+        return dlib.get_face_chip(rgb, shape, size=size, padding=padding)
+
+    # Sin landmarks: recorte cuadrado centrado en la caja con el mismo margen
+    side = max(bottom - top, right - left) * (1 + 2 * padding)
+    center_y, center_x = (top + bottom) / 2, (left + right) / 2
+    y1, x1 = int(round(center_y - side / 2)), int(round(center_x - side / 2))
+    y2, x2 = int(round(center_y + side / 2)), int(round(center_x + side / 2))
+    height, width = rgb.shape[:2]
+    # Rellenar con negro lo que caiga fuera de la imagen, como dlib
+    padded = cv2.copyMakeBorder(
+        rgb,
+        max(0, -y1), max(0, y2 - height), max(0, -x1), max(0, x2 - width),
+        cv2.BORDER_CONSTANT, value=(0, 0, 0)
+    )
+    crop = padded[y1 + max(0, -y1):y2 + max(0, -y1), x1 + max(0, -x1):x2 + max(0, -x1)]
+    return cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def encoded_image_suffix(image_data: bytes) -> Optional[str]:
+    """Extensión según la firma de los bytes (para guardar el original sin recodificar)"""
+    if image_data.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if image_data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return ".webp"
+    return None
@@ -0,0 +1,82 @@
+import threading
+import mediapipe as mp
+from typing import Optional
+from app.config import FACE_DETECTION_MODEL_SELECTION, FACE_DETECTION_MIN_CONFIDENCE
+
+
+class FaceDetectorPool:
+    """
+    Detectores de rostro MediaPipe reutilizables
+
+    Construir el grafo de FaceDetection cuesta más que la detección misma,
+    así que cada hilo mantiene sus propios detectores (los grafos de
+    MediaPipe no son seguros entre hilos), uno por configuración
+    (model_selection, min_detection_confidence).
+    """
+
+    def __init__(
+        self,
+        model_selection: int = FACE_DETECTION_MODEL_SELECTION,
+        min_detection_confidence: float = FACE_DETECTION_MIN_CONFIDENCE
+    ):
+        self.model_selection = model_selection
+        self.min_detection_confidence = min_detection_confidence
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._detectors = []  # Todos los detectores creados, para cerrarlos al apagar
+
+    def get(
+        self,
+        model_selection: Optional[int] = None,
+        min_detection_confidence: Optional[float] = None
+    ):
+        """
+        Devuelve el detector del hilo actual para la configuración pedida
+
+        Args:
+            model_selection: Modelo de MediaPipe (por defecto el configurado)
+            min_detection_confidence: Confianza mínima (por defecto la configurada)
+        """
+        key = (
+            self.model_selection if model_selection is None else model_selection,
+            self.min_detection_confidence if min_detection_confidence is None else min_detection_confidence
+        )
+
+        detectors = getattr(self._local, "detectors", None)
+        if detectors is None:
+            detectors = self._local.detectors = {}
+
+        detector = detectors.get(key)
+        if detector is None:
+            detector = mp.solutions.face_detection.FaceDetection(
+                model_selection=key[0],
+                min_detection_confidence=key[1]
+            )
+            detectors[key] = detector
+            with self._lock:
+                self._detectors.append(detector)
+        return detector
+
+    def process(
+        self,
+        rgb_image,
+        model_selection: Optional[int] = None,
+        min_detection_confidence: Optional[float] = None
+    ):
+        """Ejecuta la detección sobre una imagen RGB con el detector del hilo actual"""
+        return self.get(model_selection, min_detection_confidence).process(rgb_image)
+
+    def close(self) -> None:
+        """Libera todos los grafos de MediaPipe creados"""
+        with self._lock:
+            detectors, self._detectors = self._detectors, []
+        for detector in detectors:
+            try:
+                detector.close()
+            except Exception as e:
+                print(f"[WARN] Error cerrando detector MediaPipe: {e}")
+        self._local = threading.local()
+
+
+# Pool compartido por el servicio y las utilidades de reconocimiento facial
+face_detector_pool = FaceDetectorPool()
@@ -0,0 +1,152 @@
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+
+
+class FaceFrame:
+    """
+    Imagen de una petición decodificada una sola vez
+
+    Se pasa por todas las etapas del pipeline (detección, liveness,
+    encoding) para no repetir `cv2.imdecode` ni conversiones de color
+    sobre los mismos bytes.
+
+    Los frames grandes se reducen una sola vez a la resolución de trabajo:
+    la escena completa (para detección y liveness) queda en `bgr`/`rgb` y
+    el encoding usa solo el recorte del rostro (`face_roi`).
+    """
+
+    def __init__(self, bgr: np.ndarray, scale: float = 1.0):
+        self.bgr = bgr
+        self.height, self.width = bgr.shape[:2]
+        # Factor resolución de trabajo / resolución original
+        self.scale = scale
+        self._rgb: Optional[np.ndarray] = None
+        # Caja del rostro detectado (la completa detect_face_in_image)
+        self.face_box: Optional[dict] = None
+        self.face_detection_done = False
+        # Bytes tal como llegaron (solo si el frame se creó con from_bytes)
+        self.source: Optional[bytes] = None
+        # Aplicar el filtro de calidad (no a imágenes ya registradas)
+        self.quality_gate = True
+        # Tiempo por etapa del pipeline en milisegundos
+        self.timings = {}
+
+    @classmethod
+    def from_image(cls, image: np.ndarray, max_side: int = 0) -> "FaceFrame":
+        """
+        Crea un frame reduciendo la imagen a la resolución de trabajo
+
+        Args:
+            image: Imagen BGR a resolución original
+            max_side: Lado máximo en píxeles (0 = no reducir)
+        """
+        height, width = image.shape[:2]
+        longest = max(height, width)
+        if not max_side or longest <= max_side:
+            return cls(image)
+
+        scale = max_side / longest
+        working = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+        return cls(working, scale=scale)
+
+    @classmethod
+    def from_bytes(cls, image_data: bytes, max_side: int = 0) -> Optional["FaceFrame"]:
+        """
+        Decodifica los bytes de una imagen
+
+        Args:
+            image_data: Bytes de la imagen
+            max_side: Lado máximo de la resolución de trabajo (0 = no reducir)
+
+        Returns:
+            FaceFrame o None si los bytes no son una imagen válida
+        """
+        started = time.perf_counter()
+        nparr = np.frombuffer(image_data, np.uint8)
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        frame = cls.from_image(image, max_side)
+        frame.source = image_data
+        frame.timings["decode"] = (time.perf_counter() - started) * 1000
+        return frame
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Imagen en RGB (se convierte la primera vez que se pide)"""
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Acumula en `timings` el tiempo de una etapa del pipeline"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+    @property
+    def face_location(self) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Caja del rostro en el formato de dlib/face_recognition
+
+        Returns:
+            (top, right, bottom, left) recortada a los bordes de la imagen,
+            o None si no hay rostro detectado
+        """
+        if self.face_box is None:
+            return None
+
+        box = self.face_box
+        top = max(0, box["y"])
+        left = max(0, box["x"])
+        bottom = min(self.height, box["y"] + box["height"])
+        right = min(self.width, box["x"] + box["width"])
+        if bottom <= top or right <= left:
+            return None
+        return top, right, bottom, left
+
+    def face_roi(self, margin: float = 0.5) -> Optional[Tuple[np.ndarray, Tuple[int, int, int, int]]]:
+        """
+        Recorte RGB del rostro ampliado con un margen
+
+        El margen debe cubrir la región que dlib usa para alinear el rostro
+        (la caja más un 25%), así el encoding es el mismo que sobre el frame
+        completo pero procesando muchos menos píxeles.
+
+        Args:
+            margin: Fracción del tamaño de la caja a agregar por cada lado
+
+        Returns:
+            Tupla (recorte RGB contiguo, ubicación del rostro dentro del recorte)
+            o None si no hay rostro detectado
+        """
+        location = self.face_location
+        if location is None:
+            return None
+
+        top, right, bottom, left = location
+        margin_y = int((bottom - top) * margin)
+        margin_x = int((right - left) * margin)
+        roi_top = max(0, top - margin_y)
+        roi_left = max(0, left - margin_x)
+        roi_bottom = min(self.height, bottom + margin_y)
+        roi_right = min(self.width, right + margin_x)
+
+        roi = np.ascontiguousarray(self.rgb[roi_top:roi_bottom, roi_left:roi_right])
+        return roi, (top - roi_top, right - roi_left, bottom - roi_top, left - roi_left)
+
+    def to_original(self, value: float) -> int:
+        """Convierte una coordenada de la resolución de trabajo a la original"""
+        return int(round(value / self.scale))
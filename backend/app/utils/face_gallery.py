@@ -0,0 +1,211 @@
+import threading
+import numpy as np
+from typing import Iterable, Optional, Tuple
+from app.utils.ann_index import IVFIndex
+
+
+class FaceGalleryIndex:
+    """
+    Índice en memoria con todos los encodings faciales registrados
+
+    Mantiene una matriz contigua (N x 128) y un arreglo paralelo con el
+    código del usuario de cada fila, de modo que una búsqueda 1:N es una
+    sola operación vectorizada de distancias más un argmin.
+
+    A partir de `ann_min_size` encodings la búsqueda usa un índice IVF
+    aproximado para elegir candidatos y calcula la distancia exacta solo
+    sobre ellos.
+
+    Cada encoding puede llevar una clave (el nombre de la captura): agregar
+    una clave que ya está indexada no hace nada, así el índice se puede
+    actualizar de forma incremental desde los manifiestos sin duplicar filas.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 128,
+        initial_capacity: int = 1024,
+        ann_min_size: Optional[int] = None,
+        ann_n_lists: int = 0,
+        ann_n_probe: int = 16
+    ):
+        self.dimension = dimension
+        self._lock = threading.RLock()
+        self._matrix = np.empty((initial_capacity, dimension), dtype=np.float32)
+        self._sq_norms = np.empty(initial_capacity, dtype=np.float32)
+        self._user_codes = np.empty(initial_capacity, dtype=np.int32)
+        self._size = 0
+        # user_id <-> código entero (comparar enteros es más barato que strings)
+        self._code_by_user = {}
+        self._user_by_code = []
+        self._keys_by_user = {}  # user_id -> claves indexadas
+        self._ready = False
+        # Índice aproximado (None = búsqueda siempre exacta)
+        self.ann_min_size = ann_min_size
+        self._ann = IVFIndex(dimension, n_lists=ann_n_lists, n_probe=ann_n_probe) if ann_min_size else None
+        self._ann_stale = True
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def _user_code(self, user_id: str) -> int:
+        code = self._code_by_user.get(user_id)
+        if code is None:
+            code = len(self._user_by_code)
+            self._code_by_user[user_id] = code
+            self._user_by_code.append(user_id)
+        return code
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = max(min_capacity, 2 * len(self._matrix))
+        matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        user_codes = np.empty(capacity, dtype=np.int32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        user_codes[:self._size] = self._user_codes[:self._size]
+        self._matrix, self._sq_norms, self._user_codes = matrix, sq_norms, user_codes
+
+    def build(self, entries: Iterable[tuple]) -> None:
+        """
+        Reconstruye el índice completo
+
+        Args:
+            entries: Pares (user_id, encoding) o tríos (user_id, encoding, clave)
+        """
+        with self._lock:
+            self._size = 0
+            self._code_by_user = {}
+            self._user_by_code = []
+            self._keys_by_user = {}
+            self._ann_stale = True
+            for entry in entries:
+                self._add_unlocked(*entry)
+            self._refresh_ann_unlocked()
+            self._ready = True
+
+    def add(self, user_id: str, encoding: np.ndarray, key: Optional[str] = None) -> None:
+        """Agrega el encoding de un rostro recién registrado"""
+        with self._lock:
+            self._add_unlocked(user_id, encoding, key)
+            self._refresh_ann_unlocked()
+
+    def add_many(self, entries: Iterable[tuple]) -> None:
+        """Agrega varios (user_id, encoding, clave) y re-entrena el IVF una sola vez"""
+        with self._lock:
+            for entry in entries:
+                self._add_unlocked(*entry)
+            self._refresh_ann_unlocked()
+
+    def mark_ready(self) -> None:
+        """Marca el índice como completo (después de cargarlo con add_many)"""
+        with self._lock:
+            self._refresh_ann_unlocked()
+            self._ready = True
+
+    def user_keys(self, user_id: str) -> frozenset:
+        """Claves indexadas del usuario"""
+        with self._lock:
+            return frozenset(self._keys_by_user.get(user_id, ()))
+
+    def users(self) -> set:
+        """Usuarios con al menos un encoding indexado"""
+        with self._lock:
+            return set(self._keys_by_user)
+
+    def _add_unlocked(self, user_id: str, encoding: np.ndarray, key: Optional[str] = None) -> None:
+        keys = self._keys_by_user.setdefault(user_id, set())
+        if key is not None:
+            if key in keys:
+                return
+            keys.add(key)
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.dimension)
+        if self._size == len(self._matrix):
+            self._grow(self._size + 1)
+        self._matrix[self._size] = vector
+        self._sq_norms[self._size] = float(vector @ vector)
+        self._user_codes[self._size] = self._user_code(user_id)
+        self._size += 1
+        if self._uses_ann() and not self._ann_stale:
+            self._ann.add(self._size - 1, vector)
+
+    def _uses_ann(self) -> bool:
+        return self._ann is not None and self._size >= self.ann_min_size
+
+    def _refresh_ann_unlocked(self) -> None:
+        """Re-entrena el índice aproximado si está obsoleto o el tamaño se duplicó"""
+        if not self._uses_ann():
+            return
+        if self._ann_stale or not self._ann.is_trained or self._size >= 2 * self._ann.trained_size:
+            self._ann.build(self._matrix[:self._size])
+            self._ann_stale = False
+
+    def remove_user(self, user_id: str) -> None:
+        """Elimina todos los encodings de un usuario"""
+        with self._lock:
+            self._keys_by_user.pop(user_id, None)
+            code = self._code_by_user.get(user_id)
+            if code is None:
+                return
+            keep = self._user_codes[:self._size] != code
+            kept = int(keep.sum())
+            self._matrix[:kept] = self._matrix[:self._size][keep]
+            self._sq_norms[:kept] = self._sq_norms[:self._size][keep]
+            self._user_codes[:kept] = self._user_codes[:self._size][keep]
+            self._size = kept
+            # Las filas cambiaron de posición: el índice aproximado debe reconstruirse
+            self._ann_stale = True
+            self._refresh_ann_unlocked()
+
+    def search(
+        self,
+        probe: np.ndarray,
+        exclude_user_id: Optional[str] = None,
+        exact: bool = False,
+        n_probe: Optional[int] = None
+    ) -> Tuple[Optional[str], float]:
+        """
+        Busca el encoding registrado más cercano al rostro de consulta
+
+        Args:
+            probe: Encoding del rostro a buscar
+            exclude_user_id: Usuario a excluir de la búsqueda
+            exact: Forzar recorrido completo aunque haya índice aproximado
+            n_probe: Celdas IVF a revisar (más = mayor recall, mayor latencia)
+
+        Returns:
+            Tupla (user_id, distancia euclidiana). (None, inf) si no hay candidatos
+        """
+        probe = np.asarray(probe, dtype=np.float32).reshape(self.dimension)
+
+        with self._lock:
+            n = self._size
+            if n == 0:
+                return None, float("inf")
+
+            if not exact and self._uses_ann() and not self._ann_stale:
+                rows = self._ann.candidates(probe, n_probe)
+            else:
+                rows = slice(0, n)
+
+            # Re-rank exacto: ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b
+            sq_distances = self._sq_norms[rows] + float(probe @ probe) - 2.0 * (self._matrix[rows] @ probe)
+            user_codes = self._user_codes[rows]
+            if len(sq_distances) == 0:
+                return None, float("inf")
+
+            exclude_code = self._code_by_user.get(exclude_user_id) if exclude_user_id else None
+            if exclude_code is not None:
+                sq_distances[user_codes == exclude_code] = np.inf
+
+            best = int(np.argmin(sq_distances))
+            best_sq_distance = float(sq_distances[best])
+            if not np.isfinite(best_sq_distance):
+                return None, float("inf")
+
+            return self._user_by_code[user_codes[best]], float(np.sqrt(max(best_sq_distance, 0.0)))
@@ -0,0 +1,164 @@
+import hashlib
+import os
+from pathlib import Path
+
+from app.utils.enrollment_manifest import EnrollmentManifest
+from app.utils.storage_backends import STORAGE_LOCAL
+
+
+# Archivos de metadatos que se conservan del destino al fusionar directorios
+_METADATA_SUFFIXES = (".json",)
+
+
+def _is_shard_name(name: str) -> bool:
+    return len(name) == 2 and all(char in "0123456789abcdef" for char in name)
+
+
+class FacialDataLayout:
+    """
+    Ubicación de los directorios de usuario dentro de facial_data
+
+    - Sharded: facial_data/ab/cd/<user_id>/, donde ab y cd son los primeros
+      4 caracteres hex del SHA-1 del user_id (65536 directorios hoja, así
+      ningún directorio crece con la cantidad de usuarios)
+    - Legacy: facial_data/<user_id>/ (todos los usuarios como hermanos)
+
+    Mientras la migración no termina (`legacy_reads`), un usuario sin
+    directorio sharded se busca en el layout legacy. Los usuarios nuevos
+    siempre se crean en el layout sharded. Los directorios se consultan a
+    través del almacenamiento (disco local o bucket).
+    """
+
+    def __init__(self, storage, sharded: bool = True, legacy_reads: bool = True, write_queue=None):
+        self.storage = storage
+        # Cola de escritura diferida del proceso (capturas aún no escritas)
+        self.write_queue = write_queue
+        self.base_dir = Path(storage.root)
+        self.sharded = sharded
+        self.legacy_reads = legacy_reads
+
+    @staticmethod
+    def shard(user_id: str) -> tuple:
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return digest[:2], digest[2:4]
+
+    def sharded_dir(self, user_id: str) -> Path:
+        first, second = self.shard(user_id)
+        return self.base_dir / first / second / user_id
+
+    def legacy_dir(self, user_id: str) -> Path:
+        return self.base_dir / user_id
+
+    def user_dir(self, user_id: str) -> Path:
+        """Directorio actual del usuario (puede no existir todavía)"""
+        if not self.sharded:
+            return self.legacy_dir(user_id)
+        sharded_dir = self.sharded_dir(user_id)
+        if self.legacy_reads and not self.storage.is_dir(sharded_dir):
+            legacy_dir = self.legacy_dir(user_id)
+            if self.storage.is_dir(legacy_dir):
+                return legacy_dir
+        return sharded_dir
+
+    def legacy_user_dirs(self) -> list:
+        """Directorios de usuario que siguen en el layout legacy"""
+        return [self.base_dir / name for name in self.storage.list_dirs(self.base_dir) if not _is_shard_name(name)]
+
+    def iter_user_dirs(self):
+        """
+        Recorre los directorios de todos los usuarios en ambos layouts
+
+        Yields:
+            Tuplas (user_id, directorio); si un usuario está en ambos, solo
+            se devuelve el sharded
+        """
+        seen = set()
+        legacy_dirs = []
+        for first in self.storage.list_dirs(self.base_dir):
+            if not _is_shard_name(first):
+                legacy_dirs.append(first)
+                continue
+            for second in self.storage.list_dirs(self.base_dir / first):
+                for user_id in self.storage.list_dirs(self.base_dir / first / second):
+                    seen.add(user_id)
+                    yield user_id, self.base_dir / first / second / user_id
+
+        if self.legacy_reads or not self.sharded:
+            for user_id in legacy_dirs:
+                if user_id not in seen:
+                    yield user_id, self.base_dir / user_id
+
+    def migrate_user(self, user_id: str) -> bool:
+        """
+        Mueve un usuario del layout legacy al sharded
+
+        En disco local normalmente es un solo rename atómico. Si el
+        directorio sharded ya existe (una captura llegó durante la
+        migración) se mueven los archivos uno por uno; los manifiestos de
+        ambos se eliminan para que se reconstruyan en la próxima lectura.
+        En un bucket los objetos se copian y luego se borran.
+
+        Antes de mover se esperan las capturas de este proceso encoladas
+        hacia el directorio legacy. Una captura de otro proceso que eligió
+        el directorio legacy justo antes del rename lo vuelve a crear al
+        escribirse: ver merge_leftovers.
+
+        Returns:
+            True si el usuario se movió, False si no tenía directorio legacy
+        """
+        return self._move_legacy(user_id)
+
+    def merge_leftovers(self, user_id: str) -> bool:
+        """
+        Fusiona en el directorio sharded un directorio legacy que reapareció
+        después de migrar (captura en vuelo durante la migración)
+
+        Returns:
+            True si había algo que fusionar
+        """
+        return self._move_legacy(user_id)
+
+    def _move_legacy(self, user_id: str) -> bool:
+        legacy_dir = self.legacy_dir(user_id)
+        if self.write_queue is not None:
+            self.write_queue.wait_pending(str(legacy_dir))
+        if not self.storage.is_dir(legacy_dir):
+            return False
+        if self.storage.name != STORAGE_LOCAL:
+            return self._copy_user(legacy_dir, self.sharded_dir(user_id))
+
+        target_dir = self.sharded_dir(user_id)
+        target_dir.parent.mkdir(parents=True, exist_ok=True)
+        if not target_dir.exists():
+            os.rename(legacy_dir, target_dir)
+            return True
+
+        for source in legacy_dir.iterdir():
+            destination = target_dir / source.name
+            if source.name.startswith((EnrollmentManifest.FILENAME, f".{EnrollmentManifest.FILENAME}")):
+                # Manifiesto (se reconstruye) y su archivo de lock (el destino tiene el suyo)
+                source.unlink()
+            elif source.suffix in _METADATA_SUFFIXES and destination.exists():
+                source.unlink()
+            else:
+                os.replace(source, destination)
+        (target_dir / EnrollmentManifest.FILENAME).unlink(missing_ok=True)
+        legacy_dir.rmdir()
+        return True
+
+    def _copy_user(self, legacy_dir: Path, target_dir: Path) -> bool:
+        """Migración objeto por objeto para almacenamientos sin rename"""
+        target_files = self.storage.list_files(target_dir)
+        merge = bool(target_files)
+        for name in self.storage.list_files(legacy_dir):
+            source = legacy_dir / name
+            skip = merge and (
+                name.startswith(EnrollmentManifest.FILENAME)
+                or (Path(name).suffix in _METADATA_SUFFIXES and name in target_files)
+            )
+            if not skip:
+                self.storage.write(target_dir / name, self.storage.read(source))
+            self.storage.delete(source)
+        if merge:
+            self.storage.delete(target_dir / EnrollmentManifest.FILENAME)
+        return True
@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 import mediapipe as mp
 from typing import Tuple, Optional
+from app.utils.face_detector_pool import face_detector_pool
 
 
 class FacialRecognitionUtil:
@@ -29,16 +30,11 @@ class FacialRecognitionUtil:
             Tupla (face_detected, face_landmarks)
         """
         try:
-            with self.mp_face_detection.FaceDetection(
-                model_selection=0,
-                min_detection_confidence=0.5
-            ) as face_detection:
-                
-                results = face_detection.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-                
-                if results.detections:
-                    return True, results.detections
-                return False, None
+            results = face_detector_pool.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            
+            if results.detections:
+                return True, results.detections
+            return False, None
         except Exception as e:
             print(f"Error detectando rostro: {str(e)}")
             return False, None
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+from fastapi import HTTPException, status
+
+
+# Motivos de rechazo y el mensaje para que el usuario reintente
+QUALITY_REASONS = {
+    "image_too_small": "❌ Imagen demasiado pequeña. Use una resolución de cámara mayor.",
+    "too_dark": "❌ Imagen muy oscura. Busque un lugar con más luz e intente de nuevo.",
+    "overexposed": "❌ Imagen sobreexpuesta. Evite luz directa sobre la cámara o contraluz.",
+    "low_contrast": "❌ Imagen sin contraste (cámara tapada o desenfocada). Intente de nuevo.",
+    "blurry": "❌ Imagen borrosa. Mantenga la cámara quieta e intente de nuevo.",
+    "face_too_small": "❌ Rostro muy pequeño. Acérquese a la cámara.",
+}
+
+
+class FrameQualityError(HTTPException):
+    """Frame inutilizable para reconocimiento: el cliente debe capturar otro"""
+
+    def __init__(self, reason: str):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=QUALITY_REASONS[reason])
+        self.reason = reason
+
+
+class FrameQualityGate:
+    """
+    Filtro de calidad con métricas baratas de OpenCV antes de los modelos
+
+    - Sobre el frame completo (una miniatura en gris, ~1 ms): tamaño,
+      brillo, sobreexposición y contraste a partir del histograma
+    - Sobre el rostro, justo después de MediaPipe y antes de YOLO y dlib:
+      tamaño relativo del rostro y nitidez (varianza del Laplaciano)
+
+    Cuenta los frames revisados y los rechazos por motivo.
+    """
+
+    # Lado de la miniatura para las métricas del frame completo
+    THUMBNAIL_SIDE = 160
+    # Ancho al que se normaliza el rostro para que la nitidez no dependa de la resolución
+    FACE_SHARPNESS_WIDTH = 128
+
+    def __init__(
+        self,
+        min_image_side: int = 160,
+        min_brightness: float = 40,
+        max_brightness: float = 220,
+        max_saturated_ratio: float = 0.25,
+        min_contrast: float = 20,
+        min_sharpness: float = 50,
+        min_face_ratio: float = 0.1
+    ):
+        self.min_image_side = min_image_side
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_saturated_ratio = max_saturated_ratio
+        self.min_contrast = min_contrast
+        self.min_sharpness = min_sharpness
+        self.min_face_ratio = min_face_ratio
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._rejected = {reason: 0 for reason in QUALITY_REASONS}
+        self._total_ms = 0.0
+
+    def measure_frame(self, bgr: np.ndarray) -> dict:
+        """Brillo medio, contraste (desviación) y fracción de píxeles saturados"""
+        height, width = bgr.shape[:2]
+        scale = self.THUMBNAIL_SIDE / max(height, width)
+        if scale < 1:
+            # Reducir antes de convertir a gris: se procesan muchos menos píxeles
+            bgr = cv2.resize(bgr, (max(1, round(width * scale)), max(1, round(height * scale))),
+                             interpolation=cv2.INTER_NEAREST)
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+
+        histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+        levels = np.arange(256, dtype=np.float64)
+        pixels = histogram.sum()
+        brightness = float(histogram @ levels / pixels)
+        contrast = float(np.sqrt(histogram @ (levels - brightness) ** 2 / pixels))
+        saturated_ratio = float(histogram[250:].sum() / pixels)
+        return {"brightness": brightness, "contrast": contrast, "saturated_ratio": saturated_ratio}
+
+    def measure_face(self, bgr: np.ndarray, face_location: tuple) -> dict:
+        """Tamaño relativo del rostro y varianza del Laplaciano sobre el rostro"""
+        top, right, bottom, left = face_location
+        height, width = bgr.shape[:2]
+        face_ratio = max((right - left) / width, (bottom - top) / height)
+
+        face = cv2.cvtColor(bgr[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+        face_height = max(1, round(face.shape[0] * self.FACE_SHARPNESS_WIDTH / face.shape[1]))
+        face = cv2.resize(face, (self.FACE_SHARPNESS_WIDTH, face_height), interpolation=cv2.INTER_AREA)
+        sharpness = float(cv2.Laplacian(face, cv2.CV_64F).var())
+        return {"face_ratio": float(face_ratio), "sharpness": sharpness}
+
+    def _frame_reason(self, bgr: np.ndarray):
+        if min(bgr.shape[:2]) < self.min_image_side:
+            return "image_too_small"
+        metrics = self.measure_frame(bgr)
+        if metrics["brightness"] < self.min_brightness:
+            return "too_dark"
+        if metrics["brightness"] > self.max_brightness or metrics["saturated_ratio"] > self.max_saturated_ratio:
+            return "overexposed"
+        if metrics["contrast"] < self.min_contrast:
+            return "low_contrast"
+        return None
+
+    def _face_reason(self, bgr: np.ndarray, face_location: tuple):
+        metrics = self.measure_face(bgr, face_location)
+        if metrics["face_ratio"] < self.min_face_ratio:
+            return "face_too_small"
+        if metrics["sharpness"] < self.min_sharpness:
+            return "blurry"
+        return None
+
+    def _check(self, measure, *args) -> None:
+        started = time.perf_counter()
+        reason = measure(*args)
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._total_ms += elapsed
+            if reason:
+                self._rejected[reason] += 1
+        if reason:
+            print(f"[LOG] Frame rechazado por calidad: {reason} ({elapsed:.2f}ms)")
+            raise FrameQualityError(reason)
+
+    def check_frame(self, bgr: np.ndarray) -> None:
+        """
+        Revisa el frame completo antes de la detección
+
+        Raises:
+            FrameQualityError: Con el motivo para reintentar
+        """
+        with self._lock:
+            self._checked += 1
+        self._check(self._frame_reason, bgr)
+
+    def check_face(self, bgr: np.ndarray, face_location: tuple) -> None:
+        """
+        Revisa el rostro detectado antes de liveness y encoding
+
+        Raises:
+            FrameQualityError: Con el motivo para reintentar
+        """
+        self._check(self._face_reason, bgr, face_location)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rejected = sum(self._rejected.values())
+            return {
+                "checked": self._checked,
+                "rejected": rejected,
+                "rejected_by_reason": dict(self._rejected),
+                "reject_rate": round(rejected / self._checked, 4) if self._checked else 0.0,
+                "avg_check_ms": round(self._total_ms / self._checked, 3) if self._checked else 0.0
+            }
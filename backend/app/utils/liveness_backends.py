@@ -0,0 +1,162 @@
+import threading
+
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+
+class TorchYoloBackend:
+    """
+    Liveness con YOLO de ultralytics (PyTorch, float32)
+
+    Devuelve las detecciones en el mismo formato que OnnxYoloBackend para
+    que la lógica de decisión no dependa del backend.
+
+    El modelo de ultralytics no es thread-safe (guarda el predictor y su
+    estado en el objeto): las llamadas se serializan con un lock, así que
+    debe existir una sola instancia por modelo.
+    """
+
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def predict_batch(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Una sola llamada a YOLO para varios frames BGR
+
+        Returns:
+            Un arreglo (N, 6) por frame con [x1, y1, x2, y2, confianza, clase]
+            en coordenadas del frame
+        """
+        with self._lock:
+            results = self.model(images, verbose=False)
+        return [result.boxes.data.cpu().numpy().astype(np.float32) for result in results]
+
+
+class OnnxYoloBackend:
+    """
+    Liveness con YOLOv8 exportado a ONNX y ejecutado con onnxruntime en CPU
+
+    Reproduce el pre y post-procesamiento de ultralytics (letterbox,
+    umbral de confianza y NMS por clase), de modo que no hace falta
+    importar torch en los workers de la API. El modelo puede estar
+    cuantizado a INT8 (ver scripts/export_yolo_onnx.py).
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_path: str,
+        input_size: int = 640,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.7,
+        max_detections: int = 300,
+        intra_op_threads: int = 0
+    ):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exportado con dynamic=True el lote es simbólico; si es fijo se corre frame a frame
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        self.input_size = input_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+    def _letterbox(self, image: np.ndarray) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        """Redimensiona conservando proporción y rellena con gris (114) como ultralytics"""
+        height, width = image.shape[:2]
+        ratio = min(self.input_size / height, self.input_size / width)
+        new_width, new_height = round(width * ratio), round(height * ratio)
+        pad_x = (self.input_size - new_width) / 2
+        pad_y = (self.input_size - new_height) / 2
+
+        if (new_width, new_height) != (width, height):
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+        left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, ratio, (left, top)
+
+    def _preprocess(self, image: np.ndarray) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        padded, ratio, pad = self._letterbox(image)
+        # BGR HWC uint8 -> RGB CHW float32 [0, 1]
+        blob = padded[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+        return np.ascontiguousarray(blob), ratio, pad
+
+    def _postprocess(self, output: np.ndarray, ratio: float, pad: Tuple[float, float], shape: Tuple[int, int]) -> np.ndarray:
+        """
+        Salida cruda (84, 8400) -> detecciones (N, 6) en coordenadas del frame
+        """
+        predictions = output.T  # (8400, 4 + clases)
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > self.conf_threshold
+        if not keep.any():
+            return np.empty((0, 6), dtype=np.float32)
+
+        boxes_cxcywh = predictions[keep, :4]
+        confidences = confidences[keep]
+        class_ids = class_ids[keep]
+
+        # NMS por clase, igual que ultralytics (agnostic=False)
+        boxes_xywh = boxes_cxcywh.copy()
+        boxes_xywh[:, 0] -= boxes_xywh[:, 2] / 2
+        boxes_xywh[:, 1] -= boxes_xywh[:, 3] / 2
+        indices = cv2.dnn.NMSBoxesBatched(
+            boxes_xywh.tolist(),
+            confidences.tolist(),
+            class_ids.tolist(),
+            self.conf_threshold,
+            self.iou_threshold
+        )
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        indices = indices[np.argsort(-confidences[indices])][:self.max_detections]
+
+        # Deshacer el letterbox
+        left, top = pad
+        height, width = shape
+        boxes = boxes_xywh[indices]
+        x1 = np.clip((boxes[:, 0] - left) / ratio, 0, width)
+        y1 = np.clip((boxes[:, 1] - top) / ratio, 0, height)
+        x2 = np.clip((boxes[:, 0] + boxes[:, 2] - left) / ratio, 0, width)
+        y2 = np.clip((boxes[:, 1] + boxes[:, 3] - top) / ratio, 0, height)
+        return np.stack(
+            [x1, y1, x2, y2, confidences[indices], class_ids[indices].astype(np.float32)],
+            axis=1
+        ).astype(np.float32)
+
+    def predict_batch(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Una sola llamada a onnxruntime para varios frames BGR
+
+        Returns:
+            Un arreglo (N, 6) por frame con [x1, y1, x2, y2, confianza, clase]
+            en coordenadas del frame
+        """
+        prepared = [self._preprocess(image) for image in images]
+        blobs = np.stack([blob for blob, _, _ in prepared])
+
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: blobs})[0]
+        else:
+            outputs = np.concatenate([
+                self.session.run(None, {self.input_name: blob[None]})[0] for blob in blobs
+            ])
+
+        return [
+            self._postprocess(output, ratio, pad, image.shape[:2])
+            for output, (_, ratio, pad), image in zip(outputs, prepared, images)
+        ]
@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class MicroBatcher:
+    """
+    Agrupa peticiones concurrentes en lotes para un modelo
+
+    Cada llamada a `submit` encola un elemento y bloquea hasta tener su
+    resultado. Un hilo de fondo toma el primer elemento disponible, espera
+    como máximo `max_wait_ms` a que lleguen más (o hasta `max_batch_size`),
+    ejecuta `predict_batch` una sola vez con todo el lote y devuelve a cada
+    llamador su resultado en el mismo orden.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10,
+        name: str = "micro-batcher"
+    ):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._items = 0
+        self._errors = 0
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Any:
+        """
+        Procesa un elemento dentro del próximo lote
+
+        Returns:
+            El resultado de predict_batch correspondiente a este elemento
+
+        Raises:
+            La excepción de predict_batch si el lote falló
+        """
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Señal de cierre: devolverla para que el bucle principal termine
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect(first)
+            items = [item for item, _ in batch]
+            try:
+                results = self.predict_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: se esperaban {len(items)} resultados, llegaron {len(results)}")
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._stats_lock:
+                    self._batch_sizes[len(batch)] += 1
+                    self._items += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """
+        Métricas de los lotes ejecutados
+
+        Returns:
+            Dict con número de lotes, elementos procesados, tamaño medio y
+            un histograma tamaño_de_lote -> cantidad de lotes
+        """
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "batches": batches,
+                "items": self._items,
+                "errors": self._errors,
+                "avg_batch_size": round(self._items / batches, 2) if batches else 0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items()))
+            }
+
+    def close(self) -> None:
+        """Detiene el hilo de fondo cuando termina el lote en curso"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
@@ -0,0 +1,217 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+HASH_DHASH = "dhash"
+HASH_PHASH = "phash"
+
+
+def dhash(bgr: np.ndarray) -> int:
+    """
+    Hash de diferencias de 64 bits: compara píxeles vecinos de la imagen
+    reducida a 9x8 en escala de grises
+    """
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if bgr.ndim == 3 else bgr
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def phash(bgr: np.ndarray) -> int:
+    """
+    Hash perceptual de 64 bits: signo de las frecuencias bajas (8x8) de la
+    DCT de la imagen reducida a 32x32, respecto a su mediana
+    """
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if bgr.ndim == 3 else bgr
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+# Estados de un frame recordado
+REPLAY_PENDING = "pending"    # En verificación (todavía sin resultado)
+REPLAY_VERIFIED = "verified"  # Inició sesión
+REPLAY_FAILED = "failed"      # Rechazado
+
+
+class FrameReplayCache:
+    """
+    Frames vistos recientemente por usuario para detectar reenvíos
+
+    - `begin` registra el digest de los bytes antes de ejecutar cualquier
+      modelo: un envío con bytes idénticos (también uno concurrente, aún en
+      verificación) se detecta sin MediaPipe, YOLO ni dlib
+    - `match_face` (opcional, desactivado con `face_ttl_seconds=0`) compara
+      el hash perceptual de la región del rostro solo contra frames que
+      iniciaron sesión hace menos de `face_ttl_seconds`, con una distancia
+      de Hamming <= max_distance. Una nueva captura real de la misma
+      persona suele dar el mismo hash, así que la ventana debe ser de
+      pocos segundos
+    - Los rechazos se recuerdan solo `failed_ttl_seconds` y solo para bytes
+      idénticos: un frame parecido a uno rechazado se vuelve a verificar
+
+    La memoria está acotada: como máximo `max_users` usuarios (LRU) y
+    `max_frames_per_user` frames por usuario; los frames que iniciaron
+    sesión expiran a los `ttl_seconds` (solo se comparan por sus bytes).
+    """
+
+    def __init__(
+        self,
+        max_users: int = 10000,
+        max_frames_per_user: int = 8,
+        ttl_seconds: float = 300,
+        max_distance: int = 0,
+        hash_method: str = HASH_DHASH,
+        failed_ttl_seconds: float = 5,
+        face_ttl_seconds: float = 0
+    ):
+        self.max_users = max_users
+        self.max_frames_per_user = max_frames_per_user
+        self.ttl_seconds = ttl_seconds
+        self.failed_ttl_seconds = failed_ttl_seconds
+        self.face_ttl_seconds = face_ttl_seconds
+        self.max_distance = max_distance
+        self._hash = phash if hash_method == HASH_PHASH else dhash
+        self.hash_method = HASH_PHASH if hash_method == HASH_PHASH else HASH_DHASH
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, deque]" = OrderedDict()
+        self._counters = {"exact_hits": 0, "in_flight_hits": 0, "near_hits": 0, "misses": 0,
+                          "expired": 0, "evicted_users": 0}
+
+    @property
+    def matches_faces(self) -> bool:
+        """True si match_face compara rostros (face_ttl_seconds > 0)"""
+        return self.face_ttl_seconds > 0
+
+    @staticmethod
+    def digest(image_data: Optional[bytes]) -> Optional[bytes]:
+        return hashlib.blake2b(image_data, digest_size=16).digest() if image_data else None
+
+    def face_hash(self, bgr: np.ndarray, face_location: tuple) -> Optional[int]:
+        """Hash perceptual de la región del rostro (top, right, bottom, left)"""
+        top, right, bottom, left = face_location
+        face = bgr[max(0, top):bottom, max(0, left):right]
+        if face.size == 0:
+            return None
+        return self._hash(face)
+
+    @staticmethod
+    def _remove_unlocked(frames: deque, entry: dict) -> None:
+        # Por identidad: dos entradas pueden tener el mismo contenido
+        for index, other in enumerate(frames):
+            if other is entry:
+                del frames[index]
+                return
+
+    def _prune_unlocked(self, frames: deque, now: float) -> None:
+        for entry in [entry for entry in frames if entry["expires_at"] <= now]:
+            self._remove_unlocked(frames, entry)
+            self._counters["expired"] += 1
+
+    def _frames_unlocked(self, user_id: str, now: float) -> deque:
+        frames = self._users.get(user_id)
+        if frames is None:
+            frames = deque(maxlen=self.max_frames_per_user)
+            self._users[user_id] = frames
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self._counters["evicted_users"] += 1
+        else:
+            self._users.move_to_end(user_id)
+            self._prune_unlocked(frames, now)
+        return frames
+
+    def begin(self, user_id: str, digest: Optional[bytes]) -> tuple:
+        """
+        Busca los bytes entre los frames recientes y, si no están, los
+        registra como en verificación
+
+        Returns:
+            (reenvío, entrada): reenvío es None o un dict con "state"
+            (pending, verified o failed), "exact", "distance" y "detail";
+            entrada es None si fue un reenvío (se pasa a match_face y finish)
+        """
+        now = time.monotonic()
+        with self._lock:
+            frames = self._frames_unlocked(user_id, now)
+            if digest is not None:
+                for entry in frames:
+                    if entry["digest"] == digest:
+                        counter = "in_flight_hits" if entry["state"] == REPLAY_PENDING else "exact_hits"
+                        self._counters[counter] += 1
+                        return {"state": entry["state"], "exact": True, "distance": 0, "detail": entry["detail"]}, None
+            entry = {"user_id": user_id, "digest": digest, "hash": None, "state": REPLAY_PENDING,
+                     "detail": None, "verified_at": None, "expires_at": now + self.ttl_seconds}
+            frames.append(entry)
+            return None, entry
+
+    def match_face(self, entry: dict, face_hash: Optional[int]) -> Optional[dict]:
+        """
+        Compara el rostro con los frames que iniciaron sesión hace menos de
+        `face_ttl_seconds` y guarda su hash en la entrada
+
+        Returns:
+            None o un dict como el de begin (state verified, exact False)
+        """
+        if face_hash is None or not self.matches_faces:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry["hash"] = face_hash
+            frames = self._users.get(entry["user_id"], ())
+            best = None
+            for other in frames:
+                if other is entry or other["state"] != REPLAY_VERIFIED or other["hash"] is None:
+                    continue
+                if now - other["verified_at"] >= self.face_ttl_seconds:
+                    continue
+                distance = bin(other["hash"] ^ face_hash).count("1")
+                if distance <= self.max_distance and (best is None or distance < best["distance"]):
+                    best = {"state": REPLAY_VERIFIED, "exact": False, "distance": distance, "detail": None}
+            self._counters["near_hits" if best is not None else "misses"] += 1
+            return best
+
+    def finish(self, entry: dict, verified: Optional[bool], detail: str = None) -> None:
+        """
+        Registra el resultado de la verificación
+
+        Args:
+            verified: True (inició sesión), False (rechazo por la imagen) o
+                None (falla ajena a la imagen: se olvida el frame)
+        """
+        with self._lock:
+            frames = self._users.get(entry["user_id"])
+            if verified is None:
+                if frames is not None:
+                    self._remove_unlocked(frames, entry)
+                return
+            if verified:
+                entry["state"] = REPLAY_VERIFIED
+                entry["verified_at"] = time.monotonic()
+            else:
+                entry["state"] = REPLAY_FAILED
+                entry["detail"] = detail
+                entry["expires_at"] = min(entry["expires_at"], time.monotonic() + self.failed_ttl_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counters["exact_hits"] + self._counters["in_flight_hits"] + self._counters["near_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "users": len(self._users),
+                "frames": sum(len(frames) for frames in self._users.values()),
+                "hash_method": self.hash_method,
+                "ttl_seconds": self.ttl_seconds,
+                "failed_ttl_seconds": self.failed_ttl_seconds,
+                "face_ttl_seconds": self.face_ttl_seconds,
+                "max_distance": self.max_distance
+            }
@@ -0,0 +1,527 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos en disco local
+    fcntl = None
+
+
+STORAGE_LOCAL = "local"
+STORAGE_GCS = "gcs"
+STORAGE_MEMORY = "memory"
+
+# Objetos que no cambian una vez escritos (imágenes y encodings): se pueden
+# cachear sin validar; los manifiestos y el historial de coincidencias no
+CACHEABLE_SUFFIXES = (".jpg", ".npz")
+
+
+class StorageBackend(ABC):
+    """
+    Almacenamiento de los archivos de facial_data
+
+    Los servicios siguen trabajando con rutas bajo `root` (facial_data); cada
+    backend las traduce a claves relativas ("ab/cd/<user_id>/face_x.jpg").
+    Interfaz común:
+
+    - read(path) -> bytes (FileNotFoundError si no existe)
+    - write(path, data) y write_batch(groups): escritura atómica; en un
+      lote cada grupo se confirma completo o no se confirma
+    - write_if_version(path, data, version): escritura condicional para
+      read-modify-write entre procesos (manifiestos)
+    - exists, delete, version (cambia con cada escritura; None si no existe)
+    - list_files(dir) -> {nombre: {"size", "mtime"}} y list_dirs(dir) -> [nombre]
+
+    Los métodos sin implementación común son abstractos: un backend
+    incompleto falla al crearse, no en la primera escritura condicional.
+    """
+
+    name = "base"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def key(self, path: Union[str, Path]) -> str:
+        path = Path(path)
+        if path.is_absolute():
+            path = path.relative_to(self.root)
+        key = path.as_posix()
+        return "" if key == "." else key
+
+    def write(self, path, data: bytes) -> None:
+        error = self.write_batch([[(path, data)]])[0]
+        if error is not None:
+            raise error
+
+    def is_dir(self, path) -> bool:
+        return bool(self.list_files(path)) or bool(self.list_dirs(path))
+
+    @abstractmethod
+    def read(self, path) -> bytes:
+        ...
+
+    @abstractmethod
+    def write_batch(self, groups: list) -> list:
+        """
+        Escribe grupos de (ruta, datos); cada grupo se confirma completo o no
+
+        Returns:
+            Por grupo, None o la excepción que impidió confirmarlo
+        """
+
+    @abstractmethod
+    def write_if_version(self, path, data: bytes, expected_version: Optional[tuple]) -> Optional[tuple]:
+        """
+        Escribe solo si la versión actual es `expected_version` (None = no existe)
+
+        Returns:
+            Versión nueva, o None si otro escritor la cambió antes
+        """
+
+    @abstractmethod
+    def exists(self, path) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, path) -> None:
+        ...
+
+    @abstractmethod
+    def version(self, path) -> Optional[tuple]:
+        ...
+
+    @abstractmethod
+    def list_files(self, path) -> dict:
+        ...
+
+    @abstractmethod
+    def list_dirs(self, path) -> list:
+        ...
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Disco local (o un volumen compartido montado)
+
+    write_batch escribe todos los temporales del lote, los sincroniza
+    juntos, los renombra y sincroniza cada directorio una sola vez.
+    """
+
+    name = STORAGE_LOCAL
+
+    def _path(self, path) -> Path:
+        return self.root / self.key(path)
+
+    def read(self, path) -> bytes:
+        return self._path(path).read_bytes()
+
+    def write_batch(self, groups: list) -> list:
+        errors = [None] * len(groups)
+        staged = [[] for _ in groups]  # (archivo temporal abierto, ruta temporal, ruta final)
+
+        for index, items in enumerate(groups):
+            try:
+                for path, data in items:
+                    path = self._path(path)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    # Temporal único en el mismo directorio: varios hilos o procesos
+                    # pueden escribir la misma ruta a la vez (el último rename gana)
+                    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+                    tmp_path = Path(tmp_name)
+                    # Queda abierto hasta el fsync del lote
+                    tmp_file = os.fdopen(fd, "wb")
+                    staged[index].append((tmp_file, tmp_path, path))
+                    tmp_file.write(data)
+                    tmp_file.flush()
+            except Exception as e:
+                errors[index] = e
+
+        directories = set()
+        for index, files in enumerate(staged):
+            try:
+                if errors[index] is None:
+                    for tmp_file, _, _ in files:
+                        os.fsync(tmp_file.fileno())
+                        tmp_file.close()
+                    for _, tmp_path, path in files:
+                        os.replace(tmp_path, path)
+                        directories.add(path.parent)
+                    continue
+            except Exception as e:
+                errors[index] = e
+            for tmp_file, tmp_path, _ in files:
+                try:
+                    tmp_file.close()
+                    tmp_path.unlink(missing_ok=True)
+                except OSError:
+                    pass
+
+        for directory in directories:
+            self._fsync_dir(directory)
+        return errors
+
+    @staticmethod
+    def _fsync_dir(directory: Path) -> None:
+        """Persiste los renames del directorio (no disponible en Windows)"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def write_if_version(self, path, data: bytes, expected_version: Optional[tuple]) -> Optional[tuple]:
+        target = self._path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Lock entre procesos en un archivo aparte: el rename cambia el inodo del destino
+        with open(target.with_name(f".{target.name}.lock"), "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Se libera al cerrar
+            if self.version(path) != expected_version:
+                return None
+            self.write(path, data)
+            return self.version(path)
+
+    def exists(self, path) -> bool:
+        return self._path(path).exists()
+
+    def delete(self, path) -> None:
+        self._path(path).unlink(missing_ok=True)
+
+    def version(self, path) -> Optional[tuple]:
+        try:
+            stat = self._path(path).stat()
+        except FileNotFoundError:
+            return None
+        # Cada rename crea un inodo nuevo
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def list_files(self, path) -> dict:
+        directory = self._path(path)
+        if not directory.is_dir():
+            return {}
+        files = {}
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = {"size": stat.st_size, "mtime": stat.st_mtime}
+        return files
+
+    def list_dirs(self, path) -> list:
+        directory = self._path(path)
+        if not directory.is_dir():
+            return []
+        return [entry.name for entry in os.scandir(directory) if entry.is_dir()]
+
+    def is_dir(self, path) -> bool:
+        return self._path(path).is_dir()
+
+
+class GcsStorageBackend(StorageBackend):
+    """
+    Bucket de Google Cloud Storage (google-cloud-storage)
+
+    Cada objeto se sube completo (atómico en GCS); la versión es la
+    generación del objeto. El cliente se crea la primera vez que se usa.
+    """
+
+    name = STORAGE_GCS
+
+    def __init__(self, root: Path, bucket_name: str, prefix: str = "facial_data", client=None):
+        super().__init__(root)
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+        self._client = client
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    if self._client is None:
+                        from google.cloud import storage
+                        self._client = storage.Client()
+                    self._bucket = self._client.bucket(self.bucket_name)
+        return self._bucket
+
+    def _name(self, path) -> str:
+        key = self.key(path)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _dir_prefix(self, path) -> str:
+        name = self._name(path).rstrip("/")
+        return f"{name}/" if name else ""
+
+    def read(self, path) -> bytes:
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.bucket.blob(self._name(path)).download_as_bytes()
+        except NotFound:
+            raise FileNotFoundError(self._name(path))
+
+    def write_batch(self, groups: list) -> list:
+        errors = []
+        for items in groups:
+            try:
+                for path, data in items:
+                    self.bucket.blob(self._name(path)).upload_from_string(data)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def write_if_version(self, path, data: bytes, expected_version: Optional[tuple]) -> Optional[tuple]:
+        from google.api_core.exceptions import PreconditionFailed
+        blob = self.bucket.blob(self._name(path))
+        # Generación 0 = el objeto no debe existir
+        generation = 0 if expected_version is None else expected_version[0]
+        try:
+            blob.upload_from_string(data, if_generation_match=generation)
+        except PreconditionFailed:
+            return None
+        return blob.generation, blob.size
+
+    def exists(self, path) -> bool:
+        return self.bucket.blob(self._name(path)).exists()
+
+    def delete(self, path) -> None:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.bucket.blob(self._name(path)).delete()
+        except NotFound:
+            pass
+
+    def version(self, path) -> Optional[tuple]:
+        blob = self.bucket.get_blob(self._name(path))
+        return None if blob is None else (blob.generation, blob.size)
+
+    def list_files(self, path) -> dict:
+        prefix = self._dir_prefix(path)
+        blobs = self.bucket.client.list_blobs(self.bucket, prefix=prefix, delimiter="/")
+        return {
+            blob.name[len(prefix):]: {"size": blob.size, "mtime": blob.updated.timestamp() if blob.updated else 0.0}
+            for blob in blobs
+        }
+
+    def list_dirs(self, path) -> list:
+        prefix = self._dir_prefix(path)
+        blobs = self.bucket.client.list_blobs(self.bucket, prefix=prefix, delimiter="/")
+        for _ in blobs.pages:
+            pass  # Los "subdirectorios" se conocen al recorrer las páginas
+        return [name[len(prefix):].rstrip("/") for name in blobs.prefixes]
+
+    def is_dir(self, path) -> bool:
+        return any(True for _ in self.bucket.client.list_blobs(
+            self.bucket, prefix=self._dir_prefix(path), max_results=1
+        ))
+
+
+class MemoryStorageBackend(StorageBackend):
+    """Almacenamiento en memoria (pruebas y desarrollo sin disco ni bucket)"""
+
+    name = STORAGE_MEMORY
+
+    def __init__(self, root: Path):
+        super().__init__(root)
+        self._lock = threading.Lock()
+        self._objects = {}  # clave -> (bytes, versión, mtime)
+        self._writes = 0
+
+    def read(self, path) -> bytes:
+        with self._lock:
+            entry = self._objects.get(self.key(path))
+        if entry is None:
+            raise FileNotFoundError(self.key(path))
+        return entry[0]
+
+    def write_batch(self, groups: list) -> list:
+        with self._lock:
+            for items in groups:
+                for path, data in items:
+                    self._writes += 1
+                    self._objects[self.key(path)] = (bytes(data), self._writes, time.time())
+        return [None] * len(groups)
+
+    def write_if_version(self, path, data: bytes, expected_version: Optional[tuple]) -> Optional[tuple]:
+        with self._lock:
+            entry = self._objects.get(self.key(path))
+            if (None if entry is None else (entry[1],)) != expected_version:
+                return None
+            self._writes += 1
+            self._objects[self.key(path)] = (bytes(data), self._writes, time.time())
+            return (self._writes,)
+
+    def exists(self, path) -> bool:
+        with self._lock:
+            return self.key(path) in self._objects
+
+    def delete(self, path) -> None:
+        with self._lock:
+            self._objects.pop(self.key(path), None)
+
+    def version(self, path) -> Optional[tuple]:
+        with self._lock:
+            entry = self._objects.get(self.key(path))
+        return None if entry is None else (entry[1],)
+
+    def _children(self, path) -> list:
+        key = self.key(path)
+        prefix = f"{key}/" if key else ""
+        with self._lock:
+            return [(name[len(prefix):], entry) for name, entry in self._objects.items() if name.startswith(prefix)]
+
+    def list_files(self, path) -> dict:
+        return {
+            name: {"size": len(entry[0]), "mtime": entry[2]}
+            for name, entry in self._children(path) if "/" not in name
+        }
+
+    def list_dirs(self, path) -> list:
+        return sorted({name.split("/", 1)[0] for name, _ in self._children(path) if "/" in name})
+
+
+class CachedStorage:
+    """
+    Caché LRU en memoria, acotada en bytes, delante de un backend
+
+    Lectura a través de la caché solo para objetos que no cambian una vez
+    escritos (imágenes y encodings, CACHEABLE_SUFFIXES), así los templates
+    de los usuarios frecuentes no se vuelven a leer del disco o del bucket.
+    Las escrituras actualizan la caché (write-through) y los borrados la
+    invalidan. El resto de operaciones pasan directo al backend.
+    """
+
+    def __init__(self, backend: StorageBackend, max_bytes: int):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    @property
+    def root(self) -> Path:
+        return self.backend.root
+
+    def __getattr__(self, attribute):
+        # exists, version, list_files, list_dirs, is_dir, key...
+        return getattr(self.backend, attribute)
+
+    @staticmethod
+    def _cacheable(key: str) -> bool:
+        return key.endswith(CACHEABLE_SUFFIXES)
+
+    def _put_unlocked(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters["evictions"] += 1
+
+    def _drop_unlocked(self, key: str) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+
+    def read(self, path) -> bytes:
+        key = self.backend.key(path)
+        if not self._cacheable(key):
+            return self.backend.read(path)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return data
+            self._counters["misses"] += 1
+        data = self.backend.read(path)
+        with self._lock:
+            self._put_unlocked(key, data)
+        return data
+
+    def write(self, path, data: bytes) -> None:
+        error = self.write_batch([[(path, data)]])[0]
+        if error is not None:
+            raise error
+
+    def write_batch(self, groups: list) -> list:
+        errors = self.backend.write_batch(groups)
+        with self._lock:
+            for items, error in zip(groups, errors):
+                for path, data in items:
+                    key = self.backend.key(path)
+                    if error is None and self._cacheable(key):
+                        self._put_unlocked(key, bytes(data))
+                    else:
+                        self._drop_unlocked(key)
+        return errors
+
+    def write_if_version(self, path, data: bytes, expected_version: Optional[tuple]) -> Optional[tuple]:
+        version = self.backend.write_if_version(path, data, expected_version)
+        with self._lock:
+            self._drop_unlocked(self.backend.key(path))
+        return version
+
+    def delete(self, path) -> None:
+        self.backend.delete(path)
+        with self._lock:
+            self._drop_unlocked(self.backend.key(path))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+def create_storage(
+    backend: str,
+    root: Path,
+    gcs_bucket: str = "",
+    gcs_prefix: str = "facial_data",
+    cache_bytes: int = 0
+):
+    """
+    Crea el almacenamiento configurado, con caché LRU si cache_bytes > 0
+
+    Raises:
+        ValueError: Si el backend no existe o falta el bucket de GCS
+    """
+    if backend == STORAGE_LOCAL:
+        storage = LocalStorageBackend(root)
+    elif backend == STORAGE_GCS:
+        if not gcs_bucket:
+            raise ValueError("FACIAL_STORAGE_BACKEND=gcs requiere FACIAL_GCS_BUCKET")
+        storage = GcsStorageBackend(root, gcs_bucket, gcs_prefix)
+    elif backend == STORAGE_MEMORY:
+        storage = MemoryStorageBackend(root)
+    else:
+        raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
+    return CachedStorage(storage, cache_bytes) if cache_bytes > 0 else storage
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+# Memoria aproximada por template además del encoding (ruta, dict, array)
+_TEMPLATE_OVERHEAD_BYTES = 256
+
+
+class UserTemplateCache:
+    """
+    Encodings de los templates de cada usuario en memoria
+
+    Evita volver a leer y decodificar los encodings del usuario (npz) en
+    cada login o verificación. Las entradas son por usuario:
+    {ruta de la imagen: encoding}, y se completan a medida que se comparan
+    los templates (en first_match no se cargan los que no se usan).
+
+    - LRU por usuario acotada en bytes (`max_bytes`): al superarla se
+      descarta el usuario usado hace más tiempo
+    - Cada usuario expira a los `ttl_seconds` de cargado, así se ven los
+      cambios hechos por otro proceso
+    - `invalidate(user_id)` se llama al registrar o borrar capturas
+
+    Los encodings se guardan como solo lectura porque se comparten entre
+    peticiones.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 600):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "evicted_users": 0, "invalidations": 0}
+
+    @staticmethod
+    def _size(encoding: np.ndarray) -> int:
+        return encoding.nbytes + _TEMPLATE_OVERHEAD_BYTES
+
+    def _drop_unlocked(self, user_id: str) -> None:
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry["bytes"]
+
+    def get(self, user_id: str, image_path) -> Optional[np.ndarray]:
+        """Encoding en caché del template (None si no está o expiró)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and now >= entry["expires_at"]:
+                self._drop_unlocked(user_id)
+                self._counters["expired"] += 1
+                entry = None
+            encoding = entry["templates"].get(str(image_path)) if entry is not None else None
+            if encoding is None:
+                self._counters["misses"] += 1
+                return None
+            self._users.move_to_end(user_id)
+            self._counters["hits"] += 1
+            return encoding
+
+    def put(self, user_id: str, image_path, encoding: np.ndarray) -> None:
+        """Guarda el encoding de un template del usuario"""
+        encoding = np.array(encoding, copy=True)
+        encoding.flags.writeable = False
+        size = self._size(encoding)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = {"templates": {}, "bytes": 0, "expires_at": time.monotonic() + self.ttl_seconds}
+                self._users[user_id] = entry
+            else:
+                self._users.move_to_end(user_id)
+            previous = entry["templates"].get(str(image_path))
+            if previous is not None:
+                entry["bytes"] -= self._size(previous)
+                self._bytes -= self._size(previous)
+            entry["templates"][str(image_path)] = encoding
+            entry["bytes"] += size
+            self._bytes += size
+
+            # El usuario actual quedó al final: se descartan los menos recientes
+            while self._bytes > self.max_bytes and len(self._users) > 1:
+                self._drop_unlocked(next(iter(self._users)))
+                self._counters["evicted_users"] += 1
+            if self._bytes > self.max_bytes:
+                # Un solo usuario con más templates de los que caben
+                self._drop_unlocked(user_id)
+                self._counters["evicted_users"] += 1
+
+    def invalidate(self, user_id: str) -> None:
+        """Descarta los templates en caché del usuario"""
+        with self._lock:
+            if user_id in self._users:
+                self._drop_unlocked(user_id)
+                self._counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "users": len(self._users),
+                "templates": sum(len(entry["templates"]) for entry in self._users.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds
+            }
@@ -0,0 +1,180 @@
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+
+class TemplateMatchStats:
+    """
+    Historial de coincidencias por imagen registrada (template) de cada usuario
+
+    Guarda cuántas veces coincidió cada template y cuándo fue la última vez,
+    para que las siguientes verificaciones prueben primero los templates que
+    suelen coincidir. Se persiste como JSON en el directorio del usuario.
+
+    - record_match no escribe en el login: acumula la coincidencia en
+      memoria y un hilo la persiste cada `flush_seconds`
+    - Al persistir se relee el archivo, se suman los conteos pendientes y
+      se escribe condicionalmente a la versión leída: si otro worker
+      escribió en el medio se vuelve a leer y sumar (hasta
+      MAX_WRITE_ATTEMPTS veces), así no se pisan sus conteos
+    - La copia leída de cada usuario se recarga a los `flush_seconds` y
+      se guardan como máximo `max_users` usuarios (LRU)
+    """
+
+    FILENAME = "match_stats.json"
+    MAX_WRITE_ATTEMPTS = 8
+
+    def __init__(self, storage, flush_seconds: float = 30, max_users: int = 10000):
+        self.storage = storage
+        self.flush_seconds = max(1.0, flush_seconds)
+        self.max_users = max(1, max_users)
+        self._lock = threading.Lock()
+        # user_dir -> (historial persistido, momento de lectura)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_dir -> {filename: {"matches": coincidencias sin persistir, "last_matched": str}}
+        self._pending = {}
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read(self, user_dir: Path) -> tuple:
+        """(versión, historial) persistidos; versión None si no existe"""
+        stats_path = user_dir / self.FILENAME
+        version = self.storage.version(stats_path)
+        if version is None:
+            return None, {}
+        # Si cambia entre el stat y la lectura, la escritura condicional falla y se reintenta
+        try:
+            return version, json.loads(self.storage.read(stats_path))
+        except FileNotFoundError:
+            return None, {}
+        except Exception as e:
+            print(f"[WARN] Historial de coincidencias corrupto en {stats_path}: {e}")
+            return version, {}
+
+    def _write_merged(self, user_dir: Path, deltas: dict) -> dict:
+        """
+        Suma `deltas` al historial persistido con escritura condicional
+
+        Returns:
+            Historial escrito
+
+        Raises:
+            OSError: Si otro worker lo cambió en cada intento
+        """
+        stats_path = user_dir / self.FILENAME
+        for attempt in range(self.MAX_WRITE_ATTEMPTS):
+            if attempt:
+                # Espera aleatoria creciente: los workers en conflicto se desfasan
+                time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+            version, stats = self._read(user_dir)
+            stats = self._merge(stats, deltas)
+            content = json.dumps(stats).encode("utf-8")
+            if self.storage.write_if_version(stats_path, content, version) is not None:
+                return stats
+        raise OSError(f"El historial de coincidencias de {user_dir} cambió en cada intento de escritura")
+
+    @staticmethod
+    def _merge(stats: dict, deltas: dict) -> dict:
+        merged = dict(stats)
+        for filename, delta in deltas.items():
+            entry = merged.get(filename, {"matches": 0, "last_matched": ""})
+            merged[filename] = {
+                "matches": entry.get("matches", 0) + delta["matches"],
+                "last_matched": max(entry.get("last_matched", ""), delta["last_matched"])
+            }
+        return merged
+
+    def _load(self, user_dir: Path) -> dict:
+        """Historial persistido más las coincidencias aún sin persistir"""
+        key = str(user_dir)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.flush_seconds:
+                self._cache.move_to_end(key)
+                return self._merge(cached[0], self._pending.get(key, {}))
+
+        # La lectura queda fuera del lock: no bloquea a los demás usuarios
+        _, stats = self._read(user_dir)
+        with self._lock:
+            self._cache[key] = (stats, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+            return self._merge(stats, self._pending.get(key, {}))
+
+    def order(self, image_paths: list) -> list:
+        """
+        Ordena los templates: primero los que más coinciden, luego los más
+        recientes en coincidir; sin historial se mantiene el orden recibido
+        """
+        if not image_paths:
+            return []
+
+        stats = self._load(Path(image_paths[0]).parent)
+
+        def entry(path) -> dict:
+            return stats.get(Path(path).name, {})
+
+        # Ordenamientos estables: el último criterio aplicado es el principal
+        ordered = sorted(image_paths, key=lambda path: entry(path).get("last_matched", ""), reverse=True)
+        ordered.sort(key=lambda path: entry(path).get("matches", 0), reverse=True)
+        return ordered
+
+    def record_match(self, image_path) -> None:
+        """Registra que el template coincidió (se persiste en el próximo flush)"""
+        image_path = Path(image_path)
+        with self._lock:
+            deltas = self._pending.setdefault(str(image_path.parent), {})
+            delta = deltas.setdefault(image_path.name, {"matches": 0, "last_matched": ""})
+            delta["matches"] += 1
+            delta["last_matched"] = datetime.now().isoformat()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="template-match-stats", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Persiste las coincidencias acumuladas
+
+        Returns:
+            Cantidad de usuarios escritos
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            written = 0
+            for key, deltas in pending.items():
+                user_dir = Path(key)
+                try:
+                    stats = self._write_merged(user_dir, deltas)
+                except Exception as e:
+                    print(f"[WARN] No se pudo guardar historial de coincidencias de {user_dir}: {e}")
+                    with self._lock:
+                        # Se reintenta en el próximo flush
+                        self._pending[key] = self._merge(deltas, self._pending.get(key, {}))
+                    continue
+                written += 1
+                with self._lock:
+                    self._cache[key] = (stats, time.monotonic())
+                    while len(self._cache) > self.max_users:
+                        self._cache.popitem(last=False)
+            return written
+
+    def close(self) -> None:
+        """Persiste lo pendiente y detiene el hilo (al apagar la aplicación)"""
+        self._stop.set()
+        self.flush()
+
+    def forget_user(self, user_dir: Path) -> None:
+        with self._lock:
+            self._cache.pop(str(user_dir), None)
@@ -0,0 +1,85 @@
+"""
+📊 BENCHMARK - ÍNDICE APROXIMADO (IVF) PARA BÚSQUEDA FACIAL 1:N
+
+Compara la búsqueda exacta de FaceGalleryIndex con la búsqueda IVF sobre
+encodings sintéticos de 128 dimensiones y reporta recall@1 y latencia p99.
+
+Uso:
+    python benchmarks/bench_ann_index.py
+    python benchmarks/bench_ann_index.py --sizes 10000 100000 1000000 --n-probe 8 16 32
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.face_gallery import FaceGalleryIndex  # noqa: E402
+
+
+def synthetic_gallery(size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Genera encodings con estructura de identidades: centros aleatorios con
+    una dispersión similar a la de encodings dlib de la misma persona
+    """
+    n_clusters = max(1, size // 50)
+    centers = rng.normal(0, 0.09, size=(n_clusters, 128)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=size)
+    return centers[labels] + rng.normal(0, 0.02, size=(size, 128)).astype(np.float32)
+
+
+def run(size: int, n_probes: list, queries: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    vectors = synthetic_gallery(size, rng)
+
+    started = time.perf_counter()
+    gallery = FaceGalleryIndex(initial_capacity=size, ann_min_size=1, ann_n_probe=n_probes[0])
+    gallery.build((f"user_{i}", vector) for i, vector in enumerate(vectors))
+    build_seconds = time.perf_counter() - started
+
+    # Consultas = rostros registrados con ruido (otra captura de la misma persona)
+    probe_rows = rng.integers(0, size, size=queries)
+    probes = vectors[probe_rows] + rng.normal(0, 0.02, size=(queries, 128)).astype(np.float32)
+
+    exact_results = []
+    exact_latencies = []
+    for probe in probes:
+        started = time.perf_counter()
+        exact_results.append(gallery.search(probe, exact=True))
+        exact_latencies.append(time.perf_counter() - started)
+
+    print(f"\n=== {size:,} encodings (build {build_seconds:.1f}s) ===")
+    print(f"exacto      recall@1=1.000  p50={np.percentile(exact_latencies, 50) * 1000:7.3f}ms  "
+          f"p99={np.percentile(exact_latencies, 99) * 1000:7.3f}ms")
+
+    for n_probe in n_probes:
+        hits = 0
+        latencies = []
+        for probe, (exact_user, _) in zip(probes, exact_results):
+            started = time.perf_counter()
+            user_id, _ = gallery.search(probe, n_probe=n_probe)
+            latencies.append(time.perf_counter() - started)
+            hits += user_id == exact_user
+        print(f"ivf n_probe={n_probe:<3} recall@1={hits / queries:.3f}  "
+              f"p50={np.percentile(latencies, 50) * 1000:7.3f}ms  "
+              f"p99={np.percentile(latencies, 99) * 1000:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del índice IVF de encodings faciales")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.n_probe, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
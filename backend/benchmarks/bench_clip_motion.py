@@ -0,0 +1,193 @@
+"""
+📊 BENCHMARK - CALIBRACIÓN DEL UMBRAL DE MOVIMIENTO DEL CLIP
+
+Mide el "appearance_change" de face_motion (liveness temporal del login
+por clip) sobre clips sintéticos generados a partir de una foto:
+
+- Foto estática: la misma foto sostenida frente a la cámara en cada
+  keyframe, con desplazamiento, rotación, escala e inclinación del plano,
+  cambio de brillo, ruido del sensor, recompresión JPEG y temblor de la
+  caja del detector. Debe quedar por debajo de FACIAL_CLIP_MIN_MOTION.
+- Deformación no rígida: además, una deformación local del rostro de la
+  amplitud indicada (fracción del tamaño del rostro), como aproximación
+  de expresión y parallax de una persona real. Debe quedar por encima.
+
+Con --videos se mide además cada clip real indicado (requiere MediaPipe),
+por ejemplo grabaciones de fotos impresas o en pantalla y de personas.
+
+Uso:
+    python benchmarks/bench_clip_motion.py --box 230,850,640,440
+    python benchmarks/bench_clip_motion.py --image ruta/a/rostro.jpg --clips 500 --jitter 0.1
+    python benchmarks/bench_clip_motion.py --videos foto_impresa.webm persona.webm
+"""
+
+import argparse
+import math
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import (  # noqa: E402
+    FACIAL_CLIP_KEYFRAMES,
+    FACIAL_CLIP_MAX_ANALYZED_FRAMES,
+    FACIAL_CLIP_MAX_SECONDS,
+    FACIAL_CLIP_MIN_MOTION
+)
+from app.utils.clip_sampler import face_motion, sample_keyframes  # noqa: E402
+
+
+def default_image() -> Path:
+    facial_data = Path(__file__).resolve().parent.parent / "app" / "facial_data"
+    return next(facial_data.glob("*/face_*.jpg"))
+
+
+def detect_face(bgr: np.ndarray, pool):
+    """Rostro más grande con MediaPipe en formato (top, right, bottom, left)"""
+    results = pool.process(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    if not results.detections:
+        return None
+    box = max(
+        (d.location_data.relative_bounding_box for d in results.detections),
+        key=lambda b: b.width * b.height
+    )
+    height, width = bgr.shape[:2]
+    left, top = int(box.xmin * width), int(box.ymin * height)
+    return top, left + int(box.width * width), top + int(box.height * height), left
+
+
+def capture(photo: np.ndarray, box: tuple, rng: np.random.Generator, args, deformation: float = 0.0) -> tuple:
+    """Un keyframe de la foto frente a la cámara; devuelve (bgr, caja del detector)"""
+    height, width = photo.shape[:2]
+    top, right, bottom, left = box
+    size = max(bottom - top, right - left)
+    center = ((left + right) / 2, (top + bottom) / 2)
+
+    # Movimiento del plano completo: rotación, escala, desplazamiento e inclinación
+    rigid = cv2.getRotationMatrix2D(center, rng.uniform(-args.rotation, args.rotation),
+                                    rng.uniform(1 - args.scale, 1 + args.scale))
+    rigid[:, 2] += rng.uniform(-args.shift, args.shift, 2) * size
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    tilt = rng.uniform(-args.tilt, args.tilt, (4, 2)) * [width, height]
+    transform = np.vstack([rigid, [0, 0, 1]]) @ cv2.getPerspectiveTransform(corners, (corners + tilt).astype(np.float32))
+    image = cv2.warpPerspective(photo, transform, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+    if deformation:
+        ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+        weight = np.exp(-(((xs - center[0]) / (size / 2)) ** 2 + ((ys - center[1]) / (size / 2)) ** 2))
+        phase = rng.uniform(0, 2 * math.pi, 2)
+        amplitude = deformation * size * weight
+        map_x = xs + amplitude * np.sin(3 * math.pi * (ys - top) / size + phase[0])
+        map_y = ys + amplitude * np.sin(3 * math.pi * (xs - left) / size + phase[1])
+        image = cv2.remap(image, map_x.astype(np.float32), map_y.astype(np.float32),
+                          cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    # Exposición, ruido del sensor y compresión del navegador
+    image = image.astype(np.float32) * rng.uniform(0.9, 1.1) + rng.uniform(-10, 10)
+    image = np.clip(image + rng.normal(0, args.noise, image.shape), 0, 255).astype(np.uint8)
+    quality = int(rng.integers(args.quality_min, args.quality_max + 1))
+    image = cv2.imdecode(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1], cv2.IMREAD_COLOR)
+
+    # Caja del rostro transformado más el temblor del detector
+    face_corners = np.float32([[left, top], [right, top], [right, bottom], [left, bottom]])
+    moved = cv2.perspectiveTransform(face_corners[None], transform)[0]
+    jitter = rng.uniform(-args.jitter, args.jitter, 4) * size
+    (moved_left, moved_top), (moved_right, moved_bottom) = moved.min(axis=0), moved.max(axis=0)
+    location = (
+        int(moved_top + jitter[0]), int(moved_right + jitter[1]),
+        int(moved_bottom + jitter[2]), int(moved_left + jitter[3])
+    )
+    return image, location
+
+
+def report(name: str, changes: np.ndarray, aligned: float) -> None:
+    print(f"{name:<26} min={changes.min():.4f}  p50={np.percentile(changes, 50):.4f}  "
+          f"p99={np.percentile(changes, 99):.4f}  max={changes.max():.4f}  "
+          f"sobre umbral={np.mean(changes >= FACIAL_CLIP_MIN_MOTION):6.1%}  alineados={aligned:6.1%}")
+
+
+def run_synthetic(photo: np.ndarray, box: tuple, args) -> None:
+    rng = np.random.default_rng(args.seed)
+    print(f"Umbral actual FACIAL_CLIP_MIN_MOTION={FACIAL_CLIP_MIN_MOTION}, {args.keyframes} keyframes, {args.clips} clips\n")
+
+    static_max = None
+    for deformation in [0.0, *args.deformations]:
+        changes, aligned = [], []
+        for _ in range(args.clips):
+            motion = face_motion([capture(photo, box, rng, args, deformation) for _ in range(args.keyframes)])
+            changes.append(motion["appearance_change"])
+            aligned.append(motion["aligned_pairs"] / motion["pairs"])
+        changes = np.array(changes)
+        if deformation == 0.0:
+            static_max = changes.max()
+            report("foto estática", changes, float(np.mean(aligned)))
+        else:
+            report(f"deformación {deformation:.0%}", changes, float(np.mean(aligned)))
+
+    print(f"\nMáximo con foto estática: {static_max:.4f} (el umbral debe quedar por encima con margen)")
+
+
+def run_videos(paths: list) -> None:
+    from app.utils.face_detector_pool import FaceDetectorPool
+
+    pool = FaceDetectorPool()
+    print()
+    for path in paths:
+        sampled = sample_keyframes(str(path), FACIAL_CLIP_KEYFRAMES, FACIAL_CLIP_MAX_SECONDS,
+                                   FACIAL_CLIP_MAX_ANALYZED_FRAMES)
+        faces = []
+        for keyframe in sampled["keyframes"]:
+            location = detect_face(keyframe["bgr"], pool)
+            if location is not None:
+                faces.append((keyframe["bgr"], location))
+        motion = face_motion(faces)
+        verdict = "estático" if motion["pairs"] == 0 or motion["appearance_change"] < FACIAL_CLIP_MIN_MOTION else "movimiento"
+        print(f"{path}: {len(faces)} rostros, cambio={motion['appearance_change']:.4f}, "
+              f"caja={motion['box_shift']:.4f} -> {verdict}")
+    pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibración del umbral de movimiento del login por clip")
+    parser.add_argument("--image", type=Path, default=None)
+    parser.add_argument("--box", type=str, default=None,
+                        help="Rostro en la foto como top,right,bottom,left (por defecto se detecta con MediaPipe)")
+    parser.add_argument("--clips", type=int, default=100)
+    parser.add_argument("--keyframes", type=int, default=FACIAL_CLIP_KEYFRAMES)
+    parser.add_argument("--deformations", type=float, nargs="+", default=[0.01, 0.02, 0.04])
+    parser.add_argument("--shift", type=float, default=0.06, help="Desplazamiento de la foto (fracción del rostro)")
+    parser.add_argument("--rotation", type=float, default=3.0, help="Rotación de la foto (grados)")
+    parser.add_argument("--scale", type=float, default=0.05, help="Cambio de escala de la foto")
+    parser.add_argument("--tilt", type=float, default=0.015, help="Inclinación de la foto (fracción de la imagen)")
+    parser.add_argument("--jitter", type=float, default=0.06, help="Temblor de la caja del detector (fracción del rostro)")
+    parser.add_argument("--noise", type=float, default=2.0, help="Ruido del sensor (desviación en niveles de gris)")
+    parser.add_argument("--quality-min", type=int, default=50)
+    parser.add_argument("--quality-max", type=int, default=85)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--videos", type=Path, nargs="*", default=[])
+    args = parser.parse_args()
+
+    image_path = args.image or default_image()
+    photo = cv2.imread(str(image_path))
+    if args.box:
+        box = tuple(int(value) for value in args.box.split(","))
+    else:
+        from app.utils.face_detector_pool import FaceDetectorPool
+
+        pool = FaceDetectorPool()
+        box = detect_face(photo, pool)
+        pool.close()
+        if box is None:
+            sys.exit(f"No se detectó un rostro en {image_path}; indíquelo con --box")
+    print(f"Imagen: {image_path} ({photo.shape[1]}x{photo.shape[0]}), rostro={box}")
+
+    run_synthetic(photo, box, args)
+    if args.videos:
+        run_videos(args.videos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+📊 BENCHMARK - BACKENDS DE ENCODING FACIAL (DLIB vs ONNX)
+
+Sobre una carpeta etiquetada (una subcarpeta por persona) calcula el
+encoding de cada imagen con cada backend y reporta throughput, latencia
+por encoding y FAR/FRR al umbral declarado por el backend, además del
+EER (punto donde FAR = FRR) para comparar backends a igual exigencia.
+
+La detección del rostro (MediaPipe) se hace una vez por imagen y no se
+incluye en la latencia: solo se mide el modelo de encoding.
+
+Uso:
+    python benchmarks/bench_embedding_backends.py --images ruta/etiquetada
+    python benchmarks/bench_embedding_backends.py --images ruta/etiquetada --onnx mobilefacenet.onnx --onnx-threshold 0.6
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import FACIAL_FACE_ROI_MARGIN, FACIAL_WORKING_MAX_SIDE  # noqa: E402
+from app.core.constants import FACE_ENCODING_MODEL_VERSION  # noqa: E402
+from app.services.facial_recognition_service import FacialRecognitionService  # noqa: E402
+from app.utils.embedding_backends import DlibEmbeddingBackend, OnnxEmbeddingBackend  # noqa: E402
+from app.utils.face_frame import FaceFrame  # noqa: E402
+
+
+def load_labelled(images_dir: Path) -> list:
+    """Pares (etiqueta, ruta): la etiqueta es el nombre de la subcarpeta"""
+    return sorted(
+        (path.parent.name, path)
+        for path in images_dir.rglob("*")
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png")
+    )
+
+
+def prepare_faces(service: FacialRecognitionService, labelled: list) -> list:
+    """Detecta el rostro una vez por imagen: (etiqueta, recorte RGB, ubicación)"""
+    faces = []
+    for label, path in labelled:
+        frame = FaceFrame.from_bytes(path.read_bytes(), FACIAL_WORKING_MAX_SIDE)
+        if frame is not None:
+            frame.quality_gate = False  # Se mide el modelo, no se filtra el corpus
+        if frame is None or service._locate_face(frame) is None:
+            print(f"[WARN] Sin rostro: {path}")
+            continue
+        roi_rgb, face_location = frame.face_roi(FACIAL_FACE_ROI_MARGIN)
+        faces.append((label, roi_rgb, face_location))
+    return faces
+
+
+def error_rates(genuine: np.ndarray, impostor: np.ndarray, threshold: float) -> tuple:
+    """(FAR, FRR): impostores aceptados y genuinos rechazados con distancia < umbral"""
+    far = float(np.mean(impostor < threshold)) if len(impostor) else 0.0
+    frr = float(np.mean(genuine >= threshold)) if len(genuine) else 0.0
+    return far, frr
+
+
+def equal_error_rate(genuine: np.ndarray, impostor: np.ndarray) -> tuple:
+    """(EER, umbral) buscando el umbral donde FAR y FRR se cruzan"""
+    if not len(genuine) or not len(impostor):
+        return 0.0, 0.0
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    # Con las distancias ordenadas FAR/FRR de todos los umbrales salen de una búsqueda binaria
+    far = np.searchsorted(np.sort(impostor), thresholds, side="left") / len(impostor)
+    frr = 1.0 - np.searchsorted(np.sort(genuine), thresholds, side="left") / len(genuine)
+    best = int(np.argmin(np.abs(far - frr)))
+    return float((far[best] + frr[best]) / 2), float(thresholds[best])
+
+
+def run(backend, faces: list, repeat: int) -> None:
+    backend.encode(faces[0][1], faces[0][2])  # Calentamiento
+
+    labels = []
+    embeddings = []
+    latencies = []
+    started_all = time.perf_counter()
+    for iteration in range(repeat):
+        for label, roi_rgb, face_location in faces:
+            started = time.perf_counter()
+            embedding = backend.encode(roi_rgb, face_location)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if iteration == 0 and embedding is not None:
+                labels.append(label)
+                embeddings.append(embedding)
+    elapsed = time.perf_counter() - started_all
+
+    latencies = np.array(latencies)
+    labels = np.array(labels)
+    embeddings = np.asarray(embeddings)
+
+    # Todas las parejas (i < j): mismas etiquetas = genuinas, distintas = impostoras
+    distances = np.stack([backend.distance(embeddings, embedding) for embedding in embeddings])
+    upper = np.triu_indices(len(embeddings), k=1)
+    same = (labels[:, None] == labels[None, :])[upper]
+    genuine, impostor = distances[upper][same], distances[upper][~same]
+
+    far, frr = error_rates(genuine, impostor, backend.threshold)
+    eer, eer_threshold = equal_error_rate(genuine, impostor)
+    print(f"\n=== {backend.name} ({backend.model_version}, {backend.dimension}-d, {backend.metric}) ===")
+    print(f"throughput={len(latencies) / elapsed:7.1f} encodings/s  p50={np.percentile(latencies, 50):7.2f}ms  "
+          f"p99={np.percentile(latencies, 99):7.2f}ms")
+    print(f"pares genuinos={len(genuine)}  impostores={len(impostor)}")
+    print(f"umbral={backend.threshold:.3f}  FAR={far:.3%}  FRR={frr:.3%}")
+    print(f"EER={eer:.3%} (umbral {eer_threshold:.3f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de encoding facial")
+    parser.add_argument("--images", type=Path, required=True, help="Carpeta con una subcarpeta por persona")
+    parser.add_argument("--onnx", nargs="*", default=[], help="Modelos ONNX de encoding a comparar con dlib")
+    parser.add_argument("--onnx-threshold", type=float, default=0.6)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    service = FacialRecognitionService()
+    faces = prepare_faces(service, load_labelled(args.images))
+    print(f"Corpus: {args.images} ({len(faces)} rostros, {len({label for label, _, _ in faces})} personas)")
+
+    backends = [DlibEmbeddingBackend(service.face_recognition, FACE_ENCODING_MODEL_VERSION)]
+    backends += [OnnxEmbeddingBackend(path, threshold=args.onnx_threshold) for path in args.onnx]
+    for backend in backends:
+        run(backend, faces, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+📊 BENCHMARK - POOL DE DETECTORES MEDIAPIPE
+
+Compara la latencia por llamada de crear un FaceDetection nuevo en cada
+detección (comportamiento anterior) contra reutilizar el detector del pool.
+
+Uso:
+    python benchmarks/bench_face_detector_pool.py
+    python benchmarks/bench_face_detector_pool.py --image ruta/a/rostro.jpg --iterations 200
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.face_detector_pool import FaceDetectorPool  # noqa: E402
+
+
+def default_image() -> Path:
+    facial_data = Path(__file__).resolve().parent.parent / "app" / "facial_data"
+    return next(facial_data.glob("*/face_*.jpg"))
+
+
+def measure(fn, iterations: int) -> np.ndarray:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies) * 1000
+
+
+def report(name: str, latencies: np.ndarray) -> None:
+    print(f"{name:<22} media={latencies.mean():7.2f}ms  p50={np.percentile(latencies, 50):7.2f}ms  "
+          f"p99={np.percentile(latencies, 99):7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pool de detectores MediaPipe")
+    parser.add_argument("--image", type=Path, default=None)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    image_path = args.image or default_image()
+    rgb = cv2.cvtColor(cv2.imread(str(image_path)), cv2.COLOR_BGR2RGB)
+    print(f"Imagen: {image_path} ({rgb.shape[1]}x{rgb.shape[0]})")
+
+    def per_call():
+        with mp.solutions.face_detection.FaceDetection(
+            model_selection=0,
+            min_detection_confidence=0.5
+        ) as face_detection:
+            face_detection.process(rgb)
+
+    pool = FaceDetectorPool(model_selection=0, min_detection_confidence=0.5)
+    pool.process(rgb)  # Calentamiento: el primer uso construye el grafo
+
+    per_call_latencies = measure(per_call, args.iterations)
+    pooled_latencies = measure(lambda: pool.process(rgb), args.iterations)
+    pool.close()
+
+    report("grafo nuevo por llamada", per_call_latencies)
+    report("detector del pool", pooled_latencies)
+    print(f"Ahorro medio por llamada: {per_call_latencies.mean() - pooled_latencies.mean():.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+📊 BENCHMARK - BACKENDS DE LIVENESS (TORCH vs ONNX RUNTIME)
+
+Corre cada backend de YOLO en un proceso aparte (para medir la memoria
+residente que agrega cada uno, torch incluido) sobre un corpus fijo de
+imágenes, y reporta latencia por frame, RSS y concordancia de la decisión
+de liveness y de las clases detectadas respecto al backend torch.
+
+Uso:
+    python benchmarks/bench_liveness_backends.py --onnx yolov8n.onnx yolov8n.int8.onnx
+    python benchmarks/bench_liveness_backends.py --images ruta/al/corpus --onnx yolov8n.int8.onnx --repeat 3
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def load_corpus(images_dir: Path) -> list:
+    return sorted(str(p) for p in images_dir.rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+
+
+def run_worker(backend_name: str, model_path: str, images: list, repeat: int) -> None:
+    """Se ejecuta en el subproceso: carga un backend, mide y emite JSON por stdout"""
+    import cv2
+    import psutil
+
+    # Importar el servicio carga sus dependencias (mediapipe, etc.) antes de medir
+    from app.services.facial_recognition_service import FacialRecognitionService
+    from app.utils.liveness_backends import OnnxYoloBackend, TorchYoloBackend
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    if backend_name == "torch":
+        from ultralytics import YOLO
+        backend = TorchYoloBackend(YOLO(model_path))
+    else:
+        backend = OnnxYoloBackend(model_path)
+
+    frames = [cv2.imread(path) for path in images]
+    backend.predict_batch(frames[:1])  # Calentamiento
+    rss_model = process.memory_info().rss - rss_before
+
+    latencies = []
+    results = []
+    for iteration in range(repeat):
+        for frame in frames:
+            started = time.perf_counter()
+            detections = backend.predict_batch([frame])[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+            if iteration == 0:
+                decision = FacialRecognitionService._evaluate_liveness(detections, frame.shape[1], frame.shape[0])
+                results.append({
+                    "is_alive": decision["is_alive"],
+                    "classes": sorted({int(class_id) for class_id in detections[:, 5]})
+                })
+
+    print(json.dumps({
+        "rss_model_mb": rss_model / 1024 ** 2,
+        "rss_total_mb": process.memory_info().rss / 1024 ** 2,
+        "latencies": latencies,
+        "results": results
+    }))
+
+
+def spawn(backend_name: str, model_path: str, images_dir: Path, repeat: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", backend_name, model_path,
+         "--images", str(images_dir), "--repeat", str(repeat)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    # El servicio imprime logs: el resultado es la última línea
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    default_corpus = Path(__file__).resolve().parent.parent / "app" / "facial_data"
+    parser = argparse.ArgumentParser(description="Benchmark de backends de liveness")
+    parser.add_argument("--images", type=Path, default=default_corpus)
+    parser.add_argument("--torch-weights", default="yolov8n.pt")
+    parser.add_argument("--onnx", nargs="+", default=["yolov8n.int8.onnx"], help="Modelos ONNX a comparar")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "MODEL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    images = load_corpus(args.images)
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], images, args.repeat)
+        return
+
+    print(f"Corpus: {args.images} ({len(images)} imágenes, {args.repeat} repeticiones)")
+    runs = [("torch", args.torch_weights)] + [("onnx", path) for path in args.onnx]
+    reference = None
+    for backend_name, model_path in runs:
+        result = spawn(backend_name, model_path, args.images, args.repeat)
+        latencies = np.array(result["latencies"])
+        line = (f"{backend_name:<5} {Path(model_path).name:<22} p50={np.percentile(latencies, 50):7.2f}ms  "
+                f"p99={np.percentile(latencies, 99):7.2f}ms  RSS modelo={result['rss_model_mb']:7.1f}MB  "
+                f"RSS total={result['rss_total_mb']:7.1f}MB")
+        if reference is None:
+            reference = result["results"]
+        else:
+            pairs = list(zip(reference, result["results"]))
+            decision_agreement = np.mean([a["is_alive"] == b["is_alive"] for a, b in pairs])
+            class_agreement = np.mean([a["classes"] == b["classes"] for a, b in pairs])
+            line += f"  decisión={decision_agreement:.1%}  clases={class_agreement:.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
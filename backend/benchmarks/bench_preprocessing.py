@@ -0,0 +1,97 @@
+"""
+📊 BENCHMARK - PREPROCESAMIENTO (RESOLUCIÓN DE TRABAJO + RECORTE DEL ROSTRO)
+
+Mide el tiempo de cada etapa (decodificación, detección, liveness y
+encoding) sobre un corpus fijo de imágenes, procesando el frame a
+resolución completa y con el preprocesamiento del servicio, y reporta el
+tiempo ahorrado por etapa.
+
+Uso:
+    python benchmarks/bench_preprocessing.py
+    python benchmarks/bench_preprocessing.py --images ruta/al/corpus --max-side 640 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+# YOLO se ejecuta directamente, sin el micro-batching, para medir solo la etapa
+os.environ.setdefault("FACIAL_LIVENESS_BATCHING", "False")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.facial_recognition_service import FacialRecognitionService  # noqa: E402
+from app.utils.face_frame import FaceFrame  # noqa: E402
+
+STAGES = ("decode", "detection", "liveness", "encoding")
+
+
+def load_corpus(images_dir: Path) -> list:
+    paths = sorted(p for p in images_dir.rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    return [(path, path.read_bytes()) for path in paths]
+
+
+def run_full_resolution(service: FacialRecognitionService, image_data: bytes) -> dict:
+    """Pipeline sin reducción ni recorte: todas las etapas ven el frame completo"""
+    frame = FaceFrame.from_bytes(image_data, max_side=0)
+    frame.quality_gate = False
+    service.detect_face_in_image(frame)
+    service._check_liveness(frame)
+    with frame.timed("encoding"):
+        service.face_recognition.face_encodings(frame.rgb, known_face_locations=[frame.face_location])
+    return frame.timings
+
+
+def run_preprocessed(service: FacialRecognitionService, image_data: bytes, max_side: int) -> dict:
+    """Pipeline del servicio: resolución de trabajo + recorte del rostro para el encoding"""
+    frame = FaceFrame.from_bytes(image_data, max_side=max_side)
+    frame.quality_gate = False
+    service.detect_face_in_image(frame)
+    service._check_liveness(frame)
+    service._compute_encoding(frame)
+    return frame.timings
+
+
+def main():
+    default_corpus = Path(__file__).resolve().parent.parent / "app" / "facial_data"
+    parser = argparse.ArgumentParser(description="Benchmark del preprocesamiento de frames")
+    parser.add_argument("--images", type=Path, default=default_corpus)
+    parser.add_argument("--max-side", type=int, default=640)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.images)
+    if not corpus:
+        print(f"No se encontraron imágenes en {args.images}")
+        return
+
+    service = FacialRecognitionService()
+    # Calentamiento: cargar modelos antes de medir
+    run_preprocessed(service, corpus[0][1], args.max_side)
+
+    totals = {"completo": defaultdict(list), "preprocesado": defaultdict(list)}
+    for _ in range(args.repeat):
+        for path, image_data in corpus:
+            try:
+                full = run_full_resolution(service, image_data)
+                pre = run_preprocessed(service, image_data, args.max_side)
+            except Exception as e:
+                print(f"[WARN] {path.name}: {e}")
+                continue
+            for stage in STAGES:
+                totals["completo"][stage].append(full.get(stage, 0.0))
+                totals["preprocesado"][stage].append(pre.get(stage, 0.0))
+
+    print(f"Corpus: {len(corpus)} imágenes x {args.repeat} repeticiones (max_side={args.max_side})")
+    print(f"{'etapa':<12}{'completo':>12}{'preprocesado':>14}{'ahorro':>12}")
+    for stage in STAGES:
+        full_ms = np.mean(totals["completo"][stage]) if totals["completo"][stage] else 0.0
+        pre_ms = np.mean(totals["preprocesado"][stage]) if totals["preprocesado"][stage] else 0.0
+        print(f"{stage:<12}{full_ms:>10.2f}ms{pre_ms:>12.2f}ms{full_ms - pre_ms:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+🔧 EXPORTAR YOLO A ONNX (FP32 / INT8)
+
+Exporta yolov8n a ONNX con lote dinámico y, opcionalmente, lo cuantiza a
+INT8 para el backend de liveness de onnxruntime (FACIAL_LIVENESS_BACKEND=onnx).
+
+Con --calibration se hace cuantización estática (QDQ) usando imágenes
+reales como calibración; sin ella se usa cuantización dinámica de pesos.
+
+Uso:
+    python scripts/export_yolo_onnx.py
+    python scripts/export_yolo_onnx.py --int8 --calibration app/facial_data --output yolov8n.int8.onnx
+"""
+
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.liveness_backends import OnnxYoloBackend  # noqa: E402
+
+
+def export_fp32(weights: str, imgsz: int) -> Path:
+    """Exporta con ultralytics (requiere torch solo en esta máquina, no en la API)"""
+    from ultralytics import YOLO
+    exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    return Path(exported)
+
+
+class ImageCalibrationReader:
+    """Entrega imágenes preprocesadas igual que el backend ONNX para calibrar INT8"""
+
+    def __init__(self, images_dir: Path, fp32_path: Path, imgsz: int, limit: int):
+        backend = OnnxYoloBackend(str(fp32_path), input_size=imgsz)
+        paths = sorted(p for p in images_dir.rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))[:limit]
+        self._blobs = []
+        for path in paths:
+            image = cv2.imread(str(path))
+            if image is not None:
+                blob, _, _ = backend._preprocess(image)
+                self._blobs.append(blob[None])
+        self._input_name = backend.input_name
+        self._iterator = iter(self._blobs)
+        print(f"Imágenes de calibración: {len(self._blobs)}")
+
+    def get_next(self):
+        blob = next(self._iterator, None)
+        return None if blob is None else {self._input_name: blob}
+
+    def rewind(self):
+        self._iterator = iter(self._blobs)
+
+
+def quantize_int8(fp32_path: Path, output: Path, calibration: Path, imgsz: int, limit: int) -> None:
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared = fp32_path.with_suffix(".prep.onnx")
+    quant_pre_process(str(fp32_path), str(prepared))
+
+    if calibration:
+        reader = ImageCalibrationReader(calibration, fp32_path, imgsz, limit)
+        quantize_static(
+            str(prepared),
+            str(output),
+            reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+    else:
+        quantize_dynamic(str(prepared), str(output), weight_type=QuantType.QUInt8)
+    prepared.unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta YOLO a ONNX para el backend de liveness")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--int8", action="store_true", help="Cuantizar a INT8")
+    parser.add_argument("--calibration", type=Path, default=None, help="Carpeta con imágenes para calibración estática")
+    parser.add_argument("--calibration-limit", type=int, default=200)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    fp32_path = export_fp32(args.weights, args.imgsz)
+    print(f"ONNX FP32: {fp32_path}")
+
+    if not args.int8:
+        if args.output and args.output != fp32_path:
+            shutil.copyfile(fp32_path, args.output)
+            print(f"Copiado a: {args.output}")
+        return
+
+    output = args.output or fp32_path.with_name(fp32_path.stem + ".int8.onnx")
+    quantize_int8(fp32_path, output, args.calibration, args.imgsz, args.calibration_limit)
+    print(f"ONNX INT8: {output}")
+    print(f"Usar con: FACIAL_LIVENESS_BACKEND=onnx FACIAL_YOLO_ONNX_PATH={output}")
+
+
+if __name__ == "__main__":
+    main()
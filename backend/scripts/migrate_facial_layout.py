@@ -0,0 +1,109 @@
+"""
+🔧 MIGRAR facial_data AL LAYOUT SHARDED
+
+Mueve los usuarios de facial_data/<user_id>/ a facial_data/ab/cd/<user_id>/
+por lotes, con una pausa entre lotes para no competir con la API. Se puede
+ejecutar en segundo plano con la API en marcha: mientras dure la migración
+el servicio lee ambos layouts (FACIAL_DATA_LEGACY_READS=True), y cada
+usuario se mueve con un rename atómico (en un bucket, con
+FACIAL_STORAGE_BACKEND=gcs, los objetos se copian y luego se borran).
+Es reanudable: volver a ejecutarlo continúa con los usuarios que quedaron
+en el layout legacy.
+
+Una captura que la API dirigió al directorio legacy justo antes del rename
+lo vuelve a crear al escribirse; pasados --settle segundos de migrar cada
+usuario se revisa y se fusiona lo que haya reaparecido.
+
+Al terminar (sin usuarios legacy) se puede desactivar
+FACIAL_DATA_LEGACY_READS para ahorrar el stat extra por usuario.
+
+Uso:
+    python scripts/migrate_facial_layout.py --dry-run
+    nohup python scripts/migrate_facial_layout.py --batch-size 200 --pause 1 &
+"""
+
+import argparse
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import FACIAL_STORAGE_BACKEND, FACIAL_GCS_BUCKET, FACIAL_GCS_PREFIX  # noqa: E402
+from app.utils.facial_data_layout import FacialDataLayout  # noqa: E402
+from app.utils.storage_backends import create_storage  # noqa: E402
+
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / "app" / "facial_data"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra facial_data al layout sharded")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help="Directorio facial_data")
+    parser.add_argument("--batch-size", type=int, default=100, help="Usuarios por lote")
+    parser.add_argument("--pause", type=float, default=0.5, help="Segundos de pausa entre lotes")
+    parser.add_argument("--limit", type=int, default=0, help="Máximo de usuarios a migrar (0 = todos)")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Segundos a esperar capturas en vuelo antes de revisar cada usuario migrado")
+    parser.add_argument("--dry-run", action="store_true", help="Solo muestra qué se movería")
+    args = parser.parse_args()
+
+    storage = create_storage(FACIAL_STORAGE_BACKEND, Path(args.data_dir), FACIAL_GCS_BUCKET, FACIAL_GCS_PREFIX)
+    layout = FacialDataLayout(storage)
+    pending = layout.legacy_user_dirs()
+    if args.limit:
+        pending = pending[:args.limit]
+    print(f"[LOG] Usuarios en layout legacy: {len(pending)}")
+
+    migrated = 0
+    failed = 0
+    leftovers = 0
+    recent = deque()  # (momento de la migración, user_id)
+    started = time.perf_counter()
+
+    def merge_leftovers(wait_all: bool = False) -> None:
+        nonlocal leftovers
+        while recent and (wait_all or time.monotonic() - recent[0][0] >= args.settle):
+            migrated_at, user_id = recent.popleft()
+            delay = args.settle - (time.monotonic() - migrated_at)
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                if layout.merge_leftovers(user_id):
+                    leftovers += 1
+                    print(f"[LOG] Fusionadas capturas en vuelo de {user_id}")
+            except OSError as e:
+                print(f"[WARN] No se pudieron fusionar las capturas en vuelo de {user_id}: {e}")
+    for batch_start in range(0, len(pending), args.batch_size):
+        for legacy_dir in pending[batch_start:batch_start + args.batch_size]:
+            user_id = legacy_dir.name
+            if args.dry_run:
+                print(f"  {legacy_dir} -> {layout.sharded_dir(user_id)}")
+                continue
+            try:
+                if layout.migrate_user(user_id):
+                    migrated += 1
+                    recent.append((time.monotonic(), user_id))
+            except OSError as e:
+                failed += 1
+                print(f"[WARN] No se pudo migrar {user_id}: {e}")
+
+        done = min(batch_start + args.batch_size, len(pending))
+        print(f"[LOG] {done}/{len(pending)} revisados, {migrated} migrados, {failed} con error "
+              f"({time.perf_counter() - started:.1f}s)")
+        if args.pause and done < len(pending):
+            time.sleep(args.pause)
+        merge_leftovers()
+
+    merge_leftovers(wait_all=True)
+
+    remaining = len(layout.legacy_user_dirs())
+    print(f"[LOG] Migración terminada: {migrated} migrados ({leftovers} con capturas en vuelo fusionadas), "
+          f"{failed} con error, {remaining} aún en layout legacy")
+    if remaining == 0 and not args.dry_run:
+        print("[LOG] Ya se puede usar FACIAL_DATA_LEGACY_READS=False")
+
+
+if __name__ == "__main__":
+    main()
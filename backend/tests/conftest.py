@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Las pruebas se ejecutan desde backend/ (python -m pytest tests)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,84 @@
+"""
+Pruebas del límite de tamaño de las subidas (app/core/image_upload.py)
+
+El límite debe cumplirse mientras se recibe el cuerpo, también en envíos
+chunked (sin Content-Length) y en archivos de un formulario multipart.
+"""
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import FACIAL_MAX_UPLOAD_BYTES
+from app.core import image_upload
+from app.core.image_upload import read_image_upload
+
+
+BOUNDARY = "limite-de-prueba"
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(image_bytes: bytes = Depends(read_image_upload)):
+        return {"size": len(image_bytes)}
+
+    return TestClient(app)
+
+
+def multipart_body(content: bytes, field: str = "image") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="rostro.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def chunked(body: bytes, size: int = 64 * 1024):
+    """Generador: el cliente lo envía chunked, sin Content-Length"""
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def post_multipart(client: TestClient, body: bytes):
+    return client.post(
+        "/upload",
+        content=chunked(body),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+
+
+def test_multipart_file_within_limit(client):
+    response = post_multipart(client, multipart_body(b"\xff" * 1000))
+    assert response.status_code == 200
+    assert response.json() == {"size": 1000}
+
+
+def test_oversized_multipart_file_is_rejected_while_streaming(client, monkeypatch):
+    received = []
+    original = image_upload._limited_stream
+
+    async def counting_stream(request, max_bytes, limit):
+        async for chunk in original(request, max_bytes, limit):
+            received.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(image_upload, "_limited_stream", counting_stream)
+    body = multipart_body(b"\xff" * (FACIAL_MAX_UPLOAD_BYTES * 4))
+
+    response = post_multipart(client, body)
+
+    assert response.status_code == 413
+    # Se cortó al superar el límite, sin leer (ni volcar a disco) el resto
+    assert sum(received) <= FACIAL_MAX_UPLOAD_BYTES + image_upload.MULTIPART_OVERHEAD_BYTES
+
+
+def test_oversized_chunked_raw_body_is_rejected(client):
+    response = client.post(
+        "/upload",
+        content=chunked(b"\xff" * (FACIAL_MAX_UPLOAD_BYTES + 1)),
+        headers={"Content-Type": "image/jpeg"}
+    )
+    assert response.status_code == 413
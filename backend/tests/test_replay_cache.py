@@ -0,0 +1,120 @@
+"""
+Pruebas del caché de reenvíos del login (app/utils/replay_cache.py)
+
+Una nueva captura real del mismo rostro (ruido del sensor, unos píxeles de
+desplazamiento y otra compresión JPEG) no debe rechazarse como reenvío;
+los bytes idénticos sí.
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils import replay_cache as replay_module
+from app.utils.replay_cache import REPLAY_FAILED, REPLAY_PENDING, REPLAY_VERIFIED, FrameReplayCache
+
+
+FACIAL_DATA = Path(__file__).resolve().parent.parent / "app" / "facial_data"
+# Rostro de las capturas registradas (top, right, bottom, left), con margen
+FACE_LOCATION = (200, 880, 660, 410)
+
+
+def enrolled_captures() -> list:
+    return sorted(FACIAL_DATA.glob("*/face_*.jpg"))
+
+
+def recapture(bgr: np.ndarray, rng: np.random.Generator) -> bytes:
+    """Otra captura del mismo rostro: ruido σ=3, desplazamiento de ±3 px y JPEG"""
+    dx, dy = rng.integers(-3, 4, size=2)
+    shifted = cv2.warpAffine(bgr, np.float32([[1, 0, dx], [0, 1, dy]]), (bgr.shape[1], bgr.shape[0]),
+                             borderMode=cv2.BORDER_REPLICATE)
+    noisy = np.clip(shifted + rng.normal(0, 3, bgr.shape), 0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", noisy, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def login(cache: FrameReplayCache, user_id: str, image_data: bytes):
+    """Simula un login exitoso; devuelve el reenvío detectado o None"""
+    replay, entry = cache.begin(user_id, cache.digest(image_data))
+    if replay is not None:
+        return replay
+    bgr = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    replay = cache.match_face(entry, cache.face_hash(bgr, FACE_LOCATION))
+    cache.finish(entry, replay is None)
+    return replay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(replay_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("path", enrolled_captures(), ids=lambda path: path.parent.name[:8])
+def test_genuine_recapture_passes_by_default(path):
+    cache = FrameReplayCache()
+    original = path.read_bytes()
+    bgr = cv2.imdecode(np.frombuffer(original, np.uint8), cv2.IMREAD_COLOR)
+    rng = np.random.default_rng(0)
+
+    assert login(cache, "user", original) is None
+    for _ in range(25):
+        assert login(cache, "user", recapture(bgr, rng)) is None
+
+
+def test_identical_bytes_are_rejected():
+    cache = FrameReplayCache()
+    original = enrolled_captures()[0].read_bytes()
+
+    assert login(cache, "user", original) is None
+    replay = login(cache, "user", original)
+    assert replay["state"] == REPLAY_VERIFIED and replay["exact"]
+    # Otro usuario no comparte los frames recordados
+    assert login(cache, "other", original) is None
+
+
+def test_concurrent_duplicate_is_rejected_before_inference():
+    cache = FrameReplayCache()
+    digest = cache.digest(b"frame")
+
+    replay, entry = cache.begin("user", digest)
+    assert replay is None and entry is not None
+    replay, duplicate = cache.begin("user", digest)
+    assert replay["state"] == REPLAY_PENDING and duplicate is None
+
+
+def test_failed_frame_is_remembered_only_briefly(clock):
+    cache = FrameReplayCache(failed_ttl_seconds=5)
+    digest = cache.digest(b"frame")
+
+    _, entry = cache.begin("user", digest)
+    cache.finish(entry, False, "sin rostro")
+    replay, _ = cache.begin("user", digest)
+    assert replay["state"] == REPLAY_FAILED and replay["detail"] == "sin rostro"
+
+    clock[0] += 5
+    replay, entry = cache.begin("user", digest)
+    assert replay is None and entry is not None
+
+
+def test_face_hash_check_is_opt_in_and_expires(clock):
+    path = enrolled_captures()[0]
+    bgr = cv2.imread(str(path))
+    same_face = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+
+    disabled = FrameReplayCache()
+    assert login(disabled, "user", path.read_bytes()) is None
+    assert login(disabled, "user", same_face) is None
+
+    enabled = FrameReplayCache(face_ttl_seconds=5)
+    assert login(enabled, "user", path.read_bytes()) is None
+    clock[0] += 1
+    replay = login(enabled, "user", same_face)
+    assert replay is not None and not replay["exact"]
+
+    # Pasada la ventana, la misma cara vuelve a verificarse
+    clock[0] += 5
+    again = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+    assert login(enabled, "user", again) is None
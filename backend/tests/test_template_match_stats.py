@@ -0,0 +1,75 @@
+"""
+Pruebas del historial de coincidencias por template (app/utils/template_match_stats.py)
+
+Dos workers que persisten a la vez no deben perder los conteos del otro.
+"""
+
+import json
+from pathlib import Path
+
+from app.utils.storage_backends import MemoryStorageBackend
+from app.utils.template_match_stats import TemplateMatchStats
+
+
+ROOT = Path("/facial_data")
+USER_DIR = ROOT / "user"
+
+
+class InterleavedStorage:
+    """Ejecuta `before_write` antes de la primera escritura condicional (otro worker en el medio)"""
+
+    def __init__(self, backend, before_write):
+        self.backend = backend
+        self.before_write = before_write
+
+    def __getattr__(self, attribute):
+        return getattr(self.backend, attribute)
+
+    def write_if_version(self, path, data, expected_version):
+        before_write, self.before_write = self.before_write, None
+        if before_write is not None:
+            before_write()
+        return self.backend.write_if_version(path, data, expected_version)
+
+
+def persisted(backend) -> dict:
+    return json.loads(backend.read(USER_DIR / TemplateMatchStats.FILENAME))
+
+
+def test_concurrent_flushes_keep_both_counts():
+    backend = MemoryStorageBackend(ROOT)
+    other = TemplateMatchStats(backend)
+    for _ in range(3):
+        other.record_match(USER_DIR / "face_a.jpg")
+
+    worker = TemplateMatchStats(InterleavedStorage(backend, other.flush))
+    for _ in range(2):
+        worker.record_match(USER_DIR / "face_a.jpg")
+    worker.record_match(USER_DIR / "face_b.jpg")
+
+    assert worker.flush() == 1
+    stats = persisted(backend)
+    assert stats["face_a.jpg"]["matches"] == 5
+    assert stats["face_b.jpg"]["matches"] == 1
+
+
+def test_failed_flush_keeps_pending_counts():
+    backend = MemoryStorageBackend(ROOT)
+    stats = TemplateMatchStats(backend)
+    stats.record_match(USER_DIR / "face_a.jpg")
+
+    # Otro worker escribe en cada intento: se agotan los reintentos
+    stats.MAX_WRITE_ATTEMPTS = 2
+    stats.storage = InterleavedStorage(backend, None)
+
+    def conflicting_write(path, data, expected_version):
+        backend.write(path, json.dumps({}).encode("utf-8"))
+        return None
+
+    stats.storage.write_if_version = conflicting_write
+    assert stats.flush() == 0
+
+    # Los conteos siguen pendientes y se persisten en el próximo flush
+    stats.storage = backend
+    assert stats.flush() == 1
+    assert persisted(backend)["face_a.jpg"]["matches"] == 1